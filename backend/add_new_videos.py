@@ -1,53 +1,40 @@
 """
 Script para añadir los videos nuevos a la base de datos
-"""
-from database import SessionLocal
-from models import Tema, Video
-import uuid
-
-def add_videos():
-    session = SessionLocal()
-
-    try:
-        # 1. Crear tema "Introducción a Agentes de IA" si no existe
-        tema_intro = session.query(Tema).filter_by(slug='introduccion-agentes').first()
-        if not tema_intro:
-            tema_intro = Tema(
-                id=str(uuid.uuid4()),
-                slug='introduccion-agentes',
-                titulo='Introducción a Agentes de IA',
-                descripcion='Aprende los conceptos básicos de agentes de IA y crea tu primer agente en Python',
-                orden=0
-            )
-            session.add(tema_intro)
-            print("Tema 'Introduccion a Agentes de IA' creado")
-
-        # 2. Obtener tema "MCP y Herramientas"
-        tema_mcp = session.query(Tema).filter_by(slug='mcp-herramientas').first()
-        if not tema_mcp:
-            print("ERROR: Tema 'mcp-herramientas' no encontrado")
-            return
 
+Usa el importador (importar.py): crea el tema de introducción si no existe,
+actualiza los textos de los temas existentes y añade o actualiza los videos,
+sin duplicar nada si se ejecuta otra vez.
+"""
+from importar import importar_registros, mostrar
+
+# Cambios en temas (solo se actualizan los campos indicados)
+TEMAS = [
+    {
+        'slug': 'introduccion-agentes',
+        'titulo': 'Introducción a Agentes de IA',
+        'descripcion': 'Aprende los conceptos básicos de agentes de IA y crea tu primer agente en Python',
+        'orden': 0
+    },
+    {
         # Renombrar tema MCP a algo más general
-        tema_mcp.titulo = 'Herramientas y Protocolos'
-        tema_mcp.descripcion = 'Tools, RAG y MCP: cómo conectar tu agente con el mundo real'
-
-        # 3. Obtener tema "Claude Code"
-        tema_claude = session.query(Tema).filter_by(slug='claude-code').first()
-        if not tema_claude:
-            print("ERROR: Tema 'claude-code' no encontrado")
-            return
-
-        tema_claude.descripcion = 'Aprende a usar Claude Code, el asistente de IA para programación'
-
-        # Videos a añadir
-        videos = [
-            # Video 1: Agente IA básico
-            {
-                'tema': tema_intro,
-                'youtube_id': 'BOZFN1enB6E',
-                'titulo': 'Crea tu Primer Agente de IA en Python (Gratis con OpenRouter)',
-                'descripcion': """En este video aprenderás a crear un agente de IA simple en Python usando OpenRouter y modelos LLM gratuitos.
+        'slug': 'mcp-herramientas',
+        'titulo': 'Herramientas y Protocolos',
+        'descripcion': 'Tools, RAG y MCP: cómo conectar tu agente con el mundo real'
+    },
+    {
+        'slug': 'claude-code',
+        'descripcion': 'Aprende a usar Claude Code, el asistente de IA para programación'
+    },
+]
+
+# Videos a añadir
+VIDEOS = [
+    # Video 1: Agente IA básico
+    {
+        'tema': 'introduccion-agentes',
+        'youtube_id': 'BOZFN1enB6E',
+        'titulo': 'Crea tu Primer Agente de IA en Python (Gratis con OpenRouter)',
+        'descripcion': """En este video aprenderás a crear un agente de IA simple en Python usando OpenRouter y modelos LLM gratuitos.
 
 ✅ Usar una API Key paso a paso
 ✅ Qué es un LLM y cómo llamarlo desde Python
@@ -59,15 +46,15 @@ Trabajamos con un script sencillo en Python para enviar mensajes a un modelo de
 Código del video (GitHub): https://github.com/AmOrFeU86/simple-ai-agent
 
 Tecnologías usadas: Python, Requests, OpenRouter, Modelos LLM gratuitos (como Mistral)""",
-                'tags': 'Clave API, OpenRouter, Script Python, IA gratuita, Modelo gratis, Tutorial IA, Python IA, Crear API, Inteligencia Artificial',
-                'orden': 1
-            },
-            # Video 2: Tools
-            {
-                'tema': tema_mcp,
-                'youtube_id': '',  # No tenemos el youtube_id en el metadata
-                'titulo': 'Cómo crear un agente de IA que trabaje por ti (Python)',
-                'descripcion': """Aprende a construir un agente de IA que puede interactuar con el mundo real usando herramientas (tools). Los LLMs por defecto no tienen acceso a internet ni pueden realizar acciones, pero con tools pueden hacer de todo.
+        'tags': 'Clave API, OpenRouter, Script Python, IA gratuita, Modelo gratis, Tutorial IA, Python IA, Crear API, Inteligencia Artificial',
+        'orden': 1
+    },
+    # Video 2: Tools
+    {
+        'tema': 'mcp-herramientas',
+        'youtube_id': '',  # No tenemos el youtube_id en el metadata
+        'titulo': 'Cómo crear un agente de IA que trabaje por ti (Python)',
+        'descripcion': """Aprende a construir un agente de IA que puede interactuar con el mundo real usando herramientas (tools). Los LLMs por defecto no tienen acceso a internet ni pueden realizar acciones, pero con tools pueden hacer de todo.
 
 CONTENIDO DEL VIDEO
 0:00 Demo: Agente enviando noticias a Telegram
@@ -100,15 +87,15 @@ Herramientas implementadas:
 • Generación de imágenes (Replicate + Flux)
 • Ejecución de Python
 • Gestión de archivos""",
-                'tags': 'Agente IA Python, Tools LLM, Telegram Bot IA, Gmail automatización, Yahoo Finance API, Text to Speech Python, Generación imágenes IA, Replicate Flux, Web scrapper Python, Tavily API, Edge TTS, Automatización Python, IA en español, Tutorial agentes IA',
-                'orden': 1
-            },
-            # Video 3: RAG
-            {
-                'tema': tema_mcp,
-                'youtube_id': '',
-                'titulo': 'Cómo crear un RAG desde cero (Python + ChromaDB)',
-                'descripcion': """En este video construimos un sistema RAG (Retrieval Augmented Generation) desde cero en Python usando ChromaDB.
+        'tags': 'Agente IA Python, Tools LLM, Telegram Bot IA, Gmail automatización, Yahoo Finance API, Text to Speech Python, Generación imágenes IA, Replicate Flux, Web scrapper Python, Tavily API, Edge TTS, Automatización Python, IA en español, Tutorial agentes IA',
+        'orden': 1
+    },
+    # Video 3: RAG
+    {
+        'tema': 'mcp-herramientas',
+        'youtube_id': '',
+        'titulo': 'Cómo crear un RAG desde cero (Python + ChromaDB)',
+        'descripcion': """En este video construimos un sistema RAG (Retrieval Augmented Generation) desde cero en Python usando ChromaDB.
 
 Verás cómo conectar un LLM con datos privados (documentos, archivos o transcripciones de YouTube) para responder preguntas con contexto real, no solo con conocimiento general.
 
@@ -138,15 +125,15 @@ IMPLEMENTACIÓN
 - Integración con OpenRouter API
 
 Caso de uso: chat que responde preguntas sobre tus propios videos de YouTube usando transcripciones.""",
-                'tags': 'rag python, retrieval augmented generation, rag desde cero, chroma db, chromadb tutorial, vector database python, embeddings python, llm datos privados, rag español, ia en español, busqueda semantica, agentes ia, llm contexto, tutorial rag python',
-                'orden': 2
-            },
-            # Video 4: MCP práctico
-            {
-                'tema': tema_mcp,
-                'youtube_id': '',
-                'titulo': 'MCP en la práctica: cliente y servidor conectados a la Base de Datos Nacional de Subvenciones',
-                'descripcion': """En este video muestro un ejemplo práctico de cómo crear e implementar un servidor MCP (Model Context Protocol) en Python conectado a una API pública real.
+        'tags': 'rag python, retrieval augmented generation, rag desde cero, chroma db, chromadb tutorial, vector database python, embeddings python, llm datos privados, rag español, ia en español, busqueda semantica, agentes ia, llm contexto, tutorial rag python',
+        'orden': 2
+    },
+    # Video 4: MCP práctico
+    {
+        'tema': 'mcp-herramientas',
+        'youtube_id': '',
+        'titulo': 'MCP en la práctica: cliente y servidor conectados a la Base de Datos Nacional de Subvenciones',
+        'descripcion': """En este video muestro un ejemplo práctico de cómo crear e implementar un servidor MCP (Model Context Protocol) en Python conectado a una API pública real.
 
 La API utilizada es el Sistema Nacional de Publicidad de Subvenciones y Ayudas Públicas (BDNS) de España, una API gratuita que no requiere autenticación ni API key y que cuenta con documentación Swagger y especificación OpenAPI.
 
@@ -187,15 +174,15 @@ CONTENIDO DEL VIDEO
 9:21 Comando para añadir el servidor MCP
 9:48 Uso del MCP desde Cloud Code
 10:42 Conclusiones""",
-                'tags': 'mcp, model context protocol, mcp python, api publica españa, subvenciones españa, ayudas publicas, agentes ia, ia tools, cloud code, openapi, swagger, pydantic, mcp server, mcp client, automatizacion ia, ia con apis',
-                'orden': 3
-            },
-            # Video 5: Claude Code
-            {
-                'tema': tema_claude,
-                'youtube_id': '',
-                'titulo': 'Claude Code explicado | Instalación, comandos y demo práctica en Python',
-                'descripcion': """En este video explico qué es Claude Code, el asistente de IA de Anthropic orientado a programación, y por qué creo que es una opción muy interesante frente a otros asistentes como GitHub Copilot, Cursor o Windsurf.
+        'tags': 'mcp, model context protocol, mcp python, api publica españa, subvenciones españa, ayudas publicas, agentes ia, ia tools, cloud code, openapi, swagger, pydantic, mcp server, mcp client, automatizacion ia, ia con apis',
+        'orden': 3
+    },
+    # Video 5: Claude Code
+    {
+        'tema': 'claude-code',
+        'youtube_id': '',
+        'titulo': 'Claude Code explicado | Instalación, comandos y demo práctica en Python',
+        'descripcion': """En este video explico qué es Claude Code, el asistente de IA de Anthropic orientado a programación, y por qué creo que es una opción muy interesante frente a otros asistentes como GitHub Copilot, Cursor o Windsurf.
 
 Veremos qué es Claude Code, cómo se diferencia de otros agentes de IA, su precio, cómo instalarlo en Windows de forma nativa y cómo se utiliza tanto desde la línea de comandos como desde editores como Visual Studio Code o IntelliJ.
 
@@ -232,15 +219,15 @@ CONCEPTOS CLAVE
 - Modelos Opus, Sonnet y Haiku
 - Automatización desde línea de comandos
 - CLI en Python""",
-                'tags': 'claude code, anthropic, agentes ia, ia programación, asistente ia, claude opus, claude sonnet, cli ia, python cli, typer python, herramientas ia, ia para developers, claude code español',
-                'orden': 1
-            },
-            # Video 6: Slash commands
-            {
-                'tema': tema_claude,
-                'youtube_id': '',
-                'titulo': 'Todos los comandos de Claude Code explicados | Guía práctica',
-                'descripcion': """En este video hago un repaso completo y práctico a todos los "/commands" (comandos de barra) disponibles en Claude Code, explicando para qué sirve cada uno y en qué situaciones es más útil.
+        'tags': 'claude code, anthropic, agentes ia, ia programación, asistente ia, claude opus, claude sonnet, cli ia, python cli, typer python, herramientas ia, ia para developers, claude code español',
+        'orden': 1
+    },
+    # Video 6: Slash commands
+    {
+        'tema': 'claude-code',
+        'youtube_id': '',
+        'titulo': 'Todos los comandos de Claude Code explicados | Guía práctica',
+        'descripcion': """En este video hago un repaso completo y práctico a todos los "/commands" (comandos de barra) disponibles en Claude Code, explicando para qué sirve cada uno y en qué situaciones es más útil.
 
 Comenzamos viendo los comandos fundamentales como init, adddir, memory, context, clear y compact, y cómo influyen directamente en la gestión del contexto y el consumo de tokens.
 
@@ -288,42 +275,16 @@ CONCEPTOS CLAVE
 - Modelos Opus, Sonnet y Haiku
 - Configuración avanzada
 - Automatización desde terminal""",
-                'tags': 'claude code, cloud code, slash commands, comandos claude, agentes ia, ia programación, asistente ia, claude opus, claude sonnet, cli ia, herramientas ia, ia para developers, claude code español',
-                'orden': 2
-            }
-        ]
-
-        # Añadir videos
-        for video_data in videos:
-            # Verificar si el video ya existe (por titulo)
-            existing = session.query(Video).filter_by(
-                tema_id=video_data['tema'].id,
-                titulo=video_data['titulo']
-            ).first()
-
-            if not existing:
-                video = Video(
-                    tema_id=video_data['tema'].id,
-                    youtube_id=video_data['youtube_id'],
-                    titulo=video_data['titulo'],
-                    descripcion=video_data['descripcion'],
-                    tags=video_data['tags'],
-                    orden=video_data['orden']
-                )
-                session.add(video)
-                print(f"Video añadido: {video_data['titulo'][:50]}...")
-            else:
-                print(f"Video ya existe: {video_data['titulo'][:50]}...")
-
-        session.commit()
-        print("\nOK - Todos los videos han sido procesados")
-
-    except Exception as e:
-        session.rollback()
-        print(f"Error: {e}")
-        raise
-    finally:
-        session.close()
+        'tags': 'claude code, cloud code, slash commands, comandos claude, agentes ia, ia programación, asistente ia, claude opus, claude sonnet, cli ia, herramientas ia, ia para developers, claude code español',
+        'orden': 2
+    }
+]
+
+
+def add_videos():
+    registros = [(f"tema {t['slug']}", {'entidad': 'tema', **t}) for t in TEMAS]
+    registros += [(f"video {v['titulo'][:50]}", {'entidad': 'video', **v}) for v in VIDEOS]
+    mostrar(importar_registros(registros))
 
 if __name__ == "__main__":
     add_videos()
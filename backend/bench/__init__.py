@@ -0,0 +1 @@
+"""Benchmarks de carga del backend (ver bench/run.py)."""
@@ -0,0 +1,148 @@
+"""
+Sustituto local de OpenRouter para benchmarks (sin red ni API key).
+
+Imita /api/v1/chat/completions con latencia configurable, streaming SSE,
+tool calls y, opcionalmente, respuestas con JSON mal formado:
+
+    python -m bench.fake_openrouter --port 9100 --latency-ms 300 --tool-rate 0.5
+
+y arranca el backend con OPENROUTER_URL=http://127.0.0.1:9100/api/v1/chat/completions
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CONFIG = {
+    "latency_ms": 200.0,     # latencia hasta la respuesta (o hasta el primer token)
+    "jitter_ms": 50.0,       # variación aleatoria de la latencia
+    "token_ms": 10.0,        # pausa entre chunks en streaming
+    "tool_rate": 0.5,        # probabilidad de pedir una tool en la primera ronda
+    "malformed_rate": 0.0,   # probabilidad de devolver JSON roto en las correcciones
+    "error_rate": 0.0,       # probabilidad de responder 503
+}
+
+RESPUESTA = (
+    "Los agentes de IA combinan un modelo de lenguaje con memoria y herramientas. "
+    "Puedes repasarlo en [el tema del curso](http://localhost:3000/temas/memoria-agentes)."
+)
+
+app = FastAPI(title="OpenRouter falso")
+
+
+def _latencia() -> float:
+    return max(0.0, CONFIG["latency_ms"] + random.uniform(-1, 1) * CONFIG["jitter_ms"]) / 1000
+
+
+# Prefijos (tools + primer mensaje) ya vistos, para imitar la caché de prompt
+_PREFIJOS: set[str] = set()
+
+
+def _usage(body: dict, texto: str) -> dict:
+    messages = body.get("messages", [])
+    prefijo = json.dumps(body.get("tools")) + json.dumps(messages[:1])
+    prompt = (len(prefijo) + sum(len(str(m.get("content") or "")) for m in messages[1:])) // 4
+    cacheados = len(prefijo) // 4 if prefijo in _PREFIJOS else 0
+    _PREFIJOS.add(prefijo)
+    completion = len(texto) // 4
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_tokens_details": {"cached_tokens": cacheados},
+    }
+
+
+def _tool_call() -> dict:
+    if random.random() < 0.5:
+        nombre, args = "buscar_videos", {"keywords": random.choice([["memoria"], ["rag", "vectores"], ["mcp"]])}
+    else:
+        nombre, args = "redirigir_temas_internos", {"slug_tema": random.choice(["memoria", "mcp", "claude-code"])}
+    return {
+        "id": f"call_{random.getrandbits(32):08x}",
+        "type": "function",
+        "function": {"name": nombre, "arguments": json.dumps(args)},
+    }
+
+
+def _correccion(prompt: str) -> str:
+    if random.random() < CONFIG["malformed_rate"]:
+        return '{"puntuacion": 7'
+    nota = lambda: {"puntuacion": random.randint(30, 100), "feedback": {"0": "Respuesta razonable."}}
+    envios = re.findall(r"=== ENVÍO (\d+) ===", prompt)
+    if envios:
+        return json.dumps({i: nota() for i in envios})
+    return "```json\n" + json.dumps(nota()) + "\n```"
+
+
+def _mensaje(body: dict) -> dict:
+    messages = body.get("messages", [])
+    ya_hay_tool = any(m.get("role") == "tool" for m in messages)
+    if body.get("tools") and body.get("tool_choice") != "none" and not ya_hay_tool \
+            and random.random() < CONFIG["tool_rate"]:
+        return {"role": "assistant", "content": None, "tool_calls": [_tool_call()]}
+    if not body.get("tools"):
+        return {"role": "assistant", "content": _correccion(str(messages[-1].get("content", "")))}
+    return {"role": "assistant", "content": RESPUESTA}
+
+
+async def _stream(body: dict, mensaje: dict):
+    await asyncio.sleep(_latencia())
+    if mensaje.get("tool_calls"):
+        tc = mensaje["tool_calls"][0]
+        # La tool call llega troceada, como en OpenRouter
+        args = tc["function"]["arguments"]
+        partes = [
+            {"index": 0, "id": tc["id"], "type": "function", "function": {"name": tc["function"]["name"], "arguments": args[:5]}},
+            {"index": 0, "function": {"arguments": args[5:]}},
+        ]
+        for parte in partes:
+            yield f"data: {json.dumps({'choices': [{'delta': {'tool_calls': [parte]}}]})}\n\n"
+    else:
+        yield ": OPENROUTER PROCESSING\n\n"
+        for palabra in re.findall(r"\S+\s*", mensaje["content"]):
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': palabra}}]})}\n\n"
+            await asyncio.sleep(CONFIG["token_ms"] / 1000)
+    texto = mensaje.get("content") or ""
+    yield f"data: {json.dumps({'choices': [], 'usage': _usage(body, texto)})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/api/v1/chat/completions")
+async def completions(request: Request):
+    body = await request.json()
+    if random.random() < CONFIG["error_rate"]:
+        return JSONResponse({"error": "overloaded"}, status_code=503, headers={"Retry-After": "0"})
+
+    mensaje = _mensaje(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, mensaje), media_type="text/event-stream")
+
+    await asyncio.sleep(_latencia())
+    return {
+        "id": "gen-bench",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": mensaje, "finish_reason": "stop"}],
+        "usage": _usage(body, mensaje.get("content") or ""),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for clave, valor in CONFIG.items():
+        parser.add_argument(f"--{clave.replace('_', '-')}", type=float, default=valor)
+    args = parser.parse_args()
+    for clave in CONFIG:
+        CONFIG[clave] = getattr(args, clave)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
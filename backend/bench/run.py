@@ -0,0 +1,228 @@
+"""
+Benchmark de carga del backend, sin red.
+
+Arranca el OpenRouter falso, siembra un catálogo sintético en una base de
+datos temporal, levanta el backend apuntando a ambos y lanza carga contra
+/temas, /temas/{slug}, /ejercicios/{id}, /chat, /chat/stream y /verificar. Imprime (o
+guarda con --output) un JSON con p50/p95/p99 y peticiones por segundo de
+cada escenario, pensado para comparar commits con un diff.
+
+    cd backend
+    python -m bench.run --concurrencia 32 --peticiones 500
+    python -m bench.run --escenarios temas,tema --output ../bench_output.txt
+
+Con --base-url se mide un backend ya arrancado (sin sembrar ni levantar nada).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from bench.seed import id_ejercicio, slug_tema
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PREGUNTAS_CHAT = [
+    "¿Qué es la memoria episódica en un agente?",
+    "¿Cómo funciona un RAG con vectores?",
+    "Explícame el protocolo MCP",
+    "¿Qué comandos tiene Claude Code?",
+    "Hola, ¿qué puedo aprender aquí?",
+]
+
+
+def _peticion(escenario: str, args) -> tuple[str, str, dict | None]:
+    """(método, ruta, cuerpo JSON) para una petición del escenario"""
+    i = random.randint(1, args.temas)
+    if escenario == "temas":
+        return "GET", "/temas", None
+    if escenario == "tema":
+        return "GET", f"/temas/{slug_tema(i)}", None
+    if escenario == "ejercicio":
+        return "GET", f"/ejercicios/{id_ejercicio(i, random.randint(1, args.ejercicios))}", None
+    if escenario == "chat":
+        return "POST", "/chat", {"messages": [{"role": "user", "content": random.choice(PREGUNTAS_CHAT)}]}
+    if escenario == "chat_stream":
+        return "POST", "/chat/stream", {"messages": [{"role": "user", "content": random.choice(PREGUNTAS_CHAT)}]}
+    if escenario == "verificar":
+        # Respuestas únicas para no medir solo la caché de correcciones
+        respuesta = f"Un agente usa memoria y herramientas ({random.getrandbits(48):x})"
+        return "POST", "/verificar", {
+            "tipo": "escrito",
+            "ejercicio_id": id_ejercicio(i, 1),
+            "respuestas": [{"pregunta": "¿Qué es un agente?", "respuesta": respuesta}],
+        }
+    raise ValueError(f"Escenario desconocido: {escenario}")
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[k]
+
+
+async def medir(client: httpx.AsyncClient, escenario: str, args) -> dict:
+    latencias: list[float] = []
+    estados: dict[str, int] = {}
+    restantes = args.peticiones
+
+    async def trabajador():
+        nonlocal restantes
+        while restantes > 0:
+            restantes -= 1
+            metodo, ruta, cuerpo = _peticion(escenario, args)
+            inicio = time.perf_counter()
+            try:
+                r = await client.request(metodo, ruta, json=cuerpo)
+                estado = str(r.status_code)
+            except httpx.HTTPError as e:
+                estado = type(e).__name__
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            estados[estado] = estados.get(estado, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(args.concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    errores = sum(n for estado, n in estados.items() if not estado.startswith("2"))
+    return {
+        "peticiones": len(latencias),
+        "errores": errores,
+        "estados": estados,
+        "duracion_s": round(duracion, 3),
+        "rps": round(len(latencias) / duracion, 2) if duracion else 0.0,
+        "media_ms": round(statistics.fmean(latencias), 2) if latencias else 0.0,
+        "p50_ms": round(_percentil(latencias, 50), 2),
+        "p95_ms": round(_percentil(latencias, 95), 2),
+        "p99_ms": round(_percentil(latencias, 99), 2),
+    }
+
+
+async def _esperar(url: str, timeout: float = 30):
+    limite = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < limite:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout:.0f}s")
+
+
+def _lanzar(cmd: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env={**os.environ, **env})
+
+
+async def ejecutar(args) -> dict:
+    procesos: list[subprocess.Popen] = []
+    base_url = args.base_url
+    try:
+        if base_url is None:
+            tmp = tempfile.mkdtemp(prefix="bench-")
+            entorno = {
+                "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+                "OPENROUTER_URL": f"http://127.0.0.1:{args.puerto_llm}/api/v1/chat/completions",
+                "OPENROUTER_API_KEY": "bench",
+                "LLM_HTTP2": "0",
+            }
+
+            subprocess.run(
+                [sys.executable, "-m", "bench.seed", "--temas", str(args.temas),
+                 "--videos", str(args.videos), "--ejercicios", str(args.ejercicios)],
+                cwd=BACKEND_DIR, env={**os.environ, **entorno}, check=True,
+            )
+            procesos.append(_lanzar(
+                [sys.executable, "-m", "bench.fake_openrouter", "--port", str(args.puerto_llm),
+                 "--latency-ms", str(args.latencia_llm_ms), "--tool-rate", str(args.tool_rate),
+                 "--malformed-rate", str(args.malformed_rate)],
+                entorno,
+            ))
+            procesos.append(_lanzar(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.puerto),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                entorno,
+            ))
+            base_url = f"http://127.0.0.1:{args.puerto}"
+            await _esperar(f"http://127.0.0.1:{args.puerto_llm}/docs")
+            await _esperar(f"{base_url}/")
+
+        limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+        resultados = {}
+        async with httpx.AsyncClient(base_url=base_url, limits=limites, timeout=120) as client:
+            for escenario in args.escenarios.split(","):
+                # Calentamiento: cachés y conexiones
+                for _ in range(min(10, args.peticiones)):
+                    metodo, ruta, cuerpo = _peticion(escenario, args)
+                    await client.request(metodo, ruta, json=cuerpo)
+                resultados[escenario] = await medir(client, escenario, args)
+
+        return {
+            "config": {
+                "concurrencia": args.concurrencia,
+                "peticiones": args.peticiones,
+                "temas": args.temas,
+                "videos_por_tema": args.videos,
+                "ejercicios_por_tema": args.ejercicios,
+                "latencia_llm_ms": args.latencia_llm_ms,
+                "workers": args.workers,
+            },
+            "commit": _commit(),
+            "escenarios": resultados,
+        }
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            proceso.wait(timeout=10)
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escenarios", default="temas,tema,ejercicio,chat,chat_stream,verificar")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por escenario")
+    parser.add_argument("--temas", type=int, default=50)
+    parser.add_argument("--videos", type=int, default=40, help="videos por tema")
+    parser.add_argument("--ejercicios", type=int, default=10, help="ejercicios por tema")
+    parser.add_argument("--latencia-llm-ms", type=float, default=200)
+    parser.add_argument("--tool-rate", type=float, default=0.5)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--puerto", type=int, default=8100)
+    parser.add_argument("--puerto-llm", type=int, default=9100)
+    parser.add_argument("--base-url", help="medir un backend ya arrancado en esta URL")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--output", help="fichero donde guardar el JSON (por defecto, stdout)")
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+    informe = json.dumps(asyncio.run(ejecutar(args)), indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(informe + "\n", encoding="utf-8")
+    else:
+        print(informe)
+
+
+if __name__ == "__main__":
+    main()
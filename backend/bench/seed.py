@@ -0,0 +1,87 @@
+"""
+Genera un catálogo sintético (temas, videos y ejercicios) para benchmarks.
+
+    DATABASE_URL=sqlite:///bench.db python -m bench.seed --temas 50 --videos 40 --ejercicios 10
+
+Los identificadores son deterministas (tema-0001, bench-0001-01...) para que
+el generador de carga sepa qué pedir sin consultar la base de datos.
+"""
+import argparse
+import json
+import random
+
+from sqlalchemy import insert
+
+from database import SessionLocal, init_db, marcar_catalogo_modificado
+from models import Tema, Video, Ejercicio
+
+PALABRAS = (
+    "agentes memoria contexto historial herramientas rag vectores embeddings mcp protocolo "
+    "claude code prompts tokens modelos evaluación planificación razonamiento python api"
+).split()
+
+
+def slug_tema(i: int) -> str:
+    return f"tema-sintetico-{i:04d}"
+
+
+def id_ejercicio(i: int, j: int) -> str:
+    return f"bench-{i:04d}-{j:02d}"
+
+
+def _texto(n: int) -> str:
+    return " ".join(random.choice(PALABRAS) for _ in range(n))
+
+
+def sembrar(temas: int, videos: int, ejercicios: int, semilla: int = 42):
+    random.seed(semilla)
+    init_db()
+
+    filas_temas, filas_videos, filas_ejercicios = [], [], []
+    for i in range(1, temas + 1):
+        tema_id = f"tema-{i:04d}"
+        filas_temas.append({
+            "id": tema_id, "slug": slug_tema(i), "titulo": f"Tema sintético {i}",
+            "descripcion": _texto(40), "orden": i,
+        })
+        for j in range(1, videos + 1):
+            filas_videos.append({
+                "tema_id": tema_id, "youtube_id": f"yt{i:04d}{j:03d}", "titulo": _texto(8).capitalize(),
+                "descripcion": _texto(300), "tags": ", ".join(random.sample(PALABRAS, 6)), "orden": j,
+            })
+        for j in range(1, ejercicios + 1):
+            preguntas = [
+                {"pregunta": _texto(12) + "?", "opciones": [_texto(4) for _ in range(4)], "correcta": 0}
+                for _ in range(5)
+            ]
+            filas_ejercicios.append({
+                "id": id_ejercicio(i, j), "tema_id": tema_id, "titulo": f"Ejercicio {i}.{j}",
+                "tipo": random.choice(["quiz", "codigo", "escrito"]),
+                "contenido": json.dumps(preguntas, ensure_ascii=False), "orden": j,
+            })
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(Tema), filas_temas)
+        db.execute(insert(Video), filas_videos)
+        db.execute(insert(Ejercicio), filas_ejercicios)
+        marcar_catalogo_modificado(db)
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"Sembrados {len(filas_temas)} temas, {len(filas_videos)} videos, {len(filas_ejercicios)} ejercicios")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--temas", type=int, default=50)
+    parser.add_argument("--videos", type=int, default=40, help="videos por tema")
+    parser.add_argument("--ejercicios", type=int, default=10, help="ejercicios por tema")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+    sembrar(args.temas, args.videos, args.ejercicios, args.semilla)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Caché en memoria de las respuestas del catálogo (/temas, /temas/{slug},
+/ejercicios/{id}).
+
+Guarda los bytes JSON ya serializados junto con un ETag fuerte, indexados por
+la versión del contenido (tabla `content_version`). Cualquier escritura en
+temas, videos o ejercicios incrementa esa versión (ver eventos de sesión en
+`database.py`) y la caché se vacía en cuanto la detecta: al instante en el
+propio proceso y, para escrituras de otros procesos (scripts de migración),
+tras como mucho CACHE_VERSION_TTL segundos.
+
+Las respuestas de más de CATALOG_COMPRESS_MIN_BYTES se sirven comprimidas
+según `Accept-Encoding` (brotli o gzip). Cada variante comprimida se calcula
+una vez por entrada, es decir, una vez por versión del contenido, y se guarda
+junto a los bytes originales.
+
+Las respuestas parciales de /temas/{slug} (`fields`, paginación) dependen de
+la query, así que hay muchas posibles: van a un LRU aparte de como mucho
+CATALOG_PARTIAL_CACHE_ENTRIES entradas y se comprimen con niveles rápidos.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable
+
+import brotli
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from models import ContentVersion
+
+CACHE_VERSION_TTL = float(os.getenv("CACHE_VERSION_TTL", "1.0"))
+CATALOG_COMPRESS_MIN_BYTES = int(os.getenv("CATALOG_COMPRESS_MIN_BYTES", "1024"))
+# Se comprime una vez por versión del contenido, así que compensa el nivel alto
+CATALOG_GZIP_LEVEL = int(os.getenv("CATALOG_GZIP_LEVEL", "9"))
+CATALOG_BROTLI_QUALITY = int(os.getenv("CATALOG_BROTLI_QUALITY", "11"))
+# Respuestas parciales: pueden recalcularse a menudo, así que priman la velocidad
+CATALOG_PARTIAL_CACHE_ENTRIES = int(os.getenv("CATALOG_PARTIAL_CACHE_ENTRIES", "256"))
+CATALOG_FAST_GZIP_LEVEL = int(os.getenv("CATALOG_FAST_GZIP_LEVEL", "5"))
+CATALOG_FAST_BROTLI_QUALITY = int(os.getenv("CATALOG_FAST_BROTLI_QUALITY", "4"))
+
+# Codificaciones soportadas, por orden de preferencia
+_COMPRESORES: dict[str, Callable[[bytes], bytes]] = {
+    "br": lambda body: brotli.compress(body, quality=CATALOG_BROTLI_QUALITY),
+    "gzip": lambda body: gzip.compress(body, compresslevel=CATALOG_GZIP_LEVEL, mtime=0),
+}
+_COMPRESORES_RAPIDOS: dict[str, Callable[[bytes], bytes]] = {
+    "br": lambda body: brotli.compress(body, quality=CATALOG_FAST_BROTLI_QUALITY),
+    "gzip": lambda body: gzip.compress(body, compresslevel=CATALOG_FAST_GZIP_LEVEL, mtime=0),
+}
+
+
+@dataclass(frozen=True)
+class RespuestaCacheada:
+    body: bytes
+    etag: str
+    rapida: bool = False  # niveles de compresión rápidos (respuestas parciales)
+    # codificación -> cuerpo comprimido (se rellena bajo demanda)
+    variantes: dict[str, bytes] = field(default_factory=dict, compare=False, repr=False)
+
+    def comprimida(self, codificacion: str) -> bytes:
+        variante = self.variantes.get(codificacion)
+        if variante is None:
+            compresores = _COMPRESORES_RAPIDOS if self.rapida else _COMPRESORES
+            # Si dos peticiones la calculan a la vez el resultado es idéntico
+            variante = self.variantes[codificacion] = compresores[codificacion](self.body)
+        return variante
+
+
+def nueva_entrada(body: bytes, rapida: bool = False) -> RespuestaCacheada:
+    """Entrada con su ETag (también para respuestas que no se guardan en la caché)"""
+    return RespuestaCacheada(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"', rapida=rapida)
+
+
+class CatalogCache:
+    def __init__(self, version_ttl: float = CACHE_VERSION_TTL, max_parciales: int = CATALOG_PARTIAL_CACHE_ENTRIES):
+        self.version_ttl = version_ttl
+        self.max_parciales = max_parciales
+        self._version: int | None = None
+        self._comprobada_en = 0.0
+        self._entradas: dict[tuple, RespuestaCacheada] = {}
+        self._parciales: OrderedDict[tuple, RespuestaCacheada] = OrderedDict()
+        self._locks: dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        """Fuerza a releer la versión del contenido en la próxima petición"""
+        with self._lock:
+            self._comprobada_en = 0.0
+
+    def version(self, db: Session) -> int:
+        """Versión actual del contenido (consultada como mucho cada version_ttl segundos)"""
+        ahora = time.monotonic()
+        with self._lock:
+            if self._version is not None and ahora - self._comprobada_en < self.version_ttl:
+                return self._version
+
+        fila = db.get(ContentVersion, 1, populate_existing=True)
+        version = fila.version if fila else 0
+
+        with self._lock:
+            if version != self._version:
+                self._entradas.clear()
+                self._parciales.clear()
+                self._locks.clear()
+                self._version = version
+            self._comprobada_en = ahora
+            return version
+
+    def obtener(self, clave: tuple, db: Session, construir: Callable[[], bytes]) -> RespuestaCacheada:
+        """Devuelve la respuesta cacheada para `clave` o la construye con `construir()`"""
+        version = self.version(db)
+        clave = (version, *clave)
+
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            return entrada
+
+        # Un solo constructor por clave aunque lleguen muchas peticiones a la vez.
+        # El lock solo vive mientras se construye: luego la entrada ya está en
+        # _entradas (o la construcción falló, p. ej. 404) y no hace falta, así
+        # que claves inexistentes no dejan locks acumulados.
+        with self._lock:
+            lock = self._locks.setdefault(clave, threading.Lock())
+        try:
+            with lock:
+                entrada = self._entradas.get(clave)
+                if entrada is None:
+                    body = construir()
+                    entrada = nueva_entrada(body)
+                    with self._lock:
+                        if self._version == version:
+                            self._entradas[clave] = entrada
+                return entrada
+        finally:
+            with self._lock:
+                if self._locks.get(clave) is lock:
+                    del self._locks[clave]
+
+    def obtener_parcial(self, clave: tuple, db: Session, construir: Callable[[], bytes]) -> RespuestaCacheada:
+        """Como obtener, para respuestas que dependen de la query: LRU acotado y compresión rápida"""
+        version = self.version(db)
+        clave = (version, *clave)
+        with self._lock:
+            entrada = self._parciales.get(clave)
+            if entrada is not None:
+                self._parciales.move_to_end(clave)
+                return entrada
+
+        entrada = nueva_entrada(construir(), rapida=True)
+        with self._lock:
+            if self._version == version:
+                self._parciales[clave] = entrada
+                while len(self._parciales) > self.max_parciales:
+                    self._parciales.popitem(last=False)
+        return entrada
+
+
+def elegir_codificacion(accept_encoding: str | None) -> str | None:
+    """Mejor codificación soportada que acepta el cliente (respetando q=0)"""
+    if not accept_encoding:
+        return None
+    aceptadas: dict[str, float] = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, params = parte.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip()] = q
+    for codificacion in _COMPRESORES:
+        if aceptadas.get(codificacion, aceptadas.get("*", 0.0)) > 0:
+            return codificacion
+    return None
+
+
+def responder(request: Request, entrada: RespuestaCacheada, media_type: str = "application/json") -> Response:
+    """Respuesta JSON con ETag (comprimida si compensa), o 304 si el cliente ya tiene esa versión"""
+    codificacion = None
+    if len(entrada.body) >= CATALOG_COMPRESS_MIN_BYTES:
+        codificacion = elegir_codificacion(request.headers.get("accept-encoding"))
+
+    # Cada representación lleva su propio ETag fuerte; cualquiera de ellas vale para el 304
+    etag = entrada.etag if codificacion is None else f'{entrada.etag[:-1]}-{codificacion}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etags = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+        if "*" in etags or any(e == entrada.etag or e.startswith(entrada.etag[:-1] + "-") for e in etags):
+            return Response(status_code=304, headers=headers)
+
+    if codificacion is None:
+        return Response(content=entrada.body, media_type=media_type, headers=headers)
+    headers["Content-Encoding"] = codificacion
+    return Response(content=entrada.comprimida(codificacion), media_type=media_type, headers=headers)
+
+
+# Instancia compartida por los endpoints del catálogo
+catalogo = CatalogCache()
@@ -0,0 +1,301 @@
+"""
+Herramientas (tools) que el LLM del chat puede invocar y su ejecución.
+
+Lo comparten `/chat` y `/chat/stream` para que ambos expongan exactamente
+las mismas funciones y el mismo prompt de sistema.
+"""
+import asyncio
+import json
+import os
+import time
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from database import run_db_lectura
+from metrics import tool_duracion
+from models import Video
+from search import buscar_ids_videos
+from vectores import indice_videos
+
+# Modo de búsqueda de buscar_videos si el LLM no indica otro
+MODOS_BUSQUEDA = ("keywords", "semantico", "hibrido")
+CHAT_SEARCH_MODE = os.getenv("CHAT_SEARCH_MODE", "hibrido")
+# Peso de la similitud vectorial en el modo híbrido (el resto, la posición en la búsqueda por keywords)
+CHAT_SEARCH_HYBRID_ALPHA = float(os.getenv("CHAT_SEARCH_HYBRID_ALPHA", "0.5"))
+
+# Definición de las tools disponibles
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "buscar_videos",
+            "description": "Busca videos del canal relacionados con ciertos temas o keywords. Usa esta función cuando el usuario pregunte sobre temas específicos como memoria, RAG, MCP, Claude Code, tools, agentes, etc. Extrae keywords relevantes de la pregunta del usuario.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "keywords": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Lista de keywords o temas relacionados con la pregunta. Por ejemplo: ['memoria', 'conversaciones'], ['rag', 'vectores'], ['mcp', 'herramientas'], etc."
+                    },
+                    "modo": {
+                        "type": "string",
+                        "enum": list(MODOS_BUSQUEDA),
+                        "description": "Opcional. 'keywords' busca las palabras literales, 'semantico' videos de contenido parecido aunque usen otras palabras, 'hibrido' combina ambos (por defecto)."
+                    }
+                },
+                "required": ["keywords"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "redirigir_temas_internos",
+            "description": "OBLIGATORIO: Usa esta función cuando el usuario pregunte sobre cualquier tema del curso. NO generes URLs manualmente. Temas: memoria en agentes, comunicación entre agentes, Claude Code, MCP/herramientas (incluye RAG, vectores, embeddings), introducción a agentes.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "slug_tema": {
+                        "type": "string",
+                        "description": "Slug o keyword del tema. Ejemplos: 'memoria', 'memoria-agentes', 'comunicacion', 'claude-code', 'mcp', 'rag', 'rag-vectores', 'vectores', 'embeddings', 'herramientas', 'agentes', 'introduccion'. La función mapea automáticamente sinónimos al tema correcto."
+                    }
+                },
+                "required": ["slug_tema"]
+            }
+        }
+    }
+]
+
+# Mensaje del sistema que se añade si el cliente no envía uno
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "Eres un asistente experto en agentes de IA, programación y tecnología. "
+              "Ayudas a los estudiantes de 'El Rincón de Gabi' a aprender sobre estos temas. "
+              "\n\n=== FORMATO DE ENLACES - REGLA ABSOLUTA ===\n"
+              "OBLIGATORIO: Todos los enlaces DEBEN seguir EXACTAMENTE este formato Markdown:\n"
+              "[texto descriptivo](https://url-completa.com)\n\n"
+              "EJEMPLOS CORRECTOS:\n"
+              "- [Documentación de Anthropic](https://docs.anthropic.com)\n"
+              "- [Guía de inicio rápido](https://docs.anthropic.com/quickstart)\n\n"
+              "PROHIBIDO - NUNCA uses estos formatos:\n"
+              "❌ href=\"https://url.com\">Texto\n"
+              "❌ <a href=\"https://url.com\">Texto</a>\n"
+              "❌ https://url.com (URL sola)\n"
+              "❌ Cualquier fragmento de HTML\n\n"
+              "Si necesitas incluir múltiples enlaces, usa una lista Markdown:\n"
+              "- [Enlace 1](https://url1.com)\n"
+              "- [Enlace 2](https://url2.com)\n"
+              "\n\n=== USO DE HERRAMIENTAS - CRÍTICO ===\n"
+              "NUNCA generes URLs a temas del curso directamente. SIEMPRE usa las herramientas.\n"
+              "PROHIBIDO generar URLs como elrincondelgabi.com/... o localhost/... manualmente.\n\n"
+              "Herramientas disponibles:\n"
+              "1. buscar_videos: Para buscar videos específicos del canal cuando pregunten sobre temas concretos\n"
+              "2. redirigir_temas_internos: OBLIGATORIO para cualquier mención de temas del curso (memoria, comunicación, MCP, RAG, vectores, Claude Code, agentes, etc.)\n"
+              "\nUSO OBLIGATORIO DE HERRAMIENTAS:\n"
+              "- Cuando el usuario pregunte sobre temas como RAG, memoria, MCP, agentes, etc. → DEBES llamar a redirigir_temas_internos\n"
+              "- Para buscar contenido específico del canal → buscar_videos\n"
+              "- NUNCA inventes o escribas URLs manualmente. SIEMPRE usa las funciones.\n"
+}
+
+
+# Solo lo que el LLM recibe de cada video: la descripción llega ya recortada de la BD
+COLUMNAS_RESULTADO = (
+    Video.id,
+    Video.titulo,
+    func.substr(Video.descripcion, 1, 500).label("descripcion"),  # Limitar a 500 chars
+    Video.youtube_id,
+    Video.tags,
+)
+
+
+def _ids_por_keywords(keywords: list[str], db: Session, limit: int) -> list[int]:
+    """IDs de los videos que contienen alguna keyword, los más relevantes primero"""
+    # Índice full-text ordenado por relevancia (si el motor lo soporta)
+    ids = buscar_ids_videos(db, keywords, limit)
+    if ids is not None:
+        return ids
+
+    # Construir condiciones OR para cada keyword
+    conditions = []
+    for keyword in keywords:
+        keyword_lower = f"%{keyword.lower()}%"
+        conditions.extend([
+            Video.titulo.ilike(keyword_lower),
+            Video.descripcion.ilike(keyword_lower),
+            Video.tags.ilike(keyword_lower)
+        ])
+
+    # Buscar videos que coincidan con alguna condición
+    return list(db.execute(select(Video.id).where(or_(*conditions)).limit(limit)).scalars())
+
+
+def _ids_hibridos(keywords: list[str], db: Session, limit: int) -> list[int]:
+    """Mezcla la búsqueda por keywords y la vectorial sumando puntuaciones ponderadas"""
+    texto = " ".join(keywords)
+    por_keywords = _ids_por_keywords(keywords, db, limit * 3)
+    por_vector = indice_videos.buscar(texto, limit * 3)
+
+    # Keywords: de 1 (primer resultado) hacia 0; vector: coseno con todos los candidatos
+    candidatos = set(por_keywords) | {i for i, _ in por_vector}
+    similitud = indice_videos.similitudes(texto, list(candidatos))
+    posicion = {i: 1 - n / len(por_keywords) for n, i in enumerate(por_keywords)}
+    puntuacion = {
+        i: CHAT_SEARCH_HYBRID_ALPHA * similitud.get(i, 0.0) + (1 - CHAT_SEARCH_HYBRID_ALPHA) * posicion.get(i, 0.0)
+        for i in candidatos
+    }
+    return sorted(candidatos, key=lambda i: (-puntuacion[i], i))[:limit]
+
+
+def _resultados(ids: list[int], db: Session) -> list[dict]:
+    """Datos de cada video para el LLM, en el orden de `ids`"""
+    filas = db.execute(select(*COLUMNAS_RESULTADO).where(Video.id.in_(ids))).all() if ids else []
+    por_id = {v.id: v for v in filas}
+
+    # Formatear resultados
+    resultados = []
+    for video in (por_id[i] for i in ids if i in por_id):
+        resultados.append({
+            "titulo": video.titulo,
+            "descripcion": video.descripcion or "",
+            "youtube_id": video.youtube_id,
+            "tags": video.tags
+        })
+
+    return resultados
+
+
+def buscar_videos_por_keywords(keywords: list[str], db: Session, limit: int = 5) -> list[dict]:
+    """Busca videos en la BD usando keywords en titulo, descripcion y tags"""
+    if not keywords:
+        return []
+    return _resultados(_ids_por_keywords(keywords, db, limit), db)
+
+
+def buscar_videos(keywords: list[str], db: Session, limit: int = 5, modo: str | None = None) -> list[dict]:
+    """Busca videos por keywords, por similitud vectorial o combinando ambas"""
+    if not keywords:
+        return []
+    modo = modo if modo in MODOS_BUSQUEDA else CHAT_SEARCH_MODE
+    if modo != "keywords":
+        indice_videos.asegurar_al_dia(db)
+    # Sin índice vectorial se recurre a las keywords
+    if modo == "keywords" or not indice_videos.disponible:
+        return buscar_videos_por_keywords(keywords, db, limit)
+    if modo == "semantico":
+        ids = [i for i, _ in indice_videos.buscar(" ".join(keywords), limit)]
+    else:
+        ids = _ids_hibridos(keywords, db, limit)
+    return _resultados(ids, db)
+
+
+FRONTEND_BASE_URL = "http://localhost:3000"  # Puerto del frontend
+
+# Alias de cada tema del curso -> slug del tema
+TEMAS_ALIAS = {
+    # Temas principales del curso
+    "memoria-agentes": "memoria-agentes",
+    "comunicacion-agentes": "comunicacion-agentes",
+    "claude-code": "claude-code",
+    "mcp-herramientas": "mcp-herramientas",
+    "introduccion-agentes": "introduccion-agentes",
+
+    # Sinónimos y variaciones comunes - Memoria
+    "memoria": "memoria-agentes",
+    "memoria-corto-plazo": "memoria-agentes",
+    "memoria-largo-plazo": "memoria-agentes",
+    "memoria-episodica": "memoria-agentes",
+    "memoria-semantica": "memoria-agentes",
+
+    # Sinónimos - Comunicación
+    "comunicacion": "comunicacion-agentes",
+    "protocolo-a2a": "comunicacion-agentes",
+    "a2a": "comunicacion-agentes",
+
+    # Sinónimos - Claude Code
+    "claude": "claude-code",
+    "cli": "claude-code",
+
+    # Sinónimos - MCP y Herramientas (incluye RAG)
+    "mcp": "mcp-herramientas",
+    "herramientas": "mcp-herramientas",
+    "model-context-protocol": "mcp-herramientas",
+    "rag": "mcp-herramientas",
+    "rag-vectores": "mcp-herramientas",
+    "vectores": "mcp-herramientas",
+    "embeddings": "mcp-herramientas",
+
+    # Aliases adicionales
+    "agentes": "memoria-agentes",
+    "agentes-ia": "introduccion-agentes",
+    "multi-agente": "comunicacion-agentes",
+    "introduccion": "introduccion-agentes",
+}
+
+
+def obtener_url_tema_interno(slug_tema: str) -> str:
+    """Devuelve URL interna del sitio web según el slug del tema"""
+    slug_lower = slug_tema.lower()
+    if slug_lower in TEMAS_ALIAS:
+        return f"{FRONTEND_BASE_URL}/temas/{TEMAS_ALIAS[slug_lower]}"
+
+    return f"{FRONTEND_BASE_URL}/"  # Página principal si no encuentra el tema
+
+
+def ejecutar_tool(function_name: str, function_args: dict, db: Session) -> str:
+    """Ejecuta la tool solicitada por el LLM y devuelve su resultado como texto"""
+    if not isinstance(function_args, dict):
+        function_args = {}
+    if function_name == "buscar_videos":
+        keywords = function_args.get("keywords", [])
+        videos_encontrados = buscar_videos(keywords, db, modo=function_args.get("modo"))
+
+        # Formatear los resultados
+        if videos_encontrados:
+            videos_text = "\n\n".join([
+                f"**{v['titulo']}**\n{v['descripcion']}\nTags: {v['tags']}"
+                for v in videos_encontrados
+            ])
+            return f"Videos encontrados:\n\n{videos_text}"
+        return "No se encontraron videos relacionados con esos temas."
+
+    if function_name == "redirigir_temas_internos":
+        slug_tema = function_args.get("slug_tema", "")
+        url = obtener_url_tema_interno(slug_tema)
+        if url.endswith("/"):
+            # Es la página principal
+            return f"Puedes ver todos los temas disponibles en: {url}"
+        # Es un tema específico
+        return f"Tema específico disponible en: {url}"
+
+    return f"Función {function_name} no reconocida."
+
+
+def parsear_argumentos(arguments: str | None) -> dict:
+    """Parsea los argumentos JSON de una tool call (vacío si vienen mal formados o no son un objeto)"""
+    try:
+        args = json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        return {}
+    return args if isinstance(args, dict) else {}
+
+
+async def ejecutar_tool_call(tool_call: dict) -> dict:
+    """Ejecuta una tool call en el pool de hilos de la BD y devuelve el mensaje `tool`"""
+    function_name = tool_call["function"]["name"]
+    function_args = parsear_argumentos(tool_call["function"].get("arguments"))
+    inicio = time.perf_counter()
+    tool_response = await run_db_lectura(ejecutar_tool, function_name, function_args)
+    tool_duracion.observe(time.perf_counter() - inicio, function_name)
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call["id"],
+        "name": function_name,
+        "content": tool_response
+    }
+
+
+async def ejecutar_tool_calls(tool_calls: list[dict]) -> list[dict]:
+    """Ejecuta todas las tool calls de un turno en paralelo, en el orden pedido"""
+    return list(await asyncio.gather(*(ejecutar_tool_call(tc) for tc in tool_calls)))
@@ -0,0 +1,211 @@
+"""
+Recorte del historial de /chat a un presupuesto de tokens.
+
+El cliente manda la conversación entera en cada turno; sin recortar, cada
+mensaje nuevo encarece y ralentiza todas las llamadas al LLM hasta desbordar
+el contexto del modelo. Antes de llamar al LLM:
+
+1. Se conservan siempre el prompt del sistema y los CHAT_KEEP_MESSAGES
+   mensajes más recientes, tal cual.
+2. Si aun así no cabe en CHAT_CONTEXT_TOKENS, los mensajes anteriores se
+   sustituyen por un resumen generado por el LLM.
+3. Si los recientes por sí solos tampoco caben (o el resumen falla), se
+   descartan los más antiguos hasta que quepa.
+
+Los resúmenes son incrementales y se cachean por prefijo de conversación (un
+hash encadenado de los mensajes), así que en el turno siguiente se reutiliza
+el resumen anterior y solo se resume lo que ha salido de la ventana reciente.
+
+Los tokens se estiman a ~4 caracteres por token, como en grading.py.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import httpx
+
+from llm import LLM_MODEL, PRIORIDAD_CHAT, LLMSaturado, completar
+
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "6000"))
+CHAT_KEEP_MESSAGES = int(os.getenv("CHAT_KEEP_MESSAGES", "6"))
+CHAT_SUMMARY_ENABLED = os.getenv("CHAT_SUMMARY_ENABLED", "1") != "0"
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400"))
+CHAT_SUMMARY_CACHE_ENTRIES = int(os.getenv("CHAT_SUMMARY_CACHE_ENTRIES", "2000"))
+
+# Coste fijo aproximado de cada mensaje (rol y separadores)
+TOKENS_POR_MENSAJE = 4
+
+PROMPT_RESUMEN = """Resume la siguiente conversación entre un estudiante y el asistente de
+'El Rincón de Gabi' para poder continuarla sin el historial completo.
+Conserva los temas tratados, las dudas del estudiante, los enlaces o videos
+recomendados y cualquier dato que el estudiante haya dado sobre sí mismo.
+Escribe en español, en prosa breve, sin inventar nada.
+"""
+
+PREFIJO_RESUMEN = "Resumen de la conversación anterior (los mensajes originales ya no se incluyen):\n"
+
+
+def contar_tokens(texto: str | None) -> int:
+    return (len(texto) + 3) // 4 if texto else 0
+
+
+def tokens_mensajes(messages: list[dict]) -> int:
+    return sum(TOKENS_POR_MENSAJE + contar_tokens(m.get("content")) for m in messages)
+
+
+def _cadena_hashes(messages: list[dict]) -> list[str]:
+    """hashes[i] identifica el prefijo messages[:i] (hashes[0] = conversación vacía)"""
+    hashes = [""]
+    for m in messages:
+        h = hashlib.sha256()
+        h.update(hashes[-1].encode())
+        h.update(m["role"].encode())
+        h.update(b"\0")
+        h.update((m.get("content") or "").encode())
+        hashes.append(h.hexdigest())
+    return hashes
+
+
+@dataclass
+class Recorte:
+    messages: list[dict]
+    tokens_originales: int
+    tokens_enviados: int
+    tokens_resumen: int = 0  # tokens gastados en generar el resumen en esta petición
+    resumidos: int = 0  # mensajes sustituidos por el resumen
+    descartados: int = 0  # mensajes eliminados sin resumir
+
+    def meta(self, llamadas: int) -> dict:
+        """Métricas para la respuesta; el ahorro cuenta todas las llamadas al LLM del turno"""
+        ahorro = (self.tokens_originales - self.tokens_enviados) * max(llamadas, 1) - self.tokens_resumen
+        return {
+            "tokens_originales": self.tokens_originales,
+            "tokens_enviados": self.tokens_enviados,
+            "tokens_ahorrados": ahorro,
+            "mensajes_resumidos": self.resumidos,
+            "mensajes_descartados": self.descartados,
+        }
+
+
+class GestorContexto:
+    def __init__(
+        self,
+        presupuesto: int = CHAT_CONTEXT_TOKENS,
+        recientes: int = CHAT_KEEP_MESSAGES,
+        max_resumenes: int = CHAT_SUMMARY_CACHE_ENTRIES,
+    ):
+        self.presupuesto = presupuesto
+        self.recientes = recientes
+        self.max_resumenes = max_resumenes
+        self._resumenes: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.resumenes_generados = 0
+        self.resumenes_reutilizados = 0
+
+    # ============== Caché de resúmenes ==============
+
+    def _resumen_cacheado(self, clave: str) -> str | None:
+        with self._lock:
+            resumen = self._resumenes.get(clave)
+            if resumen is not None:
+                self._resumenes.move_to_end(clave)
+            return resumen
+
+    def _guardar_resumen(self, clave: str, resumen: str):
+        with self._lock:
+            self._resumenes[clave] = resumen
+            self._resumenes.move_to_end(clave)
+            while len(self._resumenes) > self.max_resumenes:
+                self._resumenes.popitem(last=False)
+
+    async def _resumir(self, anterior: str | None, nuevos: list[dict]) -> tuple[str, int]:
+        """Resumen actualizado con los mensajes nuevos; devuelve (resumen, tokens gastados)"""
+        texto = ""
+        if anterior:
+            texto += f"Resumen previo:\n{anterior}\n\nMensajes posteriores:\n"
+        texto += "\n".join(f"{m['role']}: {m.get('content') or ''}" for m in nuevos)
+
+        data = await completar({
+            "model": LLM_MODEL,
+            "messages": [{"role": "user", "content": PROMPT_RESUMEN + "\n" + texto}],
+            "temperature": 0.2,
+            "max_tokens": CHAT_SUMMARY_MAX_TOKENS,
+        }, prioridad=PRIORIDAD_CHAT, fase="resumen")
+
+        usage = data.get("usage") or {}
+        gastados = usage.get("total_tokens") or (contar_tokens(texto) + CHAT_SUMMARY_MAX_TOKENS)
+        return data["choices"][0]["message"]["content"].strip(), gastados
+
+    # ============== Recorte ==============
+
+    async def ajustar(self, messages: list[dict]) -> Recorte:
+        """Devuelve el historial que cabe en el presupuesto (messages[0] es el sistema)
+
+        Si ya cabe, `Recorte.messages` es la misma lista que se recibe.
+        """
+        originales = tokens_mensajes(messages)
+        if originales <= self.presupuesto:
+            return Recorte(messages, originales, originales)
+
+        sistema, historial = messages[:1], messages[1:]
+        corte = max(0, len(historial) - self.recientes)
+        # La ventana reciente no puede empezar por resultados de tools sin su llamada
+        while 0 < corte < len(historial) and historial[corte]["role"] == "tool":
+            corte -= 1
+        hashes = _cadena_hashes(historial)
+
+        # Resumen más largo ya calculado para un prefijo de los mensajes antiguos
+        desde, resumen = 0, None
+        for i in range(corte, 0, -1):
+            resumen = self._resumen_cacheado(hashes[i])
+            if resumen is not None:
+                desde = i
+                self.resumenes_reutilizados += 1
+                break
+
+        def montar(resumen: str | None, inicio: int) -> list[dict]:
+            extra = [{"role": "system", "content": PREFIJO_RESUMEN + resumen}] if resumen else []
+            return sistema + extra + historial[inicio:]
+
+        candidato = montar(resumen, desde)
+        gastados = 0
+        resumidos = desde
+        if tokens_mensajes(candidato) > self.presupuesto and desde < corte and CHAT_SUMMARY_ENABLED:
+            try:
+                resumen, gastados = await self._resumir(resumen, historial[desde:corte])
+                self._guardar_resumen(hashes[corte], resumen)
+                self.resumenes_generados += 1
+                resumidos = corte
+                candidato = montar(resumen, corte)
+            except (LLMSaturado, httpx.HTTPError, KeyError, IndexError, TypeError, AttributeError):
+                # Sin resumen: se recurre a descartar mensajes
+                pass
+
+        # Último recurso: quitar los mensajes más antiguos (dejando al menos el último)
+        inicio = len(candidato) - len(historial[resumidos:])
+        descartados = 0
+        while tokens_mensajes(candidato) > self.presupuesto and len(candidato) - inicio > 1:
+            del candidato[inicio]
+            descartados += 1
+            while len(candidato) - inicio > 1 and candidato[inicio]["role"] == "tool":
+                del candidato[inicio]
+                descartados += 1
+
+        return Recorte(
+            candidato, originales, tokens_mensajes(candidato),
+            tokens_resumen=gastados, resumidos=resumidos, descartados=descartados,
+        )
+
+    def resumen(self) -> dict:
+        return {
+            "presupuesto_tokens": self.presupuesto,
+            "mensajes_recientes": self.recientes,
+            "resumenes_en_cache": len(self._resumenes),
+            "resumenes_generados": self.resumenes_generados,
+            "resumenes_reutilizados": self.resumenes_reutilizados,
+        }
+
+
+contexto = GestorContexto()
@@ -1,14 +1,57 @@
-from sqlalchemy.orm import Session
-from models import Tema, Ejercicio
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+from models import Tema, Video, Ejercicio
 
 def get_all_temas(db: Session) -> list[Tema]:
     """Obtener todos los temas ordenados"""
     return db.query(Tema).order_by(Tema.orden).all()
 
+def get_all_temas_con_totales(db: Session) -> list[tuple[Tema, int, int]]:
+    """Obtener todos los temas ordenados junto con su número de videos y ejercicios
+
+    Los totales se calculan con subconsultas agrupadas, en una sola consulta,
+    sin cargar las relaciones de cada tema.
+    """
+    total_videos = (
+        db.query(Video.tema_id, func.count(Video.id).label("total"))
+        .group_by(Video.tema_id)
+        .subquery()
+    )
+    total_ejercicios = (
+        db.query(Ejercicio.tema_id, func.count(Ejercicio.id).label("total"))
+        .group_by(Ejercicio.tema_id)
+        .subquery()
+    )
+    return (
+        db.query(
+            Tema,
+            func.coalesce(total_videos.c.total, 0),
+            func.coalesce(total_ejercicios.c.total, 0),
+        )
+        .outerjoin(total_videos, total_videos.c.tema_id == Tema.id)
+        .outerjoin(total_ejercicios, total_ejercicios.c.tema_id == Tema.id)
+        .order_by(Tema.orden)
+        .all()
+    )
+
 def get_tema_by_slug(db: Session, slug: str) -> Tema | None:
-    """Obtener un tema por su slug"""
-    return db.query(Tema).filter(Tema.slug == slug).first()
+    """Obtener un tema por su slug, con videos y ejercicios precargados (3 consultas)"""
+    return (
+        db.query(Tema)
+        .options(selectinload(Tema.videos), selectinload(Tema.ejercicios))
+        .filter(Tema.slug == slug)
+        .first()
+    )
 
 def get_ejercicio_by_id(db: Session, ejercicio_id: str) -> Ejercicio | None:
     """Obtener un ejercicio por su ID"""
     return db.query(Ejercicio).filter(Ejercicio.id == ejercicio_id).first()
+
+def get_catalogo_completo(db: Session) -> list[Tema]:
+    """Todos los temas ordenados con videos y ejercicios precargados (3 consultas en total)"""
+    return (
+        db.query(Tema)
+        .options(selectinload(Tema.videos), selectinload(Tema.ejercicios))
+        .order_by(Tema.orden, Tema.id)
+        .all()
+    )
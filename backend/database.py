@@ -1,11 +1,94 @@
-from sqlalchemy import create_engine
+import os
+
+import anyio
+from sqlalchemy import create_engine, event, text, update
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, Session
-from models import Base
+from models import Base, ContentVersion, CATALOG_MODELS
+from search import init_search_index
+import cache
+
+# SQLite para desarrollo (migrar a Postgres con la variable DATABASE_URL)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///educativo.db")
+
+# Perfil SQLite: pragmas aplicados a cada conexión nueva
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negativo = KiB (64 MiB)
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+
+# Perfil Postgres: pool de conexiones
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") != "0"
+
+
+def _pragmas_sqlite(solo_lectura: bool):
+    def _al_conectar(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        if not solo_lectura:
+            # journal_mode es persistente en el fichero; basta con que lo fije el escritor
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        else:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.close()
+    return _al_conectar
+
+
+# Opciones de pool pasadas a create_engine, por engine (para el informe de arranque)
+_opciones_pool: dict[Engine, dict] = {}
+
+def _crear_engine(url: str, **opciones) -> Engine:
+    engine = create_engine(url, **opciones)
+    _opciones_pool[engine] = {k: v for k, v in opciones.items() if k != "connect_args"}
+    return engine
+
+def crear_engines(url: str) -> tuple[Engine, Engine]:
+    """(engine de escritura, engine de lectura) según el perfil de la URL
+
+    - SQLite en fichero: WAL y pragmas en cada conexión, más un pool aparte de
+      conexiones de solo lectura (query_only) para los GET, que con WAL no se
+      bloquean con el escritor.
+    - Postgres (u otros): pool explícito con pre-ping y reciclado; lecturas y
+      escrituras comparten engine.
+    """
+    url_obj = make_url(url)
+    if url_obj.get_backend_name() != "sqlite":
+        engine = _crear_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+        return engine, engine
 
-# SQLite para desarrollo (migrar a Postgres cambiando solo esta línea)
-DATABASE_URL = "sqlite:///educativo.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    connect_args = {"check_same_thread": False}
+    engine = _crear_engine(url, connect_args=connect_args)
+    if url_obj.database in (None, "", ":memory:"):
+        # En memoria no hay fichero que compartir entre pools
+        return engine, engine
+    event.listen(engine, "connect", _pragmas_sqlite(solo_lectura=False))
+
+    engine_lectura = _crear_engine(
+        url, connect_args=connect_args, pool_size=SQLITE_READ_POOL_SIZE, max_overflow=0,
+    )
+    event.listen(engine_lectura, "connect", _pragmas_sqlite(solo_lectura=True))
+    return engine, engine_lectura
+
+
+engine, engine_lectura = crear_engines(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine)
+SessionLectura = sessionmaker(bind=engine_lectura)
 
 def get_db() -> Session:
     """Dependency para FastAPI"""
@@ -15,6 +98,114 @@ def get_db() -> Session:
     finally:
         db.close()
 
+def get_db_lectura() -> Session:
+    """Dependency para endpoints GET que solo leen"""
+    db = SessionLectura()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Hilos dedicados a consultas lanzadas desde endpoints async
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+_db_limiter: anyio.CapacityLimiter | None = None
+
+async def _en_hilo(fabrica: sessionmaker, func, args, kwargs):
+    global _db_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(DB_THREADS)
+
+    def _trabajo():
+        db = fabrica()
+        try:
+            return func(*args, db=db, **kwargs)
+        finally:
+            db.close()
+
+    return await anyio.to_thread.run_sync(_trabajo, limiter=_db_limiter)
+
+async def run_db(func, *args, **kwargs):
+    """Ejecuta `func(*args, db=<sesión>, **kwargs)` en un pool de hilos acotado
+
+    Para endpoints `async def`: la consulta síncrona no bloquea el event loop
+    y, como mucho, DB_THREADS consultas se ejecutan a la vez. Cada llamada
+    usa su propia sesión, que se cierra al terminar.
+    """
+    return await _en_hilo(SessionLocal, func, args, kwargs)
+
+async def run_db_lectura(func, *args, **kwargs):
+    """Como run_db, pero con una sesión del pool de solo lectura"""
+    return await _en_hilo(SessionLectura, func, args, kwargs)
+
 def init_db():
     """Crear todas las tablas"""
     Base.metadata.create_all(bind=engine)
+    init_search_index(engine)
+
+    # Fila única con la versión del contenido
+    db = SessionLocal()
+    try:
+        if db.get(ContentVersion, 1) is None:
+            db.add(ContentVersion(id=1, version=0))
+            db.commit()
+    finally:
+        db.close()
+
+
+# ============== Versión del contenido ==============
+
+def marcar_catalogo_modificado(session: Session):
+    """Incrementa la versión del contenido dentro de la transacción actual
+
+    Se llama automáticamente al hacer flush de temas, videos o ejercicios; las
+    escrituras que no pasan por el ORM (sentencias bulk) deben llamarla a mano.
+    """
+    if session.info.get("catalogo_modificado"):
+        return
+    session.info["catalogo_modificado"] = True
+    tabla = ContentVersion.__table__
+    session.connection().execute(
+        update(tabla).where(tabla.c.id == 1).values(version=tabla.c.version + 1)
+    )
+
+@event.listens_for(SessionLocal, "after_flush")
+def _detectar_cambios_catalogo(session, flush_context):
+    cambiados = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, CATALOG_MODELS) for obj in cambiados):
+        marcar_catalogo_modificado(session)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidar_cache(session):
+    if session.info.pop("catalogo_modificado", False):
+        cache.catalogo.invalidar()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_marca(session):
+    session.info.pop("catalogo_modificado", None)
+
+
+# ============== Informe de configuración ==============
+
+def _pragmas_efectivos(engine: Engine) -> dict:
+    with engine.connect() as conn:
+        return {
+            nombre: conn.execute(text(f"PRAGMA {nombre}")).scalar()
+            for nombre in ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout", "query_only")
+        }
+
+def informe_engines() -> dict:
+    """Configuración de los engines de este worker: opciones de pool pasadas y pragmas efectivos"""
+    def _engine(e: Engine) -> dict:
+        datos = {
+            "url": e.url.render_as_string(hide_password=True),
+            "pool": type(e.pool).__name__,
+            # Lo que no aparece usa el valor por defecto de SQLAlchemy
+            "opciones_pool": _opciones_pool.get(e, {}),
+        }
+        if e.dialect.name == "sqlite":
+            datos["pragmas"] = _pragmas_efectivos(e)
+        return datos
+
+    informe = {"pid": os.getpid(), "dialecto": engine.dialect.name, "escritura": _engine(engine)}
+    informe["lectura"] = _engine(engine_lectura) if engine_lectura is not engine else "comparte el engine de escritura"
+    return informe
@@ -0,0 +1,123 @@
+"""
+Escritura diferida (write-behind) para tablas con muchas escrituras pequeñas.
+
+Las filas se acumulan en memoria, coalescidas por clave (si llegan dos para la
+misma clave solo se queda la ganadora), y se vuelcan a la BD en una sola
+transacción cada `intervalo` segundos o en cuanto hay `maximo` pendientes.
+Si el volcado falla, las filas vuelven a la cola para el siguiente intento.
+`apuntar` se puede llamar desde el event loop o desde los hilos de run_db.
+"""
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Hashable
+
+from sqlalchemy.orm import Session
+
+from database import run_db
+
+logger = logging.getLogger(__name__)
+
+
+class VolcadoDiferido:
+    def __init__(
+        self,
+        nombre: str,
+        persistir: Callable[[list[dict], Session], None],
+        gana: Callable[[dict, dict], bool],
+        intervalo: float,
+        maximo: int,
+        tras_volcar: Callable[[], Awaitable[None]] | None = None,
+    ):
+        self.nombre = nombre
+        self._persistir = persistir
+        self._gana = gana  # gana(nueva, actual): si la fila nueva sustituye a la pendiente
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self._tras_volcar = tras_volcar  # tarea periódica opcional después de cada volcado
+        self._lock = threading.Lock()
+        self._pendientes: dict[Hashable, dict] = {}
+        self._tarea: asyncio.Task | None = None
+        self._despertar: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.volcados = 0
+        self.filas_volcadas = 0
+
+    def _fusionar(self, clave: Hashable, fila: dict) -> bool:
+        actual = self._pendientes.get(clave)
+        if actual is not None and not self._gana(fila, actual):
+            return False
+        self._pendientes[clave] = fila
+        return True
+
+    def apuntar(self, clave: Hashable, fila: dict) -> bool:
+        """Encola una fila; devuelve False si pierde frente a una ya pendiente"""
+        with self._lock:
+            aceptada = self._fusionar(clave, fila)
+            lleno = len(self._pendientes) >= self.maximo
+        if lleno and self._despertar is not None:
+            # asyncio.Event no es seguro entre hilos: se activa desde el loop
+            self._loop.call_soon_threadsafe(self._despertar.set)
+        return aceptada
+
+    def descartar(self, clave: Hashable):
+        """Quita una fila pendiente (p. ej. si se borra el registro antes del volcado)"""
+        with self._lock:
+            self._pendientes.pop(clave, None)
+
+    def pendiente(self, clave: Hashable) -> dict | None:
+        """Fila aún sin volcar para `clave`, si la hay"""
+        with self._lock:
+            return self._pendientes.get(clave)
+
+    def pendientes(self) -> dict[Hashable, dict]:
+        with self._lock:
+            return dict(self._pendientes)
+
+    def __len__(self) -> int:
+        return len(self._pendientes)
+
+    async def volcar(self):
+        """Escribe en la BD todo lo pendiente en una transacción"""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        if not pendientes:
+            return
+        try:
+            await run_db(self._persistir, list(pendientes.values()))
+        except Exception:
+            logger.exception("No se pudo volcar %s; se reintentará", self.nombre)
+            with self._lock:
+                for clave, fila in pendientes.items():
+                    self._fusionar(clave, fila)
+            return
+        self.volcados += 1
+        self.filas_volcadas += len(pendientes)
+
+    # ============== Ciclo de vida ==============
+
+    async def iniciar(self):
+        self._despertar = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        await self.volcar()
+
+    async def _bucle(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            await self.volcar()
+            if self._tras_volcar is not None:
+                await self._tras_volcar()
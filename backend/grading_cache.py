@@ -0,0 +1,217 @@
+"""
+Caché persistente de correcciones de /verificar.
+
+La clave es un hash de (ejercicio_id, preguntas, respuestas normalizadas,
+modelo LLM, versión del prompt), así que reenviar la misma respuesta (o una
+que solo difiere en mayúsculas, espacios o puntuación final) devuelve la
+misma nota al instante y sin llamar al LLM.
+
+Dos niveles:
+- memoria: LRU acotado con TTL, por proceso
+- base de datos: tabla `grading_cache`, compartida entre workers, con
+  expiración por TTL y recorte LRU por `last_used_at`
+
+Los aciertos no escriben en la lectura: el uso (`hits`, `last_used_at`) de
+cada acierto, en memoria o en la BD, se acumula por clave y se vuelca en
+diferido cada GRADING_CACHE_FLUSH_INTERVAL segundos (ver diferido.py). Así
+el recorte LRU de la BD ve también las entradas que solo se sirven desde
+memoria, que son justo las más usadas.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+
+from diferido import VolcadoDiferido
+from models import GradingCacheEntry
+
+GRADING_CACHE_TTL = int(os.getenv("GRADING_CACHE_TTL", str(30 * 24 * 3600)))
+GRADING_CACHE_MAX_ENTRIES = int(os.getenv("GRADING_CACHE_MAX_ENTRIES", "50000"))
+GRADING_CACHE_MEMORY_ENTRIES = int(os.getenv("GRADING_CACHE_MEMORY_ENTRIES", "2000"))
+GRADING_CACHE_FLUSH_INTERVAL = float(os.getenv("GRADING_CACHE_FLUSH_INTERVAL", "5"))
+
+# Cada cuántas escrituras se purgan las entradas caducadas/sobrantes de la BD
+_PURGAR_CADA = 100
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, espacios colapsados y sin puntuación final"""
+    texto = unicodedata.normalize("NFKC", texto or "").casefold()
+    texto = re.sub(r"\s+", " ", texto).strip()
+    return texto.rstrip(" .!?;,")
+
+
+def clave_correccion(ejercicio_id: str, respuestas: list, modelo: str, prompt_version: str) -> str:
+    """Hash estable de todo lo que determina la corrección"""
+    partes = {
+        "ejercicio_id": ejercicio_id,
+        "modelo": modelo,
+        "prompt": prompt_version,
+        "respuestas": [
+            [normalizar_texto(r.pregunta), normalizar_texto(r.contexto or ""), normalizar_texto(r.respuesta)]
+            for r in respuestas
+        ],
+    }
+    return hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode()).hexdigest()
+
+
+def persistir_usos(filas: list[dict], db: Session):
+    """Suma los aciertos acumulados y actualiza last_used_at, en una transacción"""
+    tabla = GradingCacheEntry.__table__
+    stmt = (
+        tabla.update()
+        .where(tabla.c.clave == bindparam("b_clave"))
+        .values(hits=tabla.c.hits + bindparam("b_hits"), last_used_at=bindparam("b_last_used_at"))
+    )
+    db.execute(stmt, [
+        {"b_clave": f["clave"], "b_hits": f["hits"], "b_last_used_at": f["last_used_at"]} for f in filas
+    ])
+    db.commit()
+
+
+def _uso_mas_reciente(nueva: dict, actual: dict) -> bool:
+    return nueva["last_used_at"] >= actual["last_used_at"]
+
+
+class GradingCache:
+    def __init__(
+        self,
+        ttl: int = GRADING_CACHE_TTL,
+        max_entradas: int = GRADING_CACHE_MAX_ENTRIES,
+        max_memoria: int = GRADING_CACHE_MEMORY_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_memoria = max_memoria
+        self._memoria: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._escrituras = 0
+        self._usos = VolcadoDiferido(
+            "grading_cache (uso)", persistir_usos, _uso_mas_reciente, GRADING_CACHE_FLUSH_INTERVAL, 1000,
+        )
+        self.stats = {"hits_memoria": 0, "hits_bd": 0, "misses": 0, "escrituras": 0}
+
+    def _guardar_en_memoria(self, clave: str, resultado: dict, expira_en: float):
+        with self._lock:
+            self._memoria[clave] = (resultado, expira_en)
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def get(self, db: Session, clave: str) -> dict | None:
+        """Resultado cacheado para `clave`, o None si no existe o ha caducado"""
+        return self.get_primera(db, [clave])
+
+    def get_primera(self, db: Session, claves: list[str]) -> dict | None:
+        """Resultado de la primera clave con entrada (un solo fallo en las estadísticas si no hay ninguna)"""
+        for clave in claves:
+            resultado = self._buscar(db, clave)
+            if resultado is not None:
+                return resultado
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _buscar(self, db: Session, clave: str) -> dict | None:
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                resultado, expira_en = entrada
+                if expira_en > ahora:
+                    self._memoria.move_to_end(clave)
+                    self._sumar_uso(clave)
+                    self.stats["hits_memoria"] += 1
+                    return resultado
+                del self._memoria[clave]
+
+        fila = db.get(GradingCacheEntry, clave)
+        if fila is not None:
+            caduca = fila.created_at + timedelta(seconds=self.ttl)
+            if caduca > datetime.utcnow():
+                self._apuntar_uso(clave)
+                resultado = json.loads(fila.resultado)
+                self._guardar_en_memoria(clave, resultado, ahora + (caduca - datetime.utcnow()).total_seconds())
+                with self._lock:
+                    self.stats["hits_bd"] += 1
+                return resultado
+        return None
+
+    def _apuntar_uso(self, clave: str):
+        with self._lock:
+            self._sumar_uso(clave)
+
+    def _sumar_uso(self, clave: str):
+        # Con self._lock tomado: dos hilos acertando la misma clave no pierden aciertos
+        pendiente = self._usos.pendiente(clave)
+        hits = (pendiente["hits"] if pendiente is not None else 0) + 1
+        self._usos.apuntar(clave, {"clave": clave, "hits": hits, "last_used_at": datetime.utcnow()})
+
+    def put(self, db: Session, clave: str, ejercicio_id: str, resultado: dict):
+        """Guarda un resultado en ambos niveles"""
+        self._guardar_en_memoria(clave, resultado, time.time() + self.ttl)
+
+        ahora = datetime.utcnow()
+        db.merge(GradingCacheEntry(
+            clave=clave,
+            ejercicio_id=ejercicio_id,
+            resultado=json.dumps(resultado, ensure_ascii=False),
+            hits=0,
+            created_at=ahora,
+            last_used_at=ahora,
+        ))
+        db.commit()
+
+        with self._lock:
+            self.stats["escrituras"] += 1
+            self._escrituras += 1
+            purgar = self._escrituras % _PURGAR_CADA == 0
+        if purgar:
+            self.purgar(db)
+
+    def purgar(self, db: Session):
+        """Borra las entradas caducadas y, si sobran, las menos usadas recientemente"""
+        limite = datetime.utcnow() - timedelta(seconds=self.ttl)
+        db.query(GradingCacheEntry).filter(GradingCacheEntry.created_at < limite).delete(synchronize_session=False)
+
+        sobrantes = db.query(GradingCacheEntry).count() - self.max_entradas
+        if sobrantes > 0:
+            antiguas = (
+                db.query(GradingCacheEntry.clave)
+                .order_by(GradingCacheEntry.last_used_at)
+                .limit(sobrantes)
+                .subquery()
+            )
+            db.query(GradingCacheEntry).filter(
+                GradingCacheEntry.clave.in_(antiguas.select())
+            ).delete(synchronize_session=False)
+        db.commit()
+
+    def resumen(self) -> dict:
+        """Contadores de aciertos/fallos para estimar las llamadas al LLM ahorradas"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entradas_memoria"] = len(self._memoria)
+        stats["usos_pendientes"] = len(self._usos)
+        consultas = stats["hits_memoria"] + stats["hits_bd"] + stats["misses"]
+        stats["llamadas_llm_ahorradas"] = stats["hits_memoria"] + stats["hits_bd"]
+        stats["hit_ratio"] = round(stats["llamadas_llm_ahorradas"] / consultas, 4) if consultas else 0.0
+        return stats
+
+    async def iniciar(self):
+        await self._usos.iniciar()
+
+    async def detener(self):
+        await self._usos.detener()
+
+
+# Instancia compartida por /verificar
+correcciones = GradingCache()
@@ -0,0 +1,385 @@
+"""
+Importador de contenido (temas, videos y ejercicios) desde ficheros JSONL/JSON.
+
+    python importar.py contenido.jsonl videos_canal.jsonl --lote 500
+    python importar.py ejercicios.json --dry-run
+
+Cada registro es un objeto con `entidad` = "tema" | "video" | "ejercicio":
+
+    {"entidad": "tema", "slug": "rag", "titulo": "RAG", "descripcion": "...", "orden": 5}
+    {"entidad": "video", "tema": "rag", "youtube_id": "abc", "titulo": "...", "tags": ["rag", "python"]}
+    {"entidad": "ejercicio", "id": "rag-basics", "tema": "rag", "titulo": "...", "tipo": "quiz", "preguntas": [...]}
+
+Los `.jsonl` se leen en streaming, línea a línea; los `.json` pueden ser un
+registro o una lista. Los registros se validan y se aplican por lotes, con una
+transacción por lote y sentencias en bloque: los nuevos se insertan, los que
+cambian se actualizan y los idénticos (misma huella de contenido) se saltan,
+así que reimportar el mismo fichero no hace nada.
+
+Identidad de cada registro:
+- tema: `slug` (el `id` solo se usa al crearlo)
+- video: (tema, youtube_id), o (tema, titulo) si no hay youtube_id
+- ejercicio: `id`
+
+Solo se actualizan los campos presentes en el registro. Un tema debe aparecer
+antes que (o en el mismo lote que) los videos y ejercicios que lo referencian.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Annotated, Iterable, Iterator, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, field_validator, model_validator
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, init_db, marcar_catalogo_modificado
+from models import Tema, Video, Ejercicio, contenido_json
+
+LOTE_POR_DEFECTO = 500
+
+
+# ============== Registros ==============
+
+class TemaImport(BaseModel):
+    entidad: Literal["tema"]
+    slug: str = Field(min_length=1)
+    id: Optional[str] = None
+    titulo: Optional[str] = None
+    descripcion: Optional[str] = None
+    orden: Optional[int] = None
+
+
+class VideoImport(BaseModel):
+    entidad: Literal["video"]
+    tema: str = Field(min_length=1)  # slug del tema
+    youtube_id: str = ""
+    titulo: Optional[str] = None
+    descripcion: Optional[str] = None
+    tags: Optional[str] = None
+    orden: Optional[int] = None
+
+    @field_validator("tags", mode="before")
+    @classmethod
+    def _tags_como_texto(cls, value):
+        if isinstance(value, list):
+            return ", ".join(str(t).strip() for t in value if str(t).strip())
+        return value
+
+    def clave(self) -> str:
+        return self.youtube_id or f"titulo:{self.titulo or ''}"
+
+
+class EjercicioImport(BaseModel):
+    entidad: Literal["ejercicio"]
+    id: str = Field(min_length=1)
+    tema: Optional[str] = None  # slug del tema (obligatorio al crear)
+    titulo: Optional[str] = None
+    tipo: Optional[Literal["quiz", "codigo", "escrito"]] = None
+    contenido: Optional[Union[list, dict]] = None
+    orden: Optional[int] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def _preguntas_como_contenido(cls, data):
+        # Formato de los antiguos ejercicios/*.json: las preguntas van en `preguntas`
+        if isinstance(data, dict) and "contenido" not in data and "preguntas" in data:
+            data = {k: v for k, v in data.items() if k != "preguntas"} | {"contenido": data["preguntas"]}
+        return data
+
+    @field_validator("contenido")
+    @classmethod
+    def _contenido_estricto(cls, value):
+        # Se comprueba al leer: en el volcado en bloque un error tumbaría todo el lote
+        if value is not None:
+            contenido_json(value)
+        return value
+
+
+Registro = Annotated[Union[TemaImport, VideoImport, EjercicioImport], Field(discriminator="entidad")]
+_validador = TypeAdapter(Registro)
+
+
+def huella(campos: dict) -> str:
+    """Hash estable de los campos de un registro"""
+    return hashlib.sha1(
+        json.dumps(campos, sort_keys=True, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
+
+
+def _campos(registro: BaseModel, *excluir: str) -> dict:
+    """Campos presentes en el registro (los ausentes no se tocan al actualizar)"""
+    return registro.model_dump(exclude_unset=True, exclude={"entidad", *excluir})
+
+
+# ============== Lectura ==============
+
+@dataclass
+class Informe:
+    leidos: int = 0
+    errores: list[str] = field(default_factory=list)
+    # entidad -> {"insertados": n, "actualizados": n, "sin_cambios": n}
+    por_entidad: dict[str, dict[str, int]] = field(default_factory=dict)
+    segundos: float = 0.0
+
+    def contar(self, entidad: str, resultado: str, n: int = 1):
+        cuentas = self.por_entidad.setdefault(entidad, {"insertados": 0, "actualizados": 0, "sin_cambios": 0})
+        cuentas[resultado] += n
+
+    def error(self, origen: str, mensaje: str):
+        self.errores.append(f"{origen}: {mensaje}")
+
+    def resumen(self) -> dict:
+        return {
+            "leidos": self.leidos,
+            "errores": len(self.errores),
+            "por_entidad": self.por_entidad,
+            "segundos": round(self.segundos, 3),
+            "registros_por_segundo": round(self.leidos / self.segundos, 1) if self.segundos else None,
+        }
+
+
+def leer_registros(ruta: Path) -> Iterator[tuple[str, dict]]:
+    """(origen, objeto) por cada registro; los .jsonl sin cargar el fichero entero"""
+    if ruta.suffix == ".jsonl":
+        with ruta.open(encoding="utf-8") as f:
+            for n, linea in enumerate(f, start=1):
+                if linea.strip():
+                    yield f"{ruta.name}:{n}", linea
+        return
+
+    datos = json.loads(ruta.read_text(encoding="utf-8"))
+    for n, objeto in enumerate(datos if isinstance(datos, list) else [datos], start=1):
+        yield f"{ruta.name}[{n}]", objeto
+
+
+def validar(registros: Iterable[tuple[str, Union[str, dict]]], informe: Informe) -> Iterator[tuple[str, Registro]]:
+    for origen, crudo in registros:
+        informe.leidos += 1
+        try:
+            objeto = json.loads(crudo) if isinstance(crudo, str) else crudo
+            yield origen, _validador.validate_python(objeto)
+        except (json.JSONDecodeError, ValidationError) as e:
+            informe.error(origen, str(e).splitlines()[0] if isinstance(e, json.JSONDecodeError) else _resumir(e))
+
+
+def _resumir(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()[:3])
+
+
+# ============== Escritura por lotes ==============
+
+def _aplicar_temas(db: Session, temas: list[tuple[str, TemaImport]], slugs: dict[str, str], informe: Informe):
+    ultimos = {r.slug: (origen, r) for origen, r in temas}
+    existentes = {
+        t.slug: t for t in db.execute(select(Tema).where(Tema.slug.in_(list(ultimos)))).scalars()
+    }
+    nuevos, cambios = [], []
+    for slug, (origen, r) in ultimos.items():
+        campos = _campos(r, "id")
+        actual = existentes.get(slug)
+        if actual is None:
+            if not r.titulo:
+                informe.error(origen, f"el tema '{slug}' no existe y falta titulo para crearlo")
+                continue
+            nuevos.append({"id": r.id or str(uuid.uuid4()), **campos})
+        elif huella({k: getattr(actual, k) for k in campos}) != huella(campos):
+            cambios.append({"id": actual.id, **campos})
+        else:
+            informe.contar("tema", "sin_cambios")
+
+    if nuevos:
+        db.execute(insert(Tema), nuevos)
+    if cambios:
+        db.execute(update(Tema), cambios)
+    informe.contar("tema", "insertados", len(nuevos))
+    informe.contar("tema", "actualizados", len(cambios))
+    for fila in nuevos:
+        slugs[fila["slug"]] = fila["id"]
+    return bool(nuevos or cambios)
+
+
+def _aplicar_videos(db: Session, videos: list[tuple[str, VideoImport]], slugs: dict[str, str], informe: Informe):
+    ultimos: dict[tuple[str, str], tuple[str, VideoImport]] = {}
+    for origen, r in videos:
+        tema_id = slugs.get(r.tema)
+        if tema_id is None:
+            informe.error(origen, f"tema '{r.tema}' desconocido")
+            continue
+        ultimos[(tema_id, r.clave())] = (origen, r)
+    if not ultimos:
+        return False
+
+    # Una consulta por lote, acotada a los temas y claves del lote
+    tema_ids = {tema_id for tema_id, _ in ultimos}
+    youtube_ids = {r.youtube_id for _, r in ultimos.values() if r.youtube_id}
+    titulos = {r.titulo or "" for _, r in ultimos.values() if not r.youtube_id}
+    consulta = select(Video).where(
+        Video.tema_id.in_(tema_ids),
+        or_(Video.youtube_id.in_(youtube_ids), Video.titulo.in_(titulos)),
+    )
+    existentes = {}
+    for v in db.execute(consulta).scalars():
+        existentes.setdefault((v.tema_id, v.youtube_id), v)
+        existentes.setdefault((v.tema_id, f"titulo:{v.titulo or ''}"), v)
+
+    nuevos, cambios = [], []
+    for (tema_id, clave), (origen, r) in ultimos.items():
+        campos = _campos(r, "tema")
+        actual = existentes.get((tema_id, clave))
+        if actual is None:
+            nuevos.append({"tema_id": tema_id, "youtube_id": r.youtube_id, **campos})
+        elif huella({k: getattr(actual, k) for k in campos}) != huella(campos):
+            cambios.append({"id": actual.id, **campos})
+        else:
+            informe.contar("video", "sin_cambios")
+
+    if nuevos:
+        db.execute(insert(Video), nuevos)
+    if cambios:
+        db.execute(update(Video), cambios)
+    informe.contar("video", "insertados", len(nuevos))
+    informe.contar("video", "actualizados", len(cambios))
+    return bool(nuevos or cambios)
+
+
+def _aplicar_ejercicios(db: Session, ejercicios: list[tuple[str, EjercicioImport]], slugs: dict[str, str], informe: Informe):
+    ultimos = {r.id: (origen, r) for origen, r in ejercicios}
+    existentes = {
+        e.id: e for e in db.execute(select(Ejercicio).where(Ejercicio.id.in_(list(ultimos)))).scalars()
+    }
+    nuevos, cambios = [], []
+    for ejercicio_id, (origen, r) in ultimos.items():
+        campos = _campos(r, "tema")
+        if r.tema is not None:
+            if r.tema not in slugs:
+                informe.error(origen, f"tema '{r.tema}' desconocido")
+                continue
+            campos["tema_id"] = slugs[r.tema]
+
+        actual = existentes.get(ejercicio_id)
+        if actual is None:
+            faltan = [c for c in ("tema_id", "titulo", "tipo", "contenido") if campos.get(c) is None]
+            if faltan:
+                informe.error(origen, f"el ejercicio '{ejercicio_id}' no existe y faltan {', '.join(faltan)}")
+                continue
+            nuevos.append(campos)
+            continue
+
+        guardado = {k: getattr(actual, k) for k in campos}
+        if "contenido" in guardado:
+            guardado["contenido"] = json.loads(guardado["contenido"])
+        if huella(guardado) != huella(campos):
+            cambios.append(campos)
+        else:
+            informe.contar("ejercicio", "sin_cambios")
+
+    # Las sentencias en bloque no pasan por el validador del modelo: se serializa aquí
+    for fila in nuevos + cambios:
+        if "contenido" in fila:
+            fila["contenido"] = contenido_json(fila["contenido"])
+    if nuevos:
+        db.execute(insert(Ejercicio), nuevos)
+    if cambios:
+        db.execute(update(Ejercicio), cambios)
+    informe.contar("ejercicio", "insertados", len(nuevos))
+    informe.contar("ejercicio", "actualizados", len(cambios))
+    return bool(nuevos or cambios)
+
+
+def aplicar_lote(db: Session, lote: list[tuple[str, Registro]], slugs: dict[str, str], informe: Informe, dry_run: bool = False):
+    """Aplica un lote en una transacción: primero temas, luego videos y ejercicios"""
+    por_entidad: dict[str, list] = {"tema": [], "video": [], "ejercicio": []}
+    for origen, registro in lote:
+        por_entidad[registro.entidad].append((origen, registro))
+
+    # Copia: si el lote se descarta, los temas nuevos no deben quedar resolubles
+    slugs_lote = dict(slugs)
+    try:
+        cambiado = False
+        if por_entidad["tema"]:
+            cambiado |= _aplicar_temas(db, por_entidad["tema"], slugs_lote, informe)
+        if por_entidad["video"]:
+            cambiado |= _aplicar_videos(db, por_entidad["video"], slugs_lote, informe)
+        if por_entidad["ejercicio"]:
+            cambiado |= _aplicar_ejercicios(db, por_entidad["ejercicio"], slugs_lote, informe)
+
+        if dry_run:
+            db.rollback()
+            slugs.update(slugs_lote)
+            return
+        if cambiado:
+            # Las sentencias en bloque no disparan after_flush: se avisa a la caché a mano
+            marcar_catalogo_modificado(db)
+        db.commit()
+        slugs.update(slugs_lote)
+    except Exception:
+        db.rollback()
+        raise
+
+
+def _por_lotes(registros: Iterable, tamano: int) -> Iterator[list]:
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def importar_registros(
+    registros: Iterable[tuple[str, Union[str, dict]]],
+    tamano_lote: int = LOTE_POR_DEFECTO,
+    dry_run: bool = False,
+) -> Informe:
+    """Valida e importa registros (origen, JSON o dict) por lotes"""
+    init_db()
+    informe = Informe()
+    inicio = time.perf_counter()
+    db = SessionLocal()
+    try:
+        slugs = dict(db.execute(select(Tema.slug, Tema.id)).all())
+        for lote in _por_lotes(validar(registros, informe), tamano_lote):
+            aplicar_lote(db, lote, slugs, informe, dry_run=dry_run)
+    finally:
+        db.close()
+    informe.segundos = time.perf_counter() - inicio
+    return informe
+
+
+def importar_ficheros(rutas: list[Path], tamano_lote: int = LOTE_POR_DEFECTO, dry_run: bool = False) -> Informe:
+    def todos():
+        for ruta in rutas:
+            yield from leer_registros(ruta)
+    return importar_registros(todos(), tamano_lote, dry_run)
+
+
+def mostrar(informe: Informe, max_errores: int = 20):
+    for error in informe.errores[:max_errores]:
+        print(f"ERROR {error}")
+    if len(informe.errores) > max_errores:
+        print(f"... y {len(informe.errores) - max_errores} errores más")
+    print(json.dumps(informe.resumen(), indent=2, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ficheros", nargs="+", type=Path)
+    parser.add_argument("--lote", type=int, default=LOTE_POR_DEFECTO, help="registros por transacción")
+    parser.add_argument("--dry-run", action="store_true", help="validar y contar sin escribir nada")
+    args = parser.parse_args()
+
+    informe = importar_ficheros(args.ficheros, args.lote, args.dry_run)
+    mostrar(informe)
+    sys.exit(1 if informe.errores else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Pre-router local de intenciones para /chat.
+
+La respuesta de `redirigir_temas_internos` depende solo del mapa de alias
+(`TEMAS_ALIAS`), así que cuando el último mensaje del usuario menciona
+claramente un tema del curso se ejecuta esa tool aquí, sin red, y su
+resultado se inyecta en el historial. El LLM ya recibe el enlace en la
+primera llamada y no necesita una ronda extra solo para elegir la tool.
+
+El texto se compara (sin acentos ni mayúsculas) con dos expresiones
+regulares compiladas: una con los alias de temas y otra con los tags de los
+videos de cada tema. La confianza es la fracción de la puntuación que se
+lleva el mejor tema; solo se atajan las peticiones que superan
+INTENT_ROUTER_THRESHOLD.
+
+Atajar no impide que el LLM pida otras tools, así que solo se cuenta una
+ronda ahorrada cuando el turno atajado termina en una única llamada al LLM.
+"""
+import json
+import os
+import re
+import threading
+import unicodedata
+import uuid
+from collections import defaultdict
+
+from sqlalchemy.orm import Session
+
+from cache import catalogo
+from chat_tools import TEMAS_ALIAS, ejecutar_tool
+from models import Tema, Video
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.75"))
+
+# Alias que aparecen en casi cualquier pregunta y no bastan por sí solos
+ALIAS_GENERICOS = {"agentes", "agentes-ia", "introduccion", "herramientas", "comunicacion", "cli"}
+
+PESO_ALIAS = 1.0
+PESO_ALIAS_GENERICO = 0.4
+PESO_TAG = 0.5
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin acentos"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _clave(texto: str) -> str:
+    """Forma canónica de un alias/tag encontrado: palabras unidas por guiones"""
+    return "-".join(re.split(r"[\s-]+", texto.strip()))
+
+
+def _compilar(terminos) -> re.Pattern | None:
+    # Los más largos primero para que "memoria-episodica" gane a "memoria"
+    terminos = sorted({_clave(normalizar(t)) for t in terminos if t.strip()}, key=len, reverse=True)
+    if not terminos:
+        return None
+    alternativas = "|".join(r"[\s-]+".join(map(re.escape, t.split("-"))) for t in terminos)
+    return re.compile(rf"\b(?:{alternativas})\b")
+
+
+class IntentRouter:
+    def __init__(self, alias: dict[str, str], umbral: float = INTENT_ROUTER_THRESHOLD):
+        self.umbral = umbral
+        self._alias = {_clave(normalizar(a)): slug for a, slug in alias.items()}
+        self._patron_alias = _compilar(self._alias)
+        self._tags: dict[str, set[str]] = {}
+        self._patron_tags: re.Pattern | None = None
+        self._version: int | None = None
+        self._lock = threading.Lock()
+        self.stats = {"evaluados": 0, "atajados": 0, "rondas_ahorradas": 0}
+
+    def actualizar_tags(self, db: Session):
+        """Recompila el patrón de tags si el catálogo ha cambiado"""
+        version = catalogo.version(db)
+        if version == self._version:
+            return
+
+        tags: dict[str, set[str]] = defaultdict(set)
+        filas = db.query(Video.tags, Tema.slug).join(Tema, Video.tema_id == Tema.id).all()
+        for tags_video, slug in filas:
+            for tag in (tags_video or "").split(","):
+                if tag.strip():
+                    tags[_clave(normalizar(tag))].add(slug)
+
+        patron = _compilar(tags)
+        with self._lock:
+            self._tags = dict(tags)
+            self._patron_tags = patron
+            self._version = version
+
+    def clasificar(self, texto: str) -> tuple[str | None, float]:
+        """Devuelve (slug del tema más probable, confianza entre 0 y 1)"""
+        texto = normalizar(texto)
+        puntos: dict[str, float] = defaultdict(float)
+
+        for encontrado in {_clave(m.group(0)) for m in self._patron_alias.finditer(texto)}:
+            peso = PESO_ALIAS_GENERICO if encontrado in ALIAS_GENERICOS else PESO_ALIAS
+            puntos[self._alias[encontrado]] += peso
+
+        with self._lock:
+            patron_tags, tags = self._patron_tags, self._tags
+        if patron_tags is not None:
+            for encontrado in {_clave(m.group(0)) for m in patron_tags.finditer(texto)}:
+                # Un tag compartido por varios temas reparte su peso
+                slugs = tags.get(encontrado, ())
+                for slug in slugs:
+                    puntos[slug] += PESO_TAG / len(slugs)
+
+        if not puntos:
+            return None, 0.0
+
+        slug, mejor = max(puntos.items(), key=lambda item: item[1])
+        # Fracción del total, penalizada si la evidencia es escasa (< 1 alias específico)
+        confianza = (mejor / sum(puntos.values())) * min(1.0, mejor)
+        return slug, round(confianza, 4)
+
+    def enrutar(self, messages: list[dict]) -> list[dict]:
+        """
+        Si el último mensaje del usuario apunta con confianza a un tema,
+        devuelve los mensajes (assistant con tool_call + resultado de la tool)
+        que hay que añadir al historial. Si no, una lista vacía.
+        """
+        ultimo = messages[-1] if messages else None
+        if ultimo is None or ultimo["role"] != "user" or not ultimo.get("content"):
+            return []
+
+        slug, confianza = self.clasificar(ultimo["content"])
+        with self._lock:
+            self.stats["evaluados"] += 1
+            if slug is None or confianza < self.umbral:
+                return []
+            self.stats["atajados"] += 1
+        # Único entre reinicios y workers: estos ids se guardan en las sesiones de chat
+        call_id = f"local-{uuid.uuid4().hex}"
+
+        args = {"slug_tema": slug}
+        return [
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": "redirigir_temas_internos", "arguments": json.dumps(args)},
+                }],
+            },
+            {
+                "role": "tool",
+                "tool_call_id": call_id,
+                "name": "redirigir_temas_internos",
+                # Esta tool no consulta la BD: no hace falta sesión
+                "content": ejecutar_tool("redirigir_temas_internos", args, db=None),
+            },
+        ]
+
+    def registrar_turno(self, llamadas_llm: int):
+        """Tras un turno atajado: sin más rondas de tools, el atajo ahorró una llamada"""
+        if llamadas_llm == 1:
+            with self._lock:
+                self.stats["rondas_ahorradas"] += 1
+
+    def resumen(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["umbral"] = self.umbral
+        stats["activo"] = INTENT_ROUTER_ENABLED
+        return stats
+
+
+# Instancia compartida por los endpoints de chat
+router = IntentRouter(TEMAS_ALIAS)
@@ -0,0 +1,316 @@
+"""
+Cliente HTTP compartido para las llamadas a OpenRouter.
+
+Se crea una sola vez en el `lifespan` de la app y lo reutilizan todos los
+endpoints, de modo que las conexiones TCP/TLS con openrouter.ai se mantienen
+vivas entre peticiones en lugar de abrir una nueva por cada llamada.
+
+Todas las llamadas pasan además por un dispatcher que limita cuántas hay en
+vuelo a la vez (con cola por prioridades: el chat interactivo antes que las
+correcciones) y reintenta los fallos transitorios (429, 5xx, errores de
+red) con backoff exponencial con jitter, respetando `Retry-After`.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import httpx
+
+from metrics import Gauge, llm_duracion, llm_peticiones, llm_primer_token, registro, registrar_uso_llm
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+LLM_MODEL = "x-ai/grok-4.1-fast"
+
+# Pool de conexiones (configurable por entorno)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+
+# Timeouts por fase (segundos)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))
+LLM_WRITE_TIMEOUT = float(os.getenv("LLM_WRITE_TIMEOUT", "10"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "5"))
+
+# Dispatcher: concurrencia, cola y reintentos
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_RETRY_AFTER_MAX = float(os.getenv("LLM_RETRY_AFTER_MAX", "20"))
+
+# Carriles de prioridad (menor = antes)
+PRIORIDAD_CHAT = 0
+PRIORIDAD_CORRECCION = 1
+
+# Respuestas de OpenRouter que merece la pena reintentar
+ESTADOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+
+
+class LLMSaturado(Exception):
+    """No se consiguió turno para llamar al LLM antes del límite de espera en cola"""
+
+
+def crear_cliente() -> httpx.AsyncClient:
+    """Construye el cliente con pool keep-alive, HTTP/2 y timeouts por fase"""
+    return httpx.AsyncClient(
+        http2=LLM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=LLM_CONNECT_TIMEOUT,
+            read=LLM_READ_TIMEOUT,
+            write=LLM_WRITE_TIMEOUT,
+            pool=LLM_POOL_TIMEOUT,
+        ),
+        headers={
+            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+            "Content-Type": "application/json",
+        },
+    )
+
+
+async def iniciar_cliente():
+    """Abre el cliente compartido (llamar en el arranque de la app)"""
+    global _client
+    if _client is None:
+        _client = crear_cliente()
+
+
+async def cerrar_cliente():
+    """Cierra el cliente compartido y sus conexiones (llamar al apagar)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Devuelve el cliente compartido, creándolo si aún no existe"""
+    global _client
+    if _client is None:
+        _client = crear_cliente()
+    return _client
+
+
+class Dispatcher:
+    """Semáforo con cola por prioridad (FIFO dentro de cada carril) y límite de espera"""
+
+    def __init__(self, max_en_vuelo: int = LLM_MAX_IN_FLIGHT, timeout_cola: float = LLM_QUEUE_TIMEOUT):
+        self.max_en_vuelo = max_en_vuelo
+        self.timeout_cola = timeout_cola
+        self.en_vuelo = 0
+        self._cola: list[tuple[int, int, asyncio.Future]] = []
+        self._turno = itertools.count()
+
+    @property
+    def en_cola(self) -> int:
+        return sum(1 for _, _, fut in self._cola if not fut.done())
+
+    async def _adquirir(self, prioridad: int):
+        if self.en_vuelo < self.max_en_vuelo and not self.en_cola:
+            self.en_vuelo += 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._cola, (prioridad, next(self._turno), fut))
+        try:
+            await asyncio.wait_for(fut, self.timeout_cola)
+        except asyncio.TimeoutError:
+            raise LLMSaturado(f"Sin turno para el LLM tras {self.timeout_cola:.0f}s en cola")
+        except asyncio.CancelledError:
+            # Si el turno llegó justo antes de cancelar, se cede al siguiente
+            if fut.done() and not fut.cancelled():
+                self._liberar()
+            raise
+
+    def _liberar(self):
+        # El hueco pasa directamente al siguiente que siga esperando
+        while self._cola:
+            _, _, fut = heapq.heappop(self._cola)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.en_vuelo -= 1
+
+    @asynccontextmanager
+    async def turno(self, prioridad: int = PRIORIDAD_CHAT):
+        await self._adquirir(prioridad)
+        try:
+            yield
+        finally:
+            self._liberar()
+
+
+dispatcher = Dispatcher()
+
+registro.registrar(Gauge(
+    "llm_in_flight", "Llamadas al LLM en curso", funcion=lambda: dispatcher.en_vuelo,
+))
+registro.registrar(Gauge(
+    "llm_queue_depth", "Llamadas al LLM esperando turno", funcion=lambda: dispatcher.en_cola,
+))
+
+
+def _cuerpo(payload: dict | bytes) -> dict:
+    """Argumento de httpx para el cuerpo: JSON ya codificado (ver prefijo.py) o un dict"""
+    return {"content": payload} if isinstance(payload, bytes) else {"json": payload}
+
+
+def _con_stream(payload: dict | bytes) -> dict | bytes:
+    if isinstance(payload, bytes):
+        # Se añaden las opciones antes de la llave de cierre del objeto
+        return payload[:-1] + b',"stream":true,"stream_options":{"include_usage":true}}'
+    return {**payload, "stream": True, "stream_options": {"include_usage": True}}
+
+
+def _registrar_llamada(fase: str, estado: str, inicio: float):
+    llm_peticiones.inc(fase, estado)
+    llm_duracion.observe(time.perf_counter() - inicio, fase, estado)
+
+
+def _estado_error(e: Exception) -> str:
+    if isinstance(e, LLMSaturado):
+        return "saturado"
+    if isinstance(e, httpx.HTTPStatusError):
+        return str(e.response.status_code)
+    return "error"
+
+
+def _espera_retry_after(response: httpx.Response) -> float | None:
+    """Segundos indicados en la cabecera Retry-After (en segundos o como fecha HTTP)"""
+    valor = response.headers.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (fecha - datetime.now(timezone.utc)).total_seconds())
+
+
+def _backoff(intento: int, retry_after: float | None) -> float:
+    """Backoff exponencial con jitter completo; Retry-After manda si viene"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, LLM_BACKOFF_BASE)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** intento))
+
+
+def _reintentable(response: httpx.Response, intento: int) -> float | None:
+    """Segundos a esperar antes de reintentar, o None si no hay que reintentar"""
+    if response.status_code not in ESTADOS_REINTENTABLES or intento >= LLM_MAX_RETRIES:
+        return None
+    retry_after = _espera_retry_after(response)
+    if retry_after is not None and retry_after > LLM_RETRY_AFTER_MAX:
+        return None
+    return _backoff(intento, retry_after)
+
+
+async def completar(payload: dict | bytes, prioridad: int = PRIORIDAD_CHAT, fase: str = "otro") -> dict:
+    """Envía una petición de chat completion a OpenRouter y devuelve el JSON
+
+    `payload` puede ser un dict o el cuerpo ya codificado en JSON.
+    `fase` solo sirve para etiquetar las métricas (chat_primera, verificar...).
+    """
+    inicio = time.perf_counter()
+    try:
+        data = await _completar(payload, prioridad)
+    except Exception as e:
+        _registrar_llamada(fase, _estado_error(e), inicio)
+        raise
+    _registrar_llamada(fase, "200", inicio)
+    registrar_uso_llm(fase, data.get("usage"))
+    return data
+
+
+async def _completar(payload: dict | bytes, prioridad: int) -> dict:
+    for intento in range(LLM_MAX_RETRIES + 1):
+        async with dispatcher.turno(prioridad):
+            try:
+                response = await get_client().post(OPENROUTER_URL, **_cuerpo(payload))
+            except httpx.TransportError:
+                if intento >= LLM_MAX_RETRIES:
+                    raise
+                espera = _backoff(intento, None)
+            else:
+                espera = _reintentable(response, intento)
+                if espera is None:
+                    response.raise_for_status()
+                    return response.json()
+
+        # El turno se libera mientras se espera para reintentar
+        await asyncio.sleep(espera)
+
+
+async def completar_stream(payload: dict | bytes, prioridad: int = PRIORIDAD_CHAT, fase: str = "otro"):
+    """
+    Envía una petición con `stream: true` y va devolviendo cada chunk
+    (ya parseado) de la respuesta SSE de OpenRouter.
+
+    Solo se reintenta si el fallo ocurre antes de recibir el primer chunk.
+    """
+    inicio = time.perf_counter()
+    estado = "cancelado"
+    primero = True
+    try:
+        async for chunk in _completar_stream(payload, prioridad):
+            if primero:
+                # Incluye cola y prefill: es donde se nota la caché de prompt
+                llm_primer_token.observe(time.perf_counter() - inicio, fase)
+                primero = False
+            # Con include_usage, el último chunk trae el consumo de tokens
+            if chunk.get("usage"):
+                registrar_uso_llm(fase, chunk["usage"])
+            yield chunk
+        estado = "200"
+    except Exception as e:
+        estado = _estado_error(e)
+        raise
+    finally:
+        _registrar_llamada(fase, estado, inicio)
+
+
+async def _completar_stream(payload: dict | bytes, prioridad: int):
+    payload = _con_stream(payload)
+    for intento in range(LLM_MAX_RETRIES + 1):
+        espera = None
+        async with dispatcher.turno(prioridad):
+            try:
+                async with get_client().stream("POST", OPENROUTER_URL, **_cuerpo(payload)) as response:
+                    espera = _reintentable(response, intento)
+                    if espera is None:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            # OpenRouter intercala comentarios (": OPENROUTER PROCESSING") y líneas vacías
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            yield json.loads(data)
+                        return
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if intento >= LLM_MAX_RETRIES:
+                    raise
+                espera = _backoff(intento, None)
+
+        await asyncio.sleep(espera)
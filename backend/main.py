@@ -1,30 +1,72 @@
 import json
 import os
 from pathlib import Path
+from datetime import datetime
 from typing import Optional
 from contextlib import asynccontextmanager
 
 import httpx
-from fastapi import FastAPI, HTTPException, Depends
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from database import init_db, get_db
-from crud import get_all_temas, get_tema_by_slug, get_ejercicio_by_id
-from models import TemaListResponse, TemaDetailResponse, Video
-from sqlalchemy import or_
+from database import init_db, get_db_lectura, run_db_lectura, engine, engine_lectura, informe_engines
+from crud import get_all_temas_con_totales, get_tema_by_slug, get_ejercicio_by_id
+from models import TemaListResponse, TemaParcialResponse, EjercicioResponse
+from llm import (
+    OPENROUTER_API_KEY, LLM_QUEUE_TIMEOUT, LLMSaturado,
+    iniciar_cliente, cerrar_cliente, completar, completar_stream,
+)
+from cache import catalogo, responder
+from metrics import MetricsMiddleware, chat_tokens_ahorrados, instrumentar_engine, registro, tokens_cacheados
+from intent_router import router, INTENT_ROUTER_ENABLED
+from grading_cache import correcciones
+from grading import (
+    VERIFICAR_LOTE_MAX_ENVIOS, RespuestaInvalida, buscar_correccion_cacheada, corregir, corregir_lote,
+)
+from serializers import temas_list_json, tema_detail_json, ejercicio_json
+from snapshot import exportar, manifest
+from seleccion import Pagina, SeleccionInvalida, decodificar_cursor, parsear_campos, tema_parcial_json
+from ranking import ranking, normalizar_nickname, normalizar_puntuacion
+from progreso import progreso, ejercicios_existentes, PROGRESO_SYNC_MAX_EVENTOS
+from contexto import contexto
+from sesiones import sesiones, Sesion, CHAT_SESSION_TTL
+from chat_tools import CHAT_SEARCH_MODE, SYSTEM_MESSAGE, ejecutar_tool_calls
+from prefijo import PREFIJO_VERSION, cuerpo_chat, informe_prefijo
+from vectores import indice_videos
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     init_db()
+    print(f"Configuración de la BD: {json.dumps(informe_engines(), ensure_ascii=False)}")
+    await iniciar_cliente()
+    await ranking.iniciar()
+    await progreso.iniciar()
+    await sesiones.iniciar()
+    await correcciones.iniciar()
+    await run_db_lectura(indice_videos.sincronizar)
+    print(f"Índice de videos: {json.dumps(indice_videos.resumen(), ensure_ascii=False)}")
     yield
-    # Shutdown (si fuera necesario)
+    # Shutdown
+    await correcciones.detener()
+    await sesiones.detener()
+    await progreso.detener()
+    await ranking.detener()
+    await cerrar_cliente()
+
+# orjson para las respuestas que no pasan por la caché del catálogo (ranking, progreso, chat...)
+app = FastAPI(title="El Rincón de Gabi API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app = FastAPI(title="El Rincón de Gabi API", lifespan=lifespan)
+instrumentar_engine(engine)
+if engine_lectura is not engine:
+    instrumentar_engine(engine_lectura)
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -33,9 +75,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
-LLM_MODEL = "x-ai/grok-4.1-fast"
+# Rondas de tools permitidas antes de forzar la respuesta final
+CHAT_MAX_TOOL_ROUNDS = int(os.getenv("CHAT_MAX_TOOL_ROUNDS", "3"))
+# Si en la última ronda el LLM sigue pidiendo tools y no escribe nada
+RESPUESTA_SIN_CONTENIDO = (
+    "No he podido completar la respuesta con la información disponible. "
+    "¿Puedes reformular la pregunta o concretar un poco más?"
+)
 
 
 # ============== Models ==============
@@ -50,6 +96,23 @@ class VerificarRequest(BaseModel):
     tipo: str
     ejercicio_id: str
     respuestas: list[RespuestaEscrita]
+    nickname: Optional[str] = Field(None, max_length=32)  # si viene, la nota entra en el ranking
+
+
+class VerificarLoteRequest(BaseModel):
+    envios: list[VerificarRequest] = Field(min_length=1, max_length=VERIFICAR_LOTE_MAX_ENVIOS)
+
+
+class EventoProgreso(BaseModel):
+    ejercicio_id: str
+    completado: bool = True
+    puntuacion: Optional[int] = Field(None, ge=0, le=100)
+    fecha: datetime  # cuándo ocurrió en el cliente; gana la más reciente
+
+
+class ProgresoSyncRequest(BaseModel):
+    nickname: str = Field(min_length=1, max_length=32)
+    eventos: list[EventoProgreso] = Field(max_length=PROGRESO_SYNC_MAX_EVENTOS)
 
 
 class ChatMessage(BaseModel):
@@ -61,8 +124,25 @@ class ChatRequest(BaseModel):
     messages: list[ChatMessage]
 
 
+class CrearSesionRequest(BaseModel):
+    messages: list[ChatMessage] = []  # historial previo opcional
+
+
+class MensajeSesionRequest(BaseModel):
+    content: str = Field(min_length=1)
+
+
 # ============== Helper Functions ==============
 
+def _error_saturado(e: LLMSaturado) -> HTTPException:
+    """503 con Retry-After para que el cliente reintente más tarde"""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(int(LLM_QUEUE_TIMEOUT))},
+    )
+
+
 def limpiar_enlaces_html(text: str) -> str:
     """Convierte enlaces HTML malformados a formato Markdown correcto (por seguridad)"""
     import re
@@ -79,86 +159,14 @@ def limpiar_enlaces_html(text: str) -> str:
     return text
 
 
-def buscar_videos_por_keywords(keywords: list[str], db: Session, limit: int = 5) -> list[dict]:
-    """Busca videos en la BD usando keywords en titulo, descripcion y tags"""
-    if not keywords:
-        return []
-
-    # Construir condiciones OR para cada keyword
-    conditions = []
-    for keyword in keywords:
-        keyword_lower = f"%{keyword.lower()}%"
-        conditions.extend([
-            Video.titulo.ilike(keyword_lower),
-            Video.descripcion.ilike(keyword_lower),
-            Video.tags.ilike(keyword_lower)
-        ])
-
-    # Buscar videos que coincidan con alguna condición
-    videos = db.query(Video).filter(or_(*conditions)).limit(limit).all()
-
-    # Formatear resultados
-    resultados = []
-    for video in videos:
-        resultados.append({
-            "titulo": video.titulo,
-            "descripcion": video.descripcion[:500] if video.descripcion else "",  # Limitar a 500 chars
-            "youtube_id": video.youtube_id,
-            "tags": video.tags
-        })
-
-    return resultados
-
-
-def obtener_url_tema_interno(slug_tema: str) -> str:
-    """Devuelve URL interna del sitio web según el slug del tema"""
-    base_url = "http://localhost:3000"  # Puerto del frontend
-
-    temas_map = {
-        # Temas principales del curso
-        "memoria-agentes": f"{base_url}/temas/memoria-agentes",
-        "comunicacion-agentes": f"{base_url}/temas/comunicacion-agentes",
-        "claude-code": f"{base_url}/temas/claude-code",
-        "mcp-herramientas": f"{base_url}/temas/mcp-herramientas",
-        "introduccion-agentes": f"{base_url}/temas/introduccion-agentes",
-
-        # Sinónimos y variaciones comunes - Memoria
-        "memoria": f"{base_url}/temas/memoria-agentes",
-        "memoria-corto-plazo": f"{base_url}/temas/memoria-agentes",
-        "memoria-largo-plazo": f"{base_url}/temas/memoria-agentes",
-        "memoria-episodica": f"{base_url}/temas/memoria-agentes",
-        "memoria-semantica": f"{base_url}/temas/memoria-agentes",
-
-        # Sinónimos - Comunicación
-        "comunicacion": f"{base_url}/temas/comunicacion-agentes",
-        "protocolo-a2a": f"{base_url}/temas/comunicacion-agentes",
-        "a2a": f"{base_url}/temas/comunicacion-agentes",
-
-        # Sinónimos - Claude Code
-        "claude": f"{base_url}/temas/claude-code",
-        "cli": f"{base_url}/temas/claude-code",
-
-        # Sinónimos - MCP y Herramientas (incluye RAG)
-        "mcp": f"{base_url}/temas/mcp-herramientas",
-        "herramientas": f"{base_url}/temas/mcp-herramientas",
-        "model-context-protocol": f"{base_url}/temas/mcp-herramientas",
-        "rag": f"{base_url}/temas/mcp-herramientas",
-        "rag-vectores": f"{base_url}/temas/mcp-herramientas",
-        "vectores": f"{base_url}/temas/mcp-herramientas",
-        "embeddings": f"{base_url}/temas/mcp-herramientas",
-
-        # Aliases adicionales
-        "agentes": f"{base_url}/temas/memoria-agentes",
-        "agentes-ia": f"{base_url}/temas/introduccion-agentes",
-        "multi-agente": f"{base_url}/temas/comunicacion-agentes",
-        "introduccion": f"{base_url}/temas/introduccion-agentes",
-    }
-
-    slug_lower = slug_tema.lower()
-    if slug_lower in temas_map:
-        return temas_map[slug_lower]
-
-    return f"{base_url}/"  # Página principal si no encuentra el tema
+def _apuntar_en_ranking(request: VerificarRequest, resultado: dict) -> dict:
+    """Registra la nota en el ranking si el envío trae nickname"""
+    nickname = normalizar_nickname(request.nickname)
+    puntuacion = normalizar_puntuacion(resultado.get("puntuacion"))
+    if not nickname or puntuacion is None:
+        return resultado
+    # Copia: el resultado puede ser el mismo objeto que guarda la caché de correcciones
+    return {**resultado, "ranking": ranking.registrar(nickname, request.ejercicio_id, puntuacion)}
 
 
 # ============== Endpoints ==============
@@ -169,306 +177,573 @@ def root():
 
 
 @app.get("/temas", response_model=list[TemaListResponse])
-def list_temas(db: Session = Depends(get_db)):
-    temas = get_all_temas(db)
-    return [
-        {
-            "id": t.id,
-            "slug": t.slug,
-            "titulo": t.titulo,
-            "descripcion": t.descripcion,
-            "orden": t.orden,
-            "total_videos": len(t.videos),
-            "total_ejercicios": len(t.ejercicios)
-        }
-        for t in temas
+def list_temas(request: Request, db: Session = Depends(get_db_lectura)):
+    def construir() -> bytes:
+        return temas_list_json(get_all_temas_con_totales(db))
+
+    return responder(request, catalogo.obtener(("temas",), db, construir))
+
+
+# Sin response_model: con `fields` o paginación el cuerpo es parcial y lleva los cursores *_siguiente
+@app.get("/temas/{slug}", responses={200: {
+    "model": TemaParcialResponse,
+    "description": "Tema completo o, con `fields`/paginación, solo los campos pedidos",
+}})
+def get_tema_detail(
+    slug: str,
+    request: Request,
+    fields: Optional[str] = Query(None, description="p. ej. titulo,videos.youtube_id,videos.titulo"),
+    videos_limite: Optional[int] = Query(None, ge=1, le=100),
+    videos_cursor: Optional[str] = None,
+    ejercicios_limite: Optional[int] = Query(None, ge=1, le=100),
+    ejercicios_cursor: Optional[str] = None,
+    db: Session = Depends(get_db_lectura),
+):
+    # Con selección de campos o paginación solo se leen las columnas y filas pedidas
+    if fields or videos_limite or videos_cursor or ejercicios_limite or ejercicios_cursor:
+        try:
+            seleccion = parsear_campos(fields)
+            videos = Pagina(videos_limite, decodificar_cursor(videos_cursor))
+            ejercicios = Pagina(ejercicios_limite, decodificar_cursor(ejercicios_cursor))
+
+            def construir_parcial() -> bytes:
+                body = tema_parcial_json(db, slug, seleccion, videos=videos, ejercicios=ejercicios)
+                if body is None:
+                    raise HTTPException(404, "Tema no encontrado")
+                return body
+
+            # Clave con la query ya normalizada: mismo orden de campos y cursores decodificados
+            clave = ("tema_parcial", slug, seleccion, videos, ejercicios)
+            return responder(request, catalogo.obtener_parcial(clave, db, construir_parcial))
+        except SeleccionInvalida as e:
+            raise HTTPException(400, str(e))
+
+    def construir() -> bytes:
+        tema = get_tema_by_slug(db, slug)
+        if not tema:
+            raise HTTPException(404, "Tema no encontrado")
+        return tema_detail_json(tema)
+
+    return responder(request, catalogo.obtener(("tema", slug), db, construir))
+
+
+@app.get("/ejercicios/{ejercicio_id}", response_model=EjercicioResponse)
+def get_ejercicio(ejercicio_id: str, request: Request, db: Session = Depends(get_db_lectura)):
+    def construir() -> bytes:
+        ej = get_ejercicio_by_id(db, ejercicio_id)
+        if not ej:
+            raise HTTPException(404, "Ejercicio no encontrado")
+        return ejercicio_json(ej)
+
+    return responder(request, catalogo.obtener(("ejercicio", ejercicio_id), db, construir))
+
+
+def _snapshot(db: Session):
+    return catalogo.obtener(("snapshot",), db, lambda: exportar(db))
+
+
+@app.get("/catalogo/snapshot")
+def catalogo_snapshot(request: Request, db: Session = Depends(get_db_lectura)):
+    """Catálogo entero en NDJSON (una línea por tema, como /temas/{slug}) para builds estáticos"""
+    return responder(request, _snapshot(db), media_type="application/x-ndjson")
+
+
+@app.get("/catalogo/manifest")
+def catalogo_manifest(request: Request, db: Session = Depends(get_db_lectura)):
+    """Hash del snapshot y de cada tema, para saltarse en el build los que no han cambiado"""
+    def construir() -> bytes:
+        return orjson.dumps(manifest(_snapshot(db).body))
+
+    return responder(request, catalogo.obtener(("manifest",), db, construir))
+
+
+@app.post("/verificar")
+async def verificar_respuesta(request: VerificarRequest):
+    if request.tipo != "escrito":
+        raise HTTPException(status_code=400, detail="Solo se verifican respuestas escritas")
+
+    # Respuesta ya corregida antes (misma pregunta y respuesta normalizada)
+    cacheado = await buscar_correccion_cacheada(request.ejercicio_id, request.respuestas)
+    if cacheado is not None:
+        return _apuntar_en_ranking(request, cacheado)
+
+    if not OPENROUTER_API_KEY:
+        raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY no configurada")
+
+    try:
+        resultado = await corregir(request.ejercicio_id, request.respuestas)
+    except LLMSaturado as e:
+        raise _error_saturado(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Error llamando al LLM: {str(e)}")
+    except (json.JSONDecodeError, RespuestaInvalida):
+        raise HTTPException(status_code=500, detail="Error parseando respuesta del LLM")
+
+    return _apuntar_en_ranking(request, resultado)
+
+
+@app.post("/verificar/lote")
+async def verificar_lote(request: VerificarLoteRequest):
+    """
+    Corrige muchos envíos de una vez (p. ej. toda una clase para un ejercicio).
+
+    Los envíos ya cacheados no cuestan nada; el resto se agrupan en el menor
+    número de llamadas al LLM que permite el presupuesto de contexto, y esas
+    llamadas se lanzan en paralelo. Cada envío lleva su propio resultado o
+    error, así que un fallo parcial no invalida el lote (tampoco la falta de
+    API key: los envíos cacheados se devuelven igual).
+    """
+    lote = await corregir_lote(request.envios)
+    lote["resultados"] = [
+        _apuntar_en_ranking(request.envios[r["indice"]], r) if r["ok"] else r
+        for r in lote["resultados"]
     ]
+    return lote
+
+
+@app.get("/verificar/cache")
+def verificar_cache_stats():
+    """Aciertos y fallos de la caché de correcciones"""
+    return correcciones.resumen()
+
+
+@app.get("/ranking")
+def ranking_global(limite: int = Query(10, ge=1, le=100)):
+    """Top por suma de las mejores puntuaciones de cada ejercicio"""
+    return ranking.top(limite)
+
 
+@app.get("/ranking/ejercicios/{ejercicio_id}")
+def ranking_ejercicio(ejercicio_id: str, limite: int = Query(10, ge=1, le=100)):
+    return ranking.top(limite, ejercicio=ejercicio_id)
 
-@app.get("/temas/{slug}", response_model=TemaDetailResponse)
-def get_tema_detail(slug: str, db: Session = Depends(get_db)):
-    tema = get_tema_by_slug(db, slug)
-    if not tema:
-        raise HTTPException(404, "Tema no encontrado")
 
+@app.get("/ranking/usuarios/{nickname}")
+def ranking_usuario(nickname: str):
+    """Posición global y en cada ejercicio de un nickname"""
+    resultado = ranking.usuario(nickname)
+    if resultado is None:
+        raise HTTPException(404, "Nickname sin puntuaciones")
+    return resultado
+
+
+@app.post("/progreso/sync")
+async def progreso_sync(request: ProgresoSyncRequest):
+    """
+    Sincroniza el progreso de un nickname en un solo lote.
+
+    Los eventos se fusionan por fecha (last-write-wins) y se escriben en bloque
+    en segundo plano; la respuesta ya incluye el estado fusionado para que el
+    cliente actualice su copia local. Los eventos de ejercicios que no existen
+    se descartan y se devuelven en `rechazados`.
+    """
+    nickname = normalizar_nickname(request.nickname)
+    if not nickname:
+        raise HTTPException(400, "Nickname vacío")
+
+    existentes = await run_db_lectura(ejercicios_existentes, {e.ejercicio_id for e in request.eventos})
+    aceptados, rechazados = [], []
+    for i, evento in enumerate(request.eventos):
+        if evento.ejercicio_id in existentes:
+            aceptados.append(evento.model_dump())
+        else:
+            rechazados.append({"indice": i, "ejercicio_id": evento.ejercicio_id, "error": "Ejercicio no encontrado"})
+
+    progreso.sincronizar(nickname, aceptados)
     return {
-        "id": tema.id,
-        "slug": tema.slug,
-        "titulo": tema.titulo,
-        "descripcion": tema.descripcion,
-        "videos": tema.videos,
-        "ejercicios": [
-            {
-                "id": e.id,
-                "titulo": e.titulo,
-                "tipo": e.tipo,
-                "preguntas": json.loads(e.contenido)
-            }
-            for e in tema.ejercicios
-        ]
+        "nickname": nickname,
+        "eventos": len(aceptados),
+        "rechazados": rechazados,
+        "progreso": await run_db_lectura(progreso.estado, nickname),
     }
 
 
-@app.get("/ejercicios/{ejercicio_id}")
-def get_ejercicio(ejercicio_id: str, db: Session = Depends(get_db)):
-    ej = get_ejercicio_by_id(db, ejercicio_id)
-    if not ej:
-        raise HTTPException(404, "Ejercicio no encontrado")
+@app.get("/progreso/usuarios/{nickname}")
+async def progreso_usuario(nickname: str):
+    return {"nickname": nickname, "progreso": await run_db_lectura(progreso.estado, nickname)}
 
-    return {
-        "id": ej.id,
-        "titulo": ej.titulo,
-        "tipo": ej.tipo,
-        "preguntas": json.loads(ej.contenido)
+
+def _preparar_mensajes(historial: list[ChatMessage]) -> list[dict]:
+    """Convierte el historial del cliente y añade el mensaje del sistema si no existe"""
+    messages = [{"role": msg.role, "content": msg.content} for msg in historial]
+
+    # Si no hay mensaje del sistema, añadirlo
+    if not messages or messages[0]["role"] != "system":
+        messages.insert(0, dict(SYSTEM_MESSAGE))
+
+    return messages
+
+
+async def _prerutear(messages: list[dict]) -> bool:
+    """Añade al historial el resultado de redirigir_temas_internos si el pre-router lo tiene claro"""
+    if not INTENT_ROUTER_ENABLED:
+        return False
+    await run_db_lectura(router.actualizar_tags)
+    atajo = router.enrutar(messages)
+    messages.extend(atajo)
+    return bool(atajo)
+
+
+def _meta_turno(recorte, resultado: dict, preruteado: bool) -> dict:
+    """Metadatos del turno: recorte del historial (y su métrica de ahorro) y caché de prompt"""
+    if preruteado:
+        router.registrar_turno(resultado["llamadas_llm"])
+    meta = recorte.meta(resultado["llamadas_llm"])
+    if meta["tokens_ahorrados"] > 0:
+        chat_tokens_ahorrados.inc(cantidad=meta["tokens_ahorrados"])
+    meta["prompt_cache"] = {
+        "version": PREFIJO_VERSION,
+        "tokens_prompt": resultado["tokens_prompt"],
+        "tokens_cacheados": resultado["tokens_cacheados"],
     }
+    return meta
 
 
-@app.post("/verificar")
-async def verificar_respuesta(request: VerificarRequest):
-    if request.tipo != "escrito":
-        raise HTTPException(status_code=400, detail="Solo se verifican respuestas escritas")
+def _sumar_uso(resultado: dict, usage: dict | None):
+    """Acumula el `usage` de cada llamada del turno"""
+    resultado["tokens_prompt"] += (usage or {}).get("prompt_tokens") or 0
+    resultado["tokens_cacheados"] += tokens_cacheados(usage)
+
+
+def _formato_sse(evento: str, data: dict) -> str:
+    """Serializa un evento Server-Sent Events"""
+    return f"event: {evento}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _payload_chat(messages: list[dict], ronda: int) -> bytes:
+    """Cuerpo de la petición al LLM; en la última ronda ya no se permiten tools"""
+    return cuerpo_chat(messages, forzar_respuesta=_ultima_ronda(ronda))
+
+
+def _fase_chat(ronda: int) -> str:
+    """Etiqueta de métricas: primera llamada o llamadas tras ejecutar tools"""
+    return "chat_primera" if ronda == 0 else "chat_segunda"
+
+
+def _ultima_ronda(ronda: int) -> bool:
+    return ronda >= CHAT_MAX_TOOL_ROUNDS
+
+
+def _respuesta_final(content: str | None) -> str:
+    """Respuesta limpia; nunca vacía aunque el LLM no haya escrito texto"""
+    return limpiar_enlaces_html(content) if content else RESPUESTA_SIN_CONTENIDO
+
+
+def _resultado_vacio() -> dict:
+    return {"content": "", "llamadas_llm": 0, "tokens_prompt": 0, "tokens_cacheados": 0}
+
 
+async def _turno(messages: list[dict]) -> dict:
+    """Rondas de tools hasta la respuesta final; añade a `messages` las tool calls y sus resultados
+
+    Devuelve la respuesta ya limpia (`content`), las llamadas al LLM y los tokens de prompt.
+    """
+    resultado = _resultado_vacio()
+    # Hasta CHAT_MAX_TOOL_ROUNDS rondas de tools antes de la respuesta final
+    for ronda in range(CHAT_MAX_TOOL_ROUNDS + 1):
+        resultado["llamadas_llm"] += 1
+        data = await completar(_payload_chat(messages, ronda), fase=_fase_chat(ronda))
+        _sumar_uso(resultado, data.get("usage"))
+        assistant_message = data["choices"][0]["message"]
+
+        # Si el LLM no pide tools, esta es la respuesta final. En la última ronda
+        # tool_choice=none es solo una pista para algunos proveedores: si aun así
+        # pide tools, no se ejecutan y se responde con el texto que haya
+        if not assistant_message.get("tool_calls") or _ultima_ronda(ronda):
+            break
+
+        # Añadir el mensaje del asistente con sus tool_calls y el resultado de todas ellas
+        messages.append({
+            "role": "assistant",
+            "content": assistant_message.get("content"),
+            "tool_calls": assistant_message["tool_calls"]
+        })
+        messages.extend(await ejecutar_tool_calls(assistant_message["tool_calls"]))
+
+    # Limpiar enlaces HTML malformados
+    resultado["content"] = _respuesta_final(assistant_message.get("content"))
+    return resultado
+
+
+async def _turno_stream(messages: list[dict], resultado: dict):
+    """Como _turno, pero emitiendo eventos token/tool; rellena `resultado` igual que _turno"""
+    resultado.update(_resultado_vacio())
+    # Como en /chat: rondas de tools hasta que el LLM responda sin pedirlas
+    for ronda in range(CHAT_MAX_TOOL_ROUNDS + 1):
+        resultado["llamadas_llm"] += 1
+        content = ""
+        tool_calls: dict[int, dict] = {}
+
+        async for chunk in completar_stream(_payload_chat(messages, ronda), fase=_fase_chat(ronda)):
+            # Con include_usage, el último chunk de cada llamada trae el consumo
+            if chunk.get("usage"):
+                _sumar_uso(resultado, chunk["usage"])
+            if not chunk.get("choices"):
+                continue
+            delta = chunk["choices"][0].get("delta") or {}
+
+            if delta.get("content"):
+                content += delta["content"]
+                yield _formato_sse("token", {"content": delta["content"]})
+
+            # Las tool calls llegan troceadas: se acumulan por índice
+            for parcial in delta.get("tool_calls") or []:
+                acumulada = tool_calls.setdefault(parcial.get("index", 0), {
+                    "id": "",
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                })
+                if parcial.get("id"):
+                    acumulada["id"] = parcial["id"]
+                funcion = parcial.get("function") or {}
+                acumulada["function"]["name"] += funcion.get("name") or ""
+                acumulada["function"]["arguments"] += funcion.get("arguments") or ""
+
+        if not tool_calls or _ultima_ronda(ronda):
+            break
+
+        # Ejecutar todas las tools a la vez y preparar la siguiente ronda
+        llamadas = [tool_calls[i] for i in sorted(tool_calls)]
+        yield _formato_sse("tool", {"names": [t["function"]["name"] for t in llamadas]})
+
+        messages.append({
+            "role": "assistant",
+            "content": content or None,
+            "tool_calls": llamadas
+        })
+        messages.extend(await ejecutar_tool_calls(llamadas))
+
+    resultado["content"] = _respuesta_final(content)
+
+
+def _stream_sse(eventos) -> StreamingResponse:
+    return StreamingResponse(
+        eventos,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _evento_error(e: Exception) -> str:
+    """Evento SSE de error con el mismo texto que los errores de /chat"""
+    if isinstance(e, LLMSaturado):
+        return _formato_sse("error", {"detail": str(e)})
+    if isinstance(e, httpx.HTTPError):
+        return _formato_sse("error", {"detail": f"Error llamando al LLM: {str(e)}"})
+    return _formato_sse("error", {"detail": f"Error procesando la solicitud: {str(e)}"})
+
+
+def _comprobar_api_key():
     if not OPENROUTER_API_KEY:
         raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY no configurada")
 
-    prompt = """Eres un profesor evaluando respuestas de estudiantes sobre agentes de IA.
-Para cada respuesta, evalúa del 0 al 100 según:
-- Precisión técnica (40%)
-- Claridad de explicación (30%)
-- Uso correcto de terminología (30%)
-
-Responde SOLO en JSON con este formato exacto:
-{
-  "puntuacion": <promedio de todas las respuestas>,
-  "feedback": {
-    "0": "<feedback breve para pregunta 1>",
-    "1": "<feedback breve para pregunta 2>",
-    ...
-  }
-}
-
-Preguntas y respuestas a evaluar:
-"""
-
-    for i, r in enumerate(request.respuestas):
-        prompt += f"\n{i+1}. Pregunta: {r.pregunta}"
-        if r.contexto:
-            prompt += f"\n   Contexto: {r.contexto}"
-        prompt += f"\n   Respuesta del estudiante: {r.respuesta}\n"
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    _comprobar_api_key()
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                OPENROUTER_URL,
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": LLM_MODEL,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.3,
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
-
-        content = data["choices"][0]["message"]["content"]
-        # Extract JSON from response
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-
-        result = json.loads(content.strip())
-        return result
+        recorte = await contexto.ajustar(_preparar_mensajes(request.messages))
+        messages = recorte.messages
+        preruteado = await _prerutear(messages)
+        resultado = await _turno(messages)
+        return {
+            "role": "assistant",
+            "content": resultado["content"],
+            "meta": _meta_turno(recorte, resultado, preruteado),
+        }
 
+    except LLMSaturado as e:
+        raise _error_saturado(e)
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error llamando al LLM: {str(e)}")
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Error parseando respuesta del LLM")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error procesando la solicitud: {str(e)}")
 
 
-@app.post("/chat")
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
-    if not OPENROUTER_API_KEY:
-        raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY no configurada")
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Variante de /chat que reenvía los tokens del LLM como Server-Sent Events.
 
-    # Definición de las tools disponibles
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "buscar_videos",
-                "description": "Busca videos del canal relacionados con ciertos temas o keywords. Usa esta función cuando el usuario pregunte sobre temas específicos como memoria, RAG, MCP, Claude Code, tools, agentes, etc. Extrae keywords relevantes de la pregunta del usuario.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "keywords": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "Lista de keywords o temas relacionados con la pregunta. Por ejemplo: ['memoria', 'conversaciones'], ['rag', 'vectores'], ['mcp', 'herramientas'], etc."
-                        }
-                    },
-                    "required": ["keywords"]
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "redirigir_temas_internos",
-                "description": "OBLIGATORIO: Usa esta función cuando el usuario pregunte sobre cualquier tema del curso. NO generes URLs manualmente. Temas: memoria en agentes, comunicación entre agentes, Claude Code, MCP/herramientas (incluye RAG, vectores, embeddings), introducción a agentes.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "slug_tema": {
-                            "type": "string",
-                            "description": "Slug o keyword del tema. Ejemplos: 'memoria', 'memoria-agentes', 'comunicacion', 'claude-code', 'mcp', 'rag', 'rag-vectores', 'vectores', 'embeddings', 'herramientas', 'agentes', 'introduccion'. La función mapea automáticamente sinónimos al tema correcto."
-                        }
-                    },
-                    "required": ["slug_tema"]
-                }
-            }
-        }
+    Eventos emitidos:
+    - token: fragmento de texto ({"content": "..."})
+    - tool: el LLM ha pedido tools y se están ejecutando ({"names": [...]})
+    - done: respuesta completa con enlaces ya limpiados ({"role", "content", "meta"})
+    - error: fallo a mitad de stream ({"detail": "..."})
+    """
+    _comprobar_api_key()
+
+    async def generar():
+        try:
+            recorte = await contexto.ajustar(_preparar_mensajes(request.messages))
+            messages = recorte.messages
+            preruteado = await _prerutear(messages)
+
+            resultado = {}
+            async for evento in _turno_stream(messages, resultado):
+                yield evento
+
+            yield _formato_sse("done", {
+                "role": "assistant",
+                "content": resultado["content"],
+                "meta": _meta_turno(recorte, resultado, preruteado),
+            })
+
+        except Exception as e:
+            yield _evento_error(e)
+
+    return _stream_sse(generar())
+
+
+# ============== Sesiones de chat ==============
+# El servidor guarda el historial (con tool calls y resultados) y el cliente
+# solo manda el mensaje nuevo en cada turno.
+
+async def _sesion_o_404(session_id: str) -> Sesion:
+    sesion = await sesiones.obtener(session_id)
+    if sesion is None:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada o caducada")
+    return sesion
+
+
+async def _preparar_turno_sesion(sesion: Sesion, content: str):
+    """Historial de trabajo del turno: lo guardado + el mensaje nuevo, recortado al presupuesto
+
+    Devuelve (recorte, mensajes nuevos, posición desde la que el turno añade mensajes,
+    si el pre-router ha atajado el turno).
+    """
+    nuevos = [{"role": "user", "content": content}]
+    # Lista nueva: el historial guardado solo se toca si el turno termina bien
+    recorte = await contexto.ajustar(sesion.messages + nuevos)
+    messages = recorte.messages
+    desde = len(messages)
+    preruteado = await _prerutear(messages)
+    return recorte, nuevos, desde, preruteado
+
+
+def _cerrar_turno_sesion(sesion: Sesion, nuevos: list[dict], generados: list[dict], content: str):
+    sesion.messages.extend(nuevos + generados + [{"role": "assistant", "content": content}])
+    sesiones.guardar(sesion)
+
+
+def _mensajes_visibles(sesion: Sesion) -> list[dict]:
+    """Historial tal y como lo ve el usuario (sin sistema, resúmenes ni tools)"""
+    return [
+        {"role": m["role"], "content": m["content"]}
+        for m in sesion.messages
+        if m["role"] in ("user", "assistant") and m.get("content") and not m.get("tool_calls")
     ]
 
-    # Añadir mensaje del sistema al inicio si no existe
-    messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
 
-    # Si no hay mensaje del sistema, añadirlo
-    if not messages or messages[0]["role"] != "system":
-        system_message = {
-            "role": "system",
-            "content": "Eres un asistente experto en agentes de IA, programación y tecnología. "
-                      "Ayudas a los estudiantes de 'El Rincón de Gabi' a aprender sobre estos temas. "
-                      "\n\n=== FORMATO DE ENLACES - REGLA ABSOLUTA ===\n"
-                      "OBLIGATORIO: Todos los enlaces DEBEN seguir EXACTAMENTE este formato Markdown:\n"
-                      "[texto descriptivo](https://url-completa.com)\n\n"
-                      "EJEMPLOS CORRECTOS:\n"
-                      "- [Documentación de Anthropic](https://docs.anthropic.com)\n"
-                      "- [Guía de inicio rápido](https://docs.anthropic.com/quickstart)\n\n"
-                      "PROHIBIDO - NUNCA uses estos formatos:\n"
-                      "❌ href=\"https://url.com\">Texto\n"
-                      "❌ <a href=\"https://url.com\">Texto</a>\n"
-                      "❌ https://url.com (URL sola)\n"
-                      "❌ Cualquier fragmento de HTML\n\n"
-                      "Si necesitas incluir múltiples enlaces, usa una lista Markdown:\n"
-                      "- [Enlace 1](https://url1.com)\n"
-                      "- [Enlace 2](https://url2.com)\n"
-                      "\n\n=== USO DE HERRAMIENTAS - CRÍTICO ===\n"
-                      "NUNCA generes URLs a temas del curso directamente. SIEMPRE usa las herramientas.\n"
-                      "PROHIBIDO generar URLs como elrincondelgabi.com/... o localhost/... manualmente.\n\n"
-                      "Herramientas disponibles:\n"
-                      "1. buscar_videos: Para buscar videos específicos del canal cuando pregunten sobre temas concretos\n"
-                      "2. redirigir_temas_internos: OBLIGATORIO para cualquier mención de temas del curso (memoria, comunicación, MCP, RAG, vectores, Claude Code, agentes, etc.)\n"
-                      "\nUSO OBLIGATORIO DE HERRAMIENTAS:\n"
-                      "- Cuando el usuario pregunte sobre temas como RAG, memoria, MCP, agentes, etc. → DEBES llamar a redirigir_temas_internos\n"
-                      "- Para buscar contenido específico del canal → buscar_videos\n"
-                      "- NUNCA inventes o escribas URLs manualmente. SIEMPRE usa las funciones.\n"
-        }
-        messages.insert(0, system_message)
+@app.post("/chat/sesiones")
+async def crear_sesion_chat(request: CrearSesionRequest):
+    """Crea una conversación (opcionalmente con historial previo del cliente)"""
+    sesion = sesiones.crear(_preparar_mensajes(request.messages))
+    return {"session_id": sesion.id, "ttl_segundos": CHAT_SESSION_TTL}
 
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Primera llamada al LLM con tools
-            response = await client.post(
-                OPENROUTER_URL,
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": LLM_MODEL,
-                    "messages": messages,
-                    "tools": tools,
-                    "temperature": 0.7,
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
 
-        assistant_message = data["choices"][0]["message"]
+@app.get("/chat/sesiones/{session_id}")
+async def ver_sesion_chat(session_id: str):
+    sesion = await _sesion_o_404(session_id)
+    return {"session_id": sesion.id, "messages": _mensajes_visibles(sesion)}
+
 
-        # Verificar si el LLM quiere llamar a una tool
-        if assistant_message.get("tool_calls"):
-            tool_call = assistant_message["tool_calls"][0]
-            function_name = tool_call["function"]["name"]
-            function_args = json.loads(tool_call["function"]["arguments"])
-
-            # Ejecutar la tool solicitada
-            if function_name == "buscar_videos":
-                keywords = function_args.get("keywords", [])
-                videos_encontrados = buscar_videos_por_keywords(keywords, db)
-
-                # Formatear los resultados
-                if videos_encontrados:
-                    videos_text = "\n\n".join([
-                        f"**{v['titulo']}**\n{v['descripcion']}\nTags: {v['tags']}"
-                        for v in videos_encontrados
-                    ])
-                    tool_response = f"Videos encontrados:\n\n{videos_text}"
-                else:
-                    tool_response = "No se encontraron videos relacionados con esos temas."
-
-            elif function_name == "redirigir_temas_internos":
-                slug_tema = function_args.get("slug_tema", "")
-                url = obtener_url_tema_interno(slug_tema)
-                if url.endswith("/"):
-                    # Es la página principal
-                    tool_response = f"Puedes ver todos los temas disponibles en: {url}"
-                else:
-                    # Es un tema específico
-                    tool_response = f"Tema específico disponible en: {url}"
-            else:
-                tool_response = f"Función {function_name} no reconocida."
-
-            # Añadir el mensaje del asistente con tool_call y la respuesta de la tool
-            messages.append({
+@app.delete("/chat/sesiones/{session_id}")
+async def borrar_sesion_chat(session_id: str):
+    await sesiones.borrar(session_id)
+    return {"session_id": session_id, "borrada": True}
+
+
+@app.post("/chat/sesiones/{session_id}/mensajes")
+async def chat_sesion(session_id: str, request: MensajeSesionRequest):
+    """Como /chat, pero con el historial guardado en la sesión"""
+    _comprobar_api_key()
+    sesion = await _sesion_o_404(session_id)
+
+    # Un turno a la vez por sesión
+    async with sesion.lock:
+        try:
+            recorte, nuevos, desde, preruteado = await _preparar_turno_sesion(sesion, request.content)
+            resultado = await _turno(recorte.messages)
+            _cerrar_turno_sesion(sesion, nuevos, recorte.messages[desde:], resultado["content"])
+            return {
                 "role": "assistant",
-                "content": assistant_message.get("content"),
-                "tool_calls": assistant_message["tool_calls"]
-            })
-            messages.append({
-                "role": "tool",
-                "tool_call_id": tool_call["id"],
-                "name": function_name,
-                "content": tool_response
-            })
+                "content": resultado["content"],
+                "session_id": sesion.id,
+                "meta": _meta_turno(recorte, resultado, preruteado),
+            }
 
-            # Segunda llamada al LLM con los resultados de la tool
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response2 = await client.post(
-                    OPENROUTER_URL,
-                    headers={
-                        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": LLM_MODEL,
-                        "messages": messages,
-                        "tools": tools,
-                        "temperature": 0.7,
-                    },
-                )
-                response2.raise_for_status()
-                data2 = response2.json()
-
-            final_message = data2["choices"][0]["message"]["content"]
-            # Limpiar enlaces HTML malformados
-            final_message = limpiar_enlaces_html(final_message)
-            return {"role": "assistant", "content": final_message}
-
-        # Si no hay tool calls, devolver la respuesta directa
-        content = assistant_message.get("content", "")
-        # Limpiar enlaces HTML malformados
-        content = limpiar_enlaces_html(content)
-        return {"role": "assistant", "content": content}
+        except LLMSaturado as e:
+            raise _error_saturado(e)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=500, detail=f"Error llamando al LLM: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error procesando la solicitud: {str(e)}")
 
-    except httpx.HTTPError as e:
-        raise HTTPException(status_code=500, detail=f"Error llamando al LLM: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error procesando la solicitud: {str(e)}")
+
+@app.post("/chat/sesiones/{session_id}/stream")
+async def chat_sesion_stream(session_id: str, request: MensajeSesionRequest):
+    """Como /chat/stream, pero con el historial guardado en la sesión (mismos eventos)"""
+    _comprobar_api_key()
+    sesion = await _sesion_o_404(session_id)
+
+    async def generar():
+        async with sesion.lock:
+            try:
+                recorte, nuevos, desde, preruteado = await _preparar_turno_sesion(sesion, request.content)
+                resultado = {}
+                async for evento in _turno_stream(recorte.messages, resultado):
+                    yield evento
+
+                _cerrar_turno_sesion(sesion, nuevos, recorte.messages[desde:], resultado["content"])
+                yield _formato_sse("done", {
+                    "role": "assistant",
+                    "content": resultado["content"],
+                    "session_id": sesion.id,
+                    "meta": _meta_turno(recorte, resultado, preruteado),
+                })
+
+            except Exception as e:
+                yield _evento_error(e)
+
+    return _stream_sse(generar())
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(registro.exponer(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/chat/router")
+def chat_router_stats():
+    """Umbral del pre-router, peticiones atajadas y rondas de LLM realmente ahorradas"""
+    return router.resumen()
+
+
+@app.get("/chat/contexto")
+def chat_contexto_stats():
+    """Presupuesto de tokens del historial y uso de la caché de resúmenes"""
+    return contexto.resumen()
+
+
+@app.get("/chat/busqueda")
+def chat_busqueda_stats():
+    """Estado del índice vectorial de videos que usa buscar_videos (modos semantico e hibrido)"""
+    return {"modo_por_defecto": CHAT_SEARCH_MODE, **indice_videos.resumen()}
+
+
+@app.get("/chat/prefijo")
+def chat_prefijo_stats():
+    """Versión y tamaño del prefijo estático (sistema + tools) enviado con caché de prompt"""
+    return informe_prefijo()
+
+
+@app.get("/chat/sesiones")
+def chat_sesiones_stats():
+    """Sesiones en memoria, caducidad y escrituras pendientes del nivel persistente"""
+    return sesiones.resumen()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,263 @@
+"""
+Métricas en formato de texto de Prometheus (GET /metrics).
+
+Implementación mínima sin dependencias: contadores, gauges e histogramas con
+etiquetas, seguros entre hilos (las consultas a la BD se ejecutan en el pool
+de hilos). Las métricas son por proceso: con varios workers, Prometheus debe
+raspar cada uno por separado.
+"""
+import re
+import threading
+import time
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_DB = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+BUCKETS_LLM = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+
+def _etiquetas(nombres: tuple[str, ...], valores: tuple) -> str:
+    if not nombres:
+        return ""
+    pares = []
+    for nombre, valor in zip(nombres, valores):
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pares.append(f'{nombre}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._lock = threading.Lock()
+
+    def cabecera(self) -> list[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: dict[tuple, float] = {}
+
+    def inc(self, *valores, cantidad: float = 1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self) -> list[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return self.cabecera() + [
+            f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}" for k, v in sorted(valores.items())
+        ]
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def __init__(self, *args, funcion: Callable[[], float] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: dict[tuple, float] = {}
+        self._funcion = funcion
+
+    def inc(self, *valores, cantidad: float = 1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def dec(self, *valores, cantidad: float = 1):
+        self.inc(*valores, cantidad=-cantidad)
+
+    def exponer(self) -> list[str]:
+        if self._funcion is not None:
+            return self.cabecera() + [f"{self.nombre} {_numero(self._funcion())}"]
+        with self._lock:
+            valores = dict(self._valores)
+        return self.cabecera() + [
+            f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}" for k, v in sorted(valores.items())
+        ]
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = BUCKETS_HTTP, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # etiquetas -> [conteos por bucket, suma, total]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, valor: float, *valores):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self) -> list[str]:
+        with self._lock:
+            series = {k: ([*v[0]], v[1], v[2]) for k, v in self._series.items()}
+        lineas = self.cabecera()
+        for valores, (conteos, suma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                etiquetas = _etiquetas(self.etiquetas + ("le",), valores + (_numero(limite),))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _etiquetas(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas: list[_Metrica] = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+# ============== HTTP ==============
+
+http_duracion = registro.registrar(Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta",
+    ("method", "route", "status"), buckets=BUCKETS_HTTP,
+))
+http_en_vuelo = registro.registrar(Gauge(
+    "http_requests_in_flight", "Peticiones HTTP en curso", ("method",),
+))
+
+# ============== Base de datos ==============
+
+db_consultas = registro.registrar(Counter(
+    "db_queries_total", "Consultas SQL ejecutadas por tipo de sentencia", ("operation",),
+))
+db_duracion = registro.registrar(Histogram(
+    "db_query_duration_seconds", "Duración de las consultas SQL", ("operation",), buckets=BUCKETS_DB,
+))
+
+# ============== LLM ==============
+
+llm_duracion = registro.registrar(Histogram(
+    "llm_request_duration_seconds", "Latencia de las llamadas al LLM (incluye cola y reintentos)",
+    ("phase", "status"), buckets=BUCKETS_LLM,
+))
+llm_peticiones = registro.registrar(Counter(
+    "llm_requests_total", "Llamadas al LLM por fase y resultado", ("phase", "status"),
+))
+llm_tokens = registro.registrar(Counter(
+    "llm_tokens_total", "Tokens consumidos según el campo usage de OpenRouter", ("phase", "type"),
+))
+chat_tokens_ahorrados = registro.registrar(Counter(
+    "chat_context_tokens_saved_total", "Tokens de entrada ahorrados al recortar o resumir el historial del chat",
+))
+llm_primer_token = registro.registrar(Histogram(
+    "llm_first_token_seconds", "Tiempo hasta el primer chunk de las llamadas en streaming", ("phase",),
+    buckets=BUCKETS_LLM,
+))
+tool_duracion = registro.registrar(Histogram(
+    "chat_tool_duration_seconds", "Duración de la ejecución de tools del chat", ("tool",), buckets=BUCKETS_DB + (2.5, 5),
+))
+
+
+def registrar_uso_llm(fase: str, usage: dict | None):
+    """Suma los tokens del campo `usage` de una respuesta de OpenRouter"""
+    if not usage:
+        return
+    for tipo in ("prompt_tokens", "completion_tokens"):
+        if usage.get(tipo):
+            llm_tokens.inc(fase, tipo.removesuffix("_tokens"), cantidad=usage[tipo])
+    # Parte del prompt servida desde la caché del proveedor
+    cacheados = tokens_cacheados(usage)
+    if cacheados:
+        llm_tokens.inc(fase, "cached", cantidad=cacheados)
+
+
+def tokens_cacheados(usage: dict | None) -> int:
+    return ((usage or {}).get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+
+# ============== Instrumentación ==============
+
+_OPERACION = re.compile(r"^\s*(\w+)")
+
+
+def instrumentar_engine(engine: Engine):
+    """Cuenta y cronometra cada sentencia SQL mediante eventos del engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["metricas_inicio"].pop()
+        m = _OPERACION.match(statement)
+        operacion = m.group(1).upper() if m else "OTRA"
+        db_consultas.inc(operacion)
+        db_duracion.observe(time.perf_counter() - inicio, operacion)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("metricas_inicio"):
+            conn.info["metricas_inicio"].pop()
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia por plantilla de ruta (no por URL) y peticiones en curso"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = {"status": 500}
+
+        async def send_con_estado(message):
+            if message["type"] == "http.response.start":
+                estado["status"] = message["status"]
+            await send(message)
+
+        metodo = scope["method"]
+        http_en_vuelo.inc(metodo)
+        try:
+            await self.app(scope, receive, send_con_estado)
+        finally:
+            http_en_vuelo.dec(metodo)
+            ruta = scope.get("route")
+            plantilla = getattr(ruta, "path", None) or "<sin_ruta>"
+            http_duracion.observe(time.perf_counter() - inicio, metodo, plantilla, estado["status"])
@@ -0,0 +1,57 @@
+"""
+Script para importar ranking.json a la tabla ranking (una sola vez).
+
+Se queda con la mejor puntuación de cada nickname en cada ejercicio y hace
+upsert, así que ejecutarlo dos veces no duplica nada.
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+
+from database import SessionLocal, init_db
+from ranking import normalizar_nickname, normalizar_puntuacion, persistir
+
+RANKING_JSON = Path(__file__).parent / "ranking.json"
+
+
+def _fecha(valor: str | None) -> datetime:
+    if not valor:
+        return datetime.utcnow()
+    # "2026-01-25T23:01:05.494771Z" -> datetime naive en UTC, como el resto de la BD
+    return datetime.fromisoformat(valor.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def migrate(ruta: Path = RANKING_JSON):
+    if not ruta.exists():
+        print(f"No existe {ruta}, nada que importar")
+        return
+
+    registros = json.loads(ruta.read_text(encoding="utf-8"))
+    mejores: dict[tuple[str, str], dict] = {}
+    for r in registros:
+        nickname = normalizar_nickname(r.get("nickname"))
+        puntuacion = normalizar_puntuacion(r.get("puntuacion"))
+        if not nickname or not r.get("ejercicio") or puntuacion is None:
+            continue
+        fila = {
+            "nickname": nickname,
+            "ejercicio": r["ejercicio"],
+            "puntuacion": puntuacion,
+            "fecha": _fecha(r.get("fecha")),
+        }
+        actual = mejores.get((nickname, fila["ejercicio"]))
+        if actual is None or fila["puntuacion"] > actual["puntuacion"]:
+            mejores[(nickname, fila["ejercicio"])] = fila
+
+    init_db()
+    db = SessionLocal()
+    try:
+        persistir(list(mejores.values()), db=db)
+    finally:
+        db.close()
+
+    print(f"OK - {len(registros)} registros leídos, {len(mejores)} mejores puntuaciones importadas")
+
+
+if __name__ == "__main__":
+    migrate()
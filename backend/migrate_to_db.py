@@ -1,10 +1,14 @@
+"""
+Carga inicial del catálogo (temas, videos y ejercicios) a la base de datos.
+
+Convierte TEMAS_CONFIG y los JSON de ejercicios/ (o ejercicios_backup/) en
+registros del importador (importar.py), así que se puede ejecutar las veces
+que haga falta: solo inserta o actualiza lo que ha cambiado.
+"""
 import json
-import os
 from pathlib import Path
-from sqlalchemy.orm import Session
-from database import engine, SessionLocal
-from models import Base, Tema, Video, Ejercicio
 
+from importar import importar_registros, mostrar
 # Definición de temas y su mapeo con ejercicios
 TEMAS_CONFIG = [
     {
@@ -63,105 +67,39 @@ TEMAS_CONFIG = [
     }
 ]
 
-def migrate():
-    """Migrar ejercicios JSON a base de datos SQLAlchemy"""
-    print("🚀 Iniciando migración...")
-
-    # Crear todas las tablas
-    print("📊 Creando tablas...")
-    Base.metadata.create_all(bind=engine)
-
-    # Crear sesión
-    db: Session = SessionLocal()
-
-    try:
-        # Crear directorio de backup
-        backup_dir = Path("ejercicios_backup")
-        backup_dir.mkdir(exist_ok=True)
-        print(f"📁 Directorio de backup: {backup_dir}")
-
-        ejercicios_dir = Path("ejercicios")
-
-        # Procesar cada tema
-        for tema_config in TEMAS_CONFIG:
-            print(f"\n📚 Procesando tema: {tema_config['titulo']}")
-
-            # Crear tema
-            tema = Tema(
-                id=tema_config["id"],
-                slug=tema_config["slug"],
-                titulo=tema_config["titulo"],
-                descripcion=tema_config["descripcion"],
-                orden=tema_config["orden"]
-            )
-            db.add(tema)
-            print(f"  ✅ Tema creado: {tema.slug}")
-
-            # Agregar videos
-            for video_data in tema_config["videos"]:
-                video = Video(
-                    tema_id=tema.id,
-                    youtube_id=video_data["youtube_id"],
-                    titulo=video_data["titulo"],
-                    orden=video_data["orden"]
-                )
-                db.add(video)
-                print(f"    🎥 Video agregado: {video.titulo}")
+def registros():
+    """Registros del importador a partir de TEMAS_CONFIG y los JSON de ejercicios"""
+    directorios = [Path("ejercicios"), Path("ejercicios_backup")]
+
+    for tema in TEMAS_CONFIG:
+        yield f"tema {tema['slug']}", {
+            "entidad": "tema",
+            **{k: tema[k] for k in ("id", "slug", "titulo", "descripcion", "orden")},
+        }
+
+        for video in tema["videos"]:
+            yield f"video {video['titulo']}", {"entidad": "video", "tema": tema["slug"], **video}
+
+        for idx, ejercicio_id in enumerate(tema["ejercicios"], start=1):
+            json_file = next((d / f"{ejercicio_id}.json" for d in directorios if (d / f"{ejercicio_id}.json").exists()), None)
+            if json_file is None:
+                print(f"Archivo no encontrado: {ejercicio_id}.json")
+                continue
+            data = json.loads(json_file.read_text(encoding="utf-8"))
+            yield str(json_file), {
+                "entidad": "ejercicio",
+                "id": data["id"],
+                "tema": tema["slug"],
+                "titulo": data["titulo"],
+                "tipo": data["tipo"],
+                "preguntas": data["preguntas"],
+                "orden": idx,
+            }
 
-            # Agregar ejercicios
-            for idx, ejercicio_id in enumerate(tema_config["ejercicios"], start=1):
-                json_file = ejercicios_dir / f"{ejercicio_id}.json"
 
-                if json_file.exists():
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-
-                    # Crear ejercicio con contenido serializado
-                    ejercicio = Ejercicio(
-                        id=data["id"],
-                        tema_id=tema.id,
-                        titulo=data["titulo"],
-                        tipo=data["tipo"],
-                        contenido=json.dumps(data["preguntas"], ensure_ascii=False),
-                        orden=idx
-                    )
-                    db.add(ejercicio)
-                    print(f"    ✏️  Ejercicio agregado: {ejercicio.titulo} ({ejercicio.tipo})")
-
-                    # Mover JSON a backup
-                    backup_file = backup_dir / json_file.name
-                    json_file.rename(backup_file)
-                    print(f"      📦 Movido a backup: {backup_file}")
-                else:
-                    print(f"    ⚠️  Archivo no encontrado: {json_file}")
-
-        # Mover agent-architecture.json a backup (no se usa)
-        agent_arch_file = ejercicios_dir / "agent-architecture.json"
-        if agent_arch_file.exists():
-            backup_file = backup_dir / agent_arch_file.name
-            agent_arch_file.rename(backup_file)
-            print(f"\n📦 Movido a backup (no usado): {backup_file}")
-
-        # Commit de la transacción
-        db.commit()
-        print("\n✅ Migración completada exitosamente!")
-
-        # Mostrar resumen
-        total_temas = db.query(Tema).count()
-        total_videos = db.query(Video).count()
-        total_ejercicios = db.query(Ejercicio).count()
-
-        print(f"\n📈 Resumen:")
-        print(f"  - Temas: {total_temas}")
-        print(f"  - Videos: {total_videos}")
-        print(f"  - Ejercicios: {total_ejercicios}")
-
-    except Exception as e:
-        db.rollback()
-        print(f"\n❌ Error durante la migración: {e}")
-        raise
-    finally:
-        db.close()
+def migrate():
+    """Migrar TEMAS_CONFIG y los ejercicios JSON a la base de datos"""
+    mostrar(importar_registros(registros()))
 
 if __name__ == "__main__":
     migrate()
@@ -1,11 +1,38 @@
-from sqlalchemy import Column, String, Integer, Text, ForeignKey, DateTime
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, String, Integer, Text, ForeignKey, DateTime, Boolean, Index, UniqueConstraint, func
+from sqlalchemy.orm import declarative_base, relationship, validates
 from datetime import datetime
+import json
 from pydantic import BaseModel
 
 # SQLAlchemy Models (Base de datos)
 Base = declarative_base()
 
+
+def _rechazar_constante(nombre: str):
+    raise ValueError(f"JSON no estándar: {nombre}")
+
+
+def contenido_json(value) -> str:
+    """`contenido` como JSON estricto: sin NaN/Infinity, que JSON.parse y otros clientes no aceptan
+
+    Acepta lista/dict (se serializa) o texto JSON (se valida y se guarda tal cual).
+    Lanza ValueError si no es JSON o contiene esas constantes.
+    """
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, allow_nan=False)
+    json.loads(value, parse_constant=_rechazar_constante)
+    return value
+
+
+def clave_orden(modelo):
+    """(orden, id) con `orden` nulo como 0 (su valor por defecto)
+
+    SQLite pone los NULL al principio y Postgres al final; así el orden (y los
+    cursores de paginación de seleccion.py) es el mismo en los dos.
+    """
+    return func.coalesce(modelo.orden, 0), modelo.id
+
+
 class Tema(Base):
     __tablename__ = 'temas'
 
@@ -17,8 +44,9 @@ class Tema(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relaciones
-    videos = relationship("Video", back_populates="tema", cascade="all, delete-orphan")
-    ejercicios = relationship("Ejercicio", back_populates="tema", cascade="all, delete-orphan")
+    # Orden estable: el JSON del tema (y su hash en los snapshots) no depende del motor de BD
+    videos = relationship("Video", back_populates="tema", cascade="all, delete-orphan", order_by=lambda: clave_orden(Video))
+    ejercicios = relationship("Ejercicio", back_populates="tema", cascade="all, delete-orphan", order_by=lambda: clave_orden(Ejercicio))
 
 class Video(Base):
     __tablename__ = 'videos'
@@ -48,6 +76,75 @@ class Ejercicio(Base):
     # Relación
     tema = relationship("Tema", back_populates="ejercicios")
 
+    @validates("contenido")
+    def _validar_contenido(self, key, value):
+        """Acepta lista/dict o texto JSON; siempre guarda JSON válido
+
+        Las respuestas insertan `contenido` sin volver a parsearlo (ver serializers.py),
+        así que aquí se rechaza cualquier texto que no sea JSON estricto.
+        """
+        return contenido_json(value)
+
+class ContentVersion(Base):
+    """Contador global que se incrementa con cada escritura en temas, videos o ejercicios"""
+    __tablename__ = 'content_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class GradingCacheEntry(Base):
+    """Resultado de una corrección del LLM, reutilizable para respuestas equivalentes"""
+    __tablename__ = 'grading_cache'
+
+    clave = Column(String(64), primary_key=True)  # sha256 de ejercicio, respuestas normalizadas, modelo y prompt
+    ejercicio_id = Column(String, nullable=False, index=True)
+    resultado = Column(Text, nullable=False)  # JSON serializado
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    last_used_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class RankingEntry(Base):
+    """Mejor puntuación de cada nickname en cada ejercicio"""
+    __tablename__ = 'ranking'
+    __table_args__ = (
+        UniqueConstraint('nickname', 'ejercicio', name='uq_ranking_nickname_ejercicio'),
+        Index('ix_ranking_ejercicio_puntuacion', 'ejercicio', 'puntuacion'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    nickname = Column(String(32), nullable=False, index=True)
+    ejercicio = Column(String, nullable=False)
+    puntuacion = Column(Integer, nullable=False)
+    fecha = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class ProgresoEjercicio(Base):
+    """Último estado conocido de un ejercicio para un nickname (gana la fecha más reciente)"""
+    __tablename__ = 'progreso'
+    __table_args__ = (
+        UniqueConstraint('nickname', 'ejercicio_id', name='uq_progreso_nickname_ejercicio'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    nickname = Column(String(32), nullable=False, index=True)
+    ejercicio_id = Column(String, nullable=False)
+    completado = Column(Boolean, default=True, nullable=False)
+    puntuacion = Column(Integer)
+    fecha = Column(DateTime, nullable=False)  # momento del evento en el cliente (last-write-wins)
+    actualizado = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class ChatSession(Base):
+    """Historial de una conversación de /chat/sesiones (nivel persistente opcional)"""
+    __tablename__ = 'chat_sessions'
+
+    id = Column(String(32), primary_key=True)
+    messages = Column(Text, nullable=False)  # JSON: lista de mensajes, incluidas tool calls y resultados
+    version = Column(Integer, nullable=False, default=0)  # +1 por turno; el volcado solo escribe sobre la versión de partida
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+# Modelos cuyo cambio invalida las respuestas cacheadas del catálogo
+CATALOG_MODELS = (Tema, Video, Ejercicio)
+
 
 # Pydantic Models (API responses)
 class VideoResponse(BaseModel):
@@ -83,3 +180,30 @@ class TemaDetailResponse(BaseModel):
     descripcion: str | None
     videos: list[VideoResponse]
     ejercicios: list[EjercicioResponse]
+
+# Con `fields` o paginación (/temas/{slug}?fields=...): solo los campos pedidos, `id` siempre
+class VideoParcialResponse(BaseModel):
+    id: int
+    youtube_id: str | None = None
+    titulo: str | None = None
+    descripcion: str | None = None
+    tags: str | None = None
+    orden: int | None = None
+
+class EjercicioParcialResponse(BaseModel):
+    id: str
+    titulo: str | None = None
+    tipo: str | None = None
+    preguntas: list | dict | None = None
+    orden: int | None = None
+
+class TemaParcialResponse(BaseModel):
+    id: str
+    slug: str | None = None
+    titulo: str | None = None
+    descripcion: str | None = None
+    videos: list[VideoParcialResponse] | None = None
+    ejercicios: list[EjercicioParcialResponse] | None = None
+    # Cursor de la página siguiente (null en la última); solo si se pagina esa lista
+    videos_siguiente: str | None = None
+    ejercicios_siguiente: str | None = None
@@ -0,0 +1,71 @@
+"""
+Prefijo estático de las llamadas del chat: prompt del sistema + tools.
+
+Es idéntico en todas las llamadas de /chat (y en las dos rondas de cada
+turno), así que se codifica una sola vez al arrancar y el cuerpo de cada
+petición se monta pegando fragmentos ya codificados; por petición solo se
+codifican los mensajes de la conversación.
+
+El prompt del sistema va marcado con `cache_control` para los proveedores con
+caché de prompt explícita (Anthropic y Gemini vía OpenRouter); los que cachean
+por prefijo automáticamente (OpenAI, Grok...) ignoran la marca y aprovechan
+igual que el prefijo llegue siempre primero y byte a byte idéntico. Los tokens
+servidos desde la caché vienen en `usage.prompt_tokens_details.cached_tokens`.
+
+PREFIJO_VERSION es un hash del prefijo: cambia al tocar el prompt o las tools,
+y con ella la entrada de caché del proveedor.
+"""
+import hashlib
+import os
+
+import orjson
+
+from chat_tools import TOOLS, SYSTEM_MESSAGE
+from llm import LLM_MODEL
+
+LLM_PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "1") != "0"
+CHAT_TEMPERATURE = 0.7
+
+
+def _mensaje_sistema() -> dict:
+    if not LLM_PROMPT_CACHE:
+        return SYSTEM_MESSAGE
+    return {
+        "role": "system",
+        "content": [{"type": "text", "text": SYSTEM_MESSAGE["content"], "cache_control": {"type": "ephemeral"}}],
+    }
+
+
+_SISTEMA = orjson.dumps(_mensaje_sistema())
+_TOOLS = orjson.dumps(TOOLS)
+_CABECERA = b'{"model":%s,"temperature":%s,"tools":%s,"messages":[' % (
+    orjson.dumps(LLM_MODEL), orjson.dumps(CHAT_TEMPERATURE), _TOOLS,
+)
+_SIN_TOOLS = b',"tool_choice":"none"'
+
+PREFIJO_VERSION = hashlib.sha256(_CABECERA + _SISTEMA).hexdigest()[:12]
+
+
+def _es_sistema_estandar(mensaje: dict) -> bool:
+    return mensaje["role"] == "system" and mensaje.get("content") == SYSTEM_MESSAGE["content"]
+
+
+def cuerpo_chat(messages: list[dict], forzar_respuesta: bool = False) -> bytes:
+    """Cuerpo JSON de una llamada del chat; con `forzar_respuesta` ya no se permiten tools"""
+    if messages and _es_sistema_estandar(messages[0]):
+        partes = [_SISTEMA, *map(orjson.dumps, messages[1:])]
+    else:
+        # Prompt de sistema propio del cliente: sin prefijo compartido que aprovechar
+        partes = list(map(orjson.dumps, messages))
+    cuerpo = _CABECERA + b",".join(partes) + b"]"
+    if forzar_respuesta:
+        cuerpo += _SIN_TOOLS
+    return cuerpo + b"}"
+
+
+def informe_prefijo() -> dict:
+    return {
+        "version": PREFIJO_VERSION,
+        "bytes_prefijo": len(_CABECERA) + len(_SISTEMA),
+        "cache_control": LLM_PROMPT_CACHE,
+    }
@@ -0,0 +1,118 @@
+"""
+Progreso de los ejercicios por nickname (antes solo en localStorage).
+
+El cliente manda lotes de eventos {ejercicio_id, completado, puntuacion,
+fecha}. Para cada (nickname, ejercicio) gana el evento con la fecha más
+reciente (last-write-wins), así que reenviar un lote es inocuo y da igual el
+orden en que lleguen los dispositivos.
+
+Los eventos no se escriben uno a uno: se coalescen en memoria y se vuelcan en
+bloque con un upsert condicionado a la fecha (ver diferido.py), de modo que
+una clase entera sincronizando a la vez son unas pocas transacciones.
+"""
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from diferido import VolcadoDiferido
+from models import Ejercicio, ProgresoEjercicio
+
+PROGRESO_FLUSH_INTERVAL = float(os.getenv("PROGRESO_FLUSH_INTERVAL", "1"))
+PROGRESO_FLUSH_MAX = int(os.getenv("PROGRESO_FLUSH_MAX", "500"))
+PROGRESO_SYNC_MAX_EVENTOS = int(os.getenv("PROGRESO_SYNC_MAX_EVENTOS", "500"))
+
+
+def normalizar_fecha(fecha: datetime) -> datetime:
+    """UTC sin zona (como el resto de la BD) y nunca en el futuro"""
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    # Un reloj adelantado no debe ganar para siempre a los demás dispositivos
+    return min(fecha, datetime.utcnow())
+
+
+def _mas_reciente(nueva: dict, actual: dict) -> bool:
+    return nueva["fecha"] > actual["fecha"]
+
+
+def persistir(filas: list[dict], db: Session):
+    """Upsert en bloque que solo sobrescribe si el evento es más reciente"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    ahora = datetime.utcnow()
+    stmt = insert(ProgresoEjercicio)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["nickname", "ejercicio_id"],
+        set_={
+            "completado": stmt.excluded.completado,
+            "puntuacion": stmt.excluded.puntuacion,
+            "fecha": stmt.excluded.fecha,
+            "actualizado": stmt.excluded.actualizado,
+        },
+        where=stmt.excluded.fecha > ProgresoEjercicio.fecha,
+    )
+    db.execute(stmt, [{**fila, "actualizado": ahora} for fila in filas])
+    db.commit()
+
+
+def ejercicios_existentes(ids: set[str], db: Session) -> set[str]:
+    """Los ids de `ids` que existen en la tabla ejercicios (una sola consulta IN)"""
+    if not ids:
+        return set()
+    return set(db.execute(select(Ejercicio.id).where(Ejercicio.id.in_(ids))).scalars())
+
+
+class Progreso:
+    def __init__(self):
+        # (nickname, ejercicio_id) -> evento más reciente pendiente de volcar
+        self._escrituras = VolcadoDiferido(
+            "progreso", persistir, _mas_reciente, PROGRESO_FLUSH_INTERVAL, PROGRESO_FLUSH_MAX,
+        )
+
+    def sincronizar(self, nickname: str, eventos: list[dict]):
+        """Encola los eventos; la comparación con la BD se hace al volcar"""
+        for evento in eventos:
+            fila = {
+                "nickname": nickname,
+                "ejercicio_id": evento["ejercicio_id"],
+                "completado": evento.get("completado", True),
+                "puntuacion": evento.get("puntuacion"),
+                "fecha": normalizar_fecha(evento["fecha"]),
+            }
+            self._escrituras.apuntar((nickname, fila["ejercicio_id"]), fila)
+
+    def estado(self, nickname: str, db: Session) -> dict[str, dict]:
+        """Progreso de un nickname: lo volcado en la BD más lo pendiente en memoria"""
+        filas = {
+            fila.ejercicio_id: {"completado": fila.completado, "puntuacion": fila.puntuacion, "fecha": fila.fecha}
+            for fila in db.execute(
+                select(ProgresoEjercicio).where(ProgresoEjercicio.nickname == nickname)
+            ).scalars()
+        }
+        for (nick, ejercicio_id), fila in self._escrituras.pendientes().items():
+            if nick == nickname and (ejercicio_id not in filas or fila["fecha"] > filas[ejercicio_id]["fecha"]):
+                filas[ejercicio_id] = {k: fila[k] for k in ("completado", "puntuacion", "fecha")}
+        return {
+            ejercicio_id: {**valor, "fecha": valor["fecha"].isoformat() + "Z"}
+            for ejercicio_id, valor in sorted(filas.items())
+        }
+
+    def resumen(self) -> dict:
+        return {
+            "pendientes": len(self._escrituras),
+            "volcados": self._escrituras.volcados,
+            "filas_volcadas": self._escrituras.filas_volcadas,
+        }
+
+    async def iniciar(self):
+        await self._escrituras.iniciar()
+
+    async def detener(self):
+        await self._escrituras.detener()
+
+
+progreso = Progreso()
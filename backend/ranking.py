@@ -0,0 +1,232 @@
+"""
+Clasificación de puntuaciones de los ejercicios (sustituye a ranking.json).
+
+- Base de datos: tabla `ranking` con la mejor puntuación de cada nickname en
+  cada ejercicio, indexada por (ejercicio, puntuacion). Es la fuente de verdad.
+- Memoria: una lista ordenada por ejercicio y otra global (suma de las mejores
+  puntuaciones), así que el top-N es un slice y la posición de un usuario una
+  búsqueda binaria, sin tocar la BD.
+- Escritura diferida: las puntuaciones nuevas se aplican en memoria al momento
+  y se vuelcan a la BD en bloque cada RANKING_FLUSH_INTERVAL segundos (o antes
+  si se acumulan RANKING_FLUSH_MAX). El volcado es un upsert que conserva la
+  mayor puntuación, así que es seguro con varios workers.
+
+Con varios workers cada proceso tiene su propia copia en memoria, que se
+recarga desde la BD cada RANKING_RECARGA segundos (0 = nunca).
+"""
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+
+from sqlalchemy import case, select
+from sqlalchemy.orm import Session
+
+from database import run_db_lectura
+from diferido import VolcadoDiferido
+from models import RankingEntry
+
+logger = logging.getLogger(__name__)
+
+RANKING_FLUSH_INTERVAL = float(os.getenv("RANKING_FLUSH_INTERVAL", "2"))
+RANKING_FLUSH_MAX = int(os.getenv("RANKING_FLUSH_MAX", "200"))
+RANKING_RECARGA = float(os.getenv("RANKING_RECARGA", "60"))
+
+NICKNAME_MAX = 32
+
+
+def normalizar_nickname(nickname: str | None) -> str | None:
+    nickname = (nickname or "").strip()
+    return nickname[:NICKNAME_MAX] or None
+
+
+def normalizar_puntuacion(valor) -> int | None:
+    """Entero entre 0 y 100, o None si no es un número finito"""
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(valor):
+        return None
+    return max(0, min(100, round(valor)))
+
+
+def persistir(filas: list[dict], db: Session):
+    """Upsert en bloque que solo sobrescribe si la puntuación nueva es mayor"""
+    if not filas:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(RankingEntry)
+    mejora = stmt.excluded.puntuacion > RankingEntry.puntuacion
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["nickname", "ejercicio"],
+        set_={
+            "puntuacion": case((mejora, stmt.excluded.puntuacion), else_=RankingEntry.puntuacion),
+            "fecha": case((mejora, stmt.excluded.fecha), else_=RankingEntry.fecha),
+        },
+    )
+    db.execute(stmt, filas)
+    db.commit()
+
+
+def _mejor_puntuacion(nueva: dict, actual: dict) -> bool:
+    return nueva["puntuacion"] > actual["puntuacion"]
+
+
+class Clasificacion:
+    """Lista ordenada de mejor a peor con índice por nickname"""
+
+    def __init__(self):
+        # (-puntuacion, fecha, nickname): a igual puntuación, gana quien llegó antes
+        self._orden: list[tuple[int, datetime, str]] = []
+        self._por_nick: dict[str, tuple[int, datetime, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._orden)
+
+    def poner(self, nickname: str, puntuacion: int, fecha: datetime):
+        anterior = self._por_nick.get(nickname)
+        if anterior is not None:
+            del self._orden[bisect_left(self._orden, anterior)]
+        clave = (-puntuacion, fecha, nickname)
+        insort(self._orden, clave)
+        self._por_nick[nickname] = clave
+
+    def puntuacion(self, nickname: str) -> int | None:
+        clave = self._por_nick.get(nickname)
+        return -clave[0] if clave else None
+
+    def posicion(self, nickname: str) -> int | None:
+        clave = self._por_nick.get(nickname)
+        return bisect_left(self._orden, clave) + 1 if clave else None
+
+    def top(self, n: int) -> list[dict]:
+        return [
+            {"posicion": i + 1, "nickname": nick, "puntuacion": -puntuacion, "fecha": fecha.isoformat() + "Z"}
+            for i, (puntuacion, fecha, nick) in enumerate(self._orden[:n])
+        ]
+
+
+class Ranking:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vaciar_estado()
+        # (nickname, ejercicio) -> fila pendiente de volcar
+        self._escrituras = VolcadoDiferido(
+            "ranking", persistir, _mejor_puntuacion, RANKING_FLUSH_INTERVAL, RANKING_FLUSH_MAX,
+            tras_volcar=self._recargar_si_toca,
+        )
+        self._ultima_recarga = 0.0
+
+    def _vaciar_estado(self):
+        self._ejercicios: dict[str, Clasificacion] = {}
+        self._global = Clasificacion()
+        self._mejores: dict[str, dict[str, int]] = {}  # nickname -> ejercicio -> puntuacion
+        self._ultima: dict[str, datetime] = {}  # nickname -> fecha de su última mejora
+
+    def _aplicar(self, nickname: str, ejercicio: str, puntuacion: int, fecha: datetime) -> bool:
+        """Actualiza las estructuras en memoria si la puntuación mejora la anterior"""
+        mejores = self._mejores.setdefault(nickname, {})
+        anterior = mejores.get(ejercicio)
+        if anterior is not None and puntuacion <= anterior:
+            return False
+        mejores[ejercicio] = puntuacion
+        self._ejercicios.setdefault(ejercicio, Clasificacion()).poner(nickname, puntuacion, fecha)
+        self._ultima[nickname] = max(fecha, self._ultima.get(nickname, fecha))
+        self._global.poner(nickname, sum(mejores.values()), self._ultima[nickname])
+        return True
+
+    # ============== Lectura ==============
+
+    def top(self, n: int = 10, ejercicio: str | None = None) -> dict:
+        with self._lock:
+            tabla = self._global if ejercicio is None else self._ejercicios.get(ejercicio, Clasificacion())
+            return {"total_jugadores": len(tabla), "top": tabla.top(n)}
+
+    def usuario(self, nickname: str) -> dict | None:
+        with self._lock:
+            mejores = self._mejores.get(nickname)
+            if not mejores:
+                return None
+            return {
+                "nickname": nickname,
+                "posicion": self._global.posicion(nickname),
+                "puntuacion_total": self._global.puntuacion(nickname),
+                "total_jugadores": len(self._global),
+                "ejercicios": {
+                    ejercicio: {
+                        "puntuacion": puntuacion,
+                        "posicion": self._ejercicios[ejercicio].posicion(nickname),
+                        "total_jugadores": len(self._ejercicios[ejercicio]),
+                    }
+                    for ejercicio, puntuacion in sorted(mejores.items())
+                },
+            }
+
+    # ============== Escritura ==============
+
+    def registrar(self, nickname: str, ejercicio: str, puntuacion, fecha: datetime | None = None) -> dict:
+        """Apunta una puntuación (en memoria ya, en la BD en el próximo volcado)
+
+        Lanza ValueError si la puntuación no es un número finito.
+        """
+        puntuacion = normalizar_puntuacion(puntuacion)
+        if puntuacion is None:
+            raise ValueError("Puntuación no válida")
+        fecha = fecha or datetime.utcnow()
+        with self._lock:
+            mejorada = self._aplicar(nickname, ejercicio, puntuacion, fecha)
+            if mejorada:
+                self._escrituras.apuntar((nickname, ejercicio), {
+                    "nickname": nickname, "ejercicio": ejercicio, "puntuacion": puntuacion, "fecha": fecha,
+                })
+            tabla = self._ejercicios[ejercicio]
+            resumen = {
+                "mejorada": mejorada,
+                "mejor_puntuacion": tabla.puntuacion(nickname),
+                "posicion": tabla.posicion(nickname),
+                "total_jugadores": len(tabla),
+                "posicion_global": self._global.posicion(nickname),
+            }
+        return resumen
+
+    def cargar(self, db: Session):
+        """Reconstruye la memoria desde la BD sin perder lo pendiente de volcar"""
+        filas = db.execute(
+            select(RankingEntry.nickname, RankingEntry.ejercicio, RankingEntry.puntuacion, RankingEntry.fecha)
+        ).all()
+        with self._lock:
+            self._vaciar_estado()
+            for fila in filas:
+                self._aplicar(*fila)
+            for fila in self._escrituras.pendientes().values():
+                self._aplicar(fila["nickname"], fila["ejercicio"], fila["puntuacion"], fila["fecha"])
+
+    # ============== Ciclo de vida ==============
+
+    async def iniciar(self):
+        await run_db_lectura(self.cargar)
+        self._ultima_recarga = time.monotonic()
+        await self._escrituras.iniciar()
+
+    async def detener(self):
+        await self._escrituras.detener()
+
+    async def _recargar_si_toca(self):
+        if not RANKING_RECARGA or time.monotonic() - self._ultima_recarga < RANKING_RECARGA:
+            return
+        try:
+            await run_db_lectura(self.cargar)
+        except Exception:
+            logger.exception("No se pudo recargar el ranking")
+        self._ultima_recarga = time.monotonic()
+
+
+ranking = Ranking()
@@ -0,0 +1,167 @@
+"""
+Índice de búsqueda full-text sobre los videos (titulo, descripcion y tags).
+
+- SQLite: tabla virtual FTS5 de contenido externo sobre `videos`, mantenida
+  con triggers y ordenada por BM25.
+- PostgreSQL: índice GIN sobre un tsvector (configuración 'spanish') y
+  ordenación por ts_rank_cd.
+
+En ambos casos la tokenización ignora acentos y cada término se busca por
+prefijo. Si el motor no soporta el índice, `buscar_ids_videos` devuelve None
+y quien llama debe recurrir a la búsqueda con ILIKE.
+"""
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+FTS_TABLE = "videos_fts"
+
+# Peso de cada columna en el ranking: titulo > tags > descripcion
+PESO_TITULO = 10.0
+PESO_DESCRIPCION = 1.0
+PESO_TAGS = 5.0
+
+# Dialectos en los que el índice se ha creado correctamente
+_dialectos_disponibles: set[str] = set()
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        titulo, descripcion, tags,
+        content='videos', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS videos_fts_ai AFTER INSERT ON videos BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, titulo, descripcion, tags)
+        VALUES (new.id, new.titulo, new.descripcion, new.tags);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS videos_fts_ad AFTER DELETE ON videos BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, titulo, descripcion, tags)
+        VALUES ('delete', old.id, old.titulo, old.descripcion, old.tags);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS videos_fts_au AFTER UPDATE ON videos BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, titulo, descripcion, tags)
+        VALUES ('delete', old.id, old.titulo, old.descripcion, old.tags);
+        INSERT INTO {FTS_TABLE}(rowid, titulo, descripcion, tags)
+        VALUES (new.id, new.titulo, new.descripcion, new.tags);
+    END""",
+]
+
+# Documento ponderado: el índice y las consultas deben usar la misma expresión
+_PG_DOCUMENTO = (
+    "setweight(to_tsvector('spanish', f_unaccent(coalesce(titulo, ''))), 'A') || "
+    "setweight(to_tsvector('spanish', f_unaccent(coalesce(tags, ''))), 'B') || "
+    "setweight(to_tsvector('spanish', f_unaccent(coalesce(descripcion, ''))), 'C')"
+)
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() no es IMMUTABLE, así que no se puede indexar directamente
+    """CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+        $$ SELECT public.unaccent('public.unaccent', $1) $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT""",
+    f"CREATE INDEX IF NOT EXISTS ix_videos_fts ON videos USING GIN (({_PG_DOCUMENTO}))",
+]
+
+
+def init_search_index(engine: Engine):
+    """Crea el índice full-text (idempotente) y lo rellena si es nuevo"""
+    dialecto = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialecto == "sqlite":
+                existia = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                    {"name": FTS_TABLE},
+                ).first() is not None
+                for ddl in _SQLITE_DDL:
+                    conn.execute(text(ddl))
+                if not existia:
+                    # Indexar los videos que ya estaban en la tabla
+                    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            elif dialecto == "postgresql":
+                for ddl in _POSTGRES_DDL:
+                    conn.execute(text(ddl))
+            else:
+                return
+    except Exception as e:
+        print(f"Índice full-text no disponible ({dialecto}), se usará ILIKE: {e}")
+        return
+
+    _dialectos_disponibles.add(dialecto)
+
+
+def _raiz(token: str) -> str:
+    """Reduce plurales simples del español para que el prefijo los cubra"""
+    if len(token) > 4 and token.endswith("es"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def _terminos(keyword: str) -> list[str]:
+    return [_raiz(t) for t in re.findall(r"\w+", keyword.lower())]
+
+
+def _consulta_fts5(keywords: list[str]) -> str:
+    # Cada keyword es una frase con prefijo en el último término; se combinan con OR
+    frases = []
+    for keyword in keywords:
+        terminos = _terminos(keyword)
+        if terminos:
+            frases.append('"' + " ".join(terminos) + '"*')
+    return " OR ".join(frases)
+
+
+def _consulta_tsquery(keywords: list[str]) -> str:
+    # Términos de una keyword con AND y prefijo, keywords entre sí con OR
+    grupos = []
+    for keyword in keywords:
+        terminos = _terminos(keyword)
+        if terminos:
+            grupos.append("(" + " & ".join(f"{t}:*" for t in terminos) + ")")
+    return " | ".join(grupos)
+
+
+def buscar_ids_videos(db: Session, keywords: list[str], limit: int = 5) -> list[int] | None:
+    """
+    Devuelve los IDs de los videos que coinciden con alguna keyword,
+    ordenados por relevancia. None si el índice no está disponible.
+    """
+    dialecto = db.get_bind().dialect.name
+    if dialecto not in _dialectos_disponibles:
+        return None
+
+    if dialecto == "sqlite":
+        consulta = _consulta_fts5(keywords)
+        if not consulta:
+            return []
+        filas = db.execute(
+            text(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :consulta "
+                f"ORDER BY bm25({FTS_TABLE}, :w_titulo, :w_descripcion, :w_tags) LIMIT :limit"
+            ),
+            {
+                "consulta": consulta,
+                "w_titulo": PESO_TITULO,
+                "w_descripcion": PESO_DESCRIPCION,
+                "w_tags": PESO_TAGS,
+                "limit": limit,
+            },
+        )
+    else:
+        consulta = _consulta_tsquery(keywords)
+        if not consulta:
+            return []
+        filas = db.execute(
+            text(
+                f"SELECT id FROM videos, to_tsquery('spanish', f_unaccent(:consulta)) AS q "
+                f"WHERE ({_PG_DOCUMENTO}) @@ q "
+                f"ORDER BY ts_rank_cd({_PG_DOCUMENTO}, q) DESC LIMIT :limit"
+            ),
+            {"consulta": consulta, "limit": limit},
+        )
+
+    return [fila[0] for fila in filas]
@@ -0,0 +1,168 @@
+"""
+Selección de campos y paginación por cursor para /temas/{slug}.
+
+    GET /temas/rag?fields=titulo,videos.youtube_id,videos.titulo&videos_limite=10
+
+- `fields`: campos del tema y, con prefijo `videos.` / `ejercicios.`, de sus
+  videos y ejercicios. `videos` a secas incluye todos los campos del video; si
+  no se nombra ni `videos` ni ningún `videos.x`, los videos no se devuelven
+  (igual con los ejercicios). El `id` se incluye siempre.
+- `videos_limite` / `ejercicios_limite` y `videos_cursor` / `ejercicios_cursor`:
+  páginas ordenadas por (orden, id), con `orden` nulo como 0; la respuesta trae `videos_siguiente` /
+  `ejercicios_siguiente` con el cursor de la página siguiente (o null).
+
+Solo se leen de la BD las columnas pedidas (`load_only`), así que una vista
+que solo necesita títulos no arrastra las descripciones completas.
+"""
+import base64
+from dataclasses import dataclass
+
+import orjson
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, load_only
+
+from models import Tema, Video, Ejercicio, clave_orden
+
+# Campo público -> columna (preguntas es el JSON guardado en `contenido`)
+CAMPOS_TEMA = {"id": Tema.id, "slug": Tema.slug, "titulo": Tema.titulo, "descripcion": Tema.descripcion}
+CAMPOS_VIDEO = {
+    "id": Video.id, "youtube_id": Video.youtube_id, "titulo": Video.titulo,
+    "descripcion": Video.descripcion, "tags": Video.tags, "orden": Video.orden,
+}
+CAMPOS_EJERCICIO = {
+    "id": Ejercicio.id, "titulo": Ejercicio.titulo, "tipo": Ejercicio.tipo,
+    "preguntas": Ejercicio.contenido, "orden": Ejercicio.orden,
+}
+# Los que se devuelven con `videos` / `ejercicios` a secas, como en la respuesta completa
+TODOS_VIDEO = ("id", "youtube_id", "titulo", "descripcion", "tags", "orden")
+TODOS_EJERCICIO = ("id", "titulo", "tipo", "preguntas")
+
+
+class SeleccionInvalida(ValueError):
+    """Campo desconocido o cursor mal formado (se responde con 400)"""
+
+
+@dataclass(frozen=True)
+class Seleccion:
+    tema: tuple[str, ...]
+    videos: tuple[str, ...] | None  # None = no incluir videos
+    ejercicios: tuple[str, ...] | None
+
+
+@dataclass(frozen=True)
+class Pagina:
+    limite: int | None = None
+    cursor: tuple[int, int | str] | None = None
+
+
+def parsear_campos(fields: str | None) -> Seleccion:
+    """Interpreta `fields`; sin él se devuelve todo, como la respuesta completa"""
+    if not fields:
+        return Seleccion(tuple(CAMPOS_TEMA), TODOS_VIDEO, TODOS_EJERCICIO)
+
+    tema: list[str] = []
+    hijos: dict[str, list[str]] = {}
+    for campo in (c.strip() for c in fields.split(",")):
+        if not campo:
+            continue
+        relacion, _, nombre = campo.partition(".")
+        if relacion in ("videos", "ejercicios"):
+            disponibles = CAMPOS_VIDEO if relacion == "videos" else CAMPOS_EJERCICIO
+            todos = TODOS_VIDEO if relacion == "videos" else TODOS_EJERCICIO
+            if nombre and nombre not in disponibles:
+                raise SeleccionInvalida(f"Campo desconocido: {campo}")
+            hijos.setdefault(relacion, []).extend([nombre] if nombre else todos)
+        elif campo in CAMPOS_TEMA:
+            tema.append(campo)
+        else:
+            raise SeleccionInvalida(f"Campo desconocido: {campo}")
+
+    def normalizar(campos: list[str] | None) -> tuple[str, ...] | None:
+        if campos is None:
+            return None
+        # id primero y sin duplicados, respetando el orden pedido
+        return tuple(dict.fromkeys(["id", *campos]))
+
+    return Seleccion(normalizar(tema), normalizar(hijos.get("videos")), normalizar(hijos.get("ejercicios")))
+
+
+def codificar_cursor(orden: int, id_: int | str) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([orden, id_])).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str | None) -> tuple[int, int | str] | None:
+    if not cursor:
+        return None
+    try:
+        orden, id_ = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise SeleccionInvalida("Cursor no válido")
+    return orden, id_
+
+
+def _pagina(db: Session, modelo, tema_id: str, campos: tuple[str, ...], columnas: dict, pagina: Pagina):
+    """Filas de una relación en orden (orden, id), solo con las columnas pedidas
+
+    Devuelve (filas, cursor de la página siguiente o None).
+    """
+    # orden e id hacen falta para ordenar y construir el cursor
+    cargar = {columnas[c] for c in campos} | {modelo.orden, modelo.id}
+    orden_col, id_col = clave_orden(modelo)
+    query = (
+        db.query(modelo)
+        .options(load_only(*cargar))
+        .filter(modelo.tema_id == tema_id)
+        .order_by(orden_col, id_col)
+    )
+    if pagina.cursor is not None:
+        orden, id_ = pagina.cursor
+        if type(orden) is not int or type(id_) is not modelo.id.type.python_type:
+            raise SeleccionInvalida("Cursor no válido")
+        query = query.filter(or_(orden_col > orden, and_(orden_col == orden, id_col > id_)))
+    if pagina.limite is None:
+        return query.all(), None
+
+    filas = query.limit(pagina.limite + 1).all()
+    if len(filas) <= pagina.limite:
+        return filas, None
+    filas = filas[:pagina.limite]
+    ultima = filas[-1]
+    return filas, codificar_cursor(ultima.orden if ultima.orden is not None else 0, ultima.id)
+
+
+def _fila(obj, campos: tuple[str, ...], columnas: dict) -> dict:
+    fila = {}
+    for campo in campos:
+        if campo == "preguntas":
+            # El JSON guardado se inserta tal cual, sin decodificarlo
+            fila[campo] = orjson.Fragment(obj.contenido)
+        else:
+            fila[campo] = getattr(obj, columnas[campo].key)
+    return fila
+
+
+def tema_parcial_json(
+    db: Session, slug: str, seleccion: Seleccion, videos: Pagina = Pagina(), ejercicios: Pagina = Pagina(),
+) -> bytes | None:
+    """JSON del tema con los campos y páginas pedidos (None si no existe)"""
+    tema = (
+        db.query(Tema)
+        .options(load_only(*(CAMPOS_TEMA[c] for c in seleccion.tema)))
+        .filter(Tema.slug == slug)
+        .first()
+    )
+    if tema is None:
+        return None
+
+    cuerpo = _fila(tema, seleccion.tema, CAMPOS_TEMA)
+    for nombre, modelo, columnas, campos, pagina in (
+        ("videos", Video, CAMPOS_VIDEO, seleccion.videos, videos),
+        ("ejercicios", Ejercicio, CAMPOS_EJERCICIO, seleccion.ejercicios, ejercicios),
+    ):
+        if campos is None:
+            continue
+        filas, siguiente = _pagina(db, modelo, tema.id, campos, columnas, pagina)
+        cuerpo[nombre] = [_fila(f, campos, columnas) for f in filas]
+        if pagina.limite is not None or pagina.cursor is not None:
+            cuerpo[f"{nombre}_siguiente"] = siguiente
+    return orjson.dumps(cuerpo)
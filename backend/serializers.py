@@ -0,0 +1,60 @@
+"""
+Serialización rápida de las respuestas del catálogo.
+
+`Ejercicio.contenido` ya se guarda como JSON válido (lo garantiza el validador
+del modelo), así que en lugar de hacer json.loads + validación Pydantic +
+volver a codificar, sus bytes se insertan tal cual en la respuesta. El resto
+de campos se codifica con orjson.
+"""
+import orjson
+
+from models import Tema, Video, Ejercicio
+
+
+def video_dict(v: Video) -> dict:
+    return {
+        "id": v.id,
+        "youtube_id": v.youtube_id,
+        "titulo": v.titulo,
+        "descripcion": v.descripcion,
+        "tags": v.tags,
+        "orden": v.orden,
+    }
+
+
+def ejercicio_json(e: Ejercicio) -> bytes:
+    """Ejercicio como JSON, con `preguntas` copiado directamente de `contenido`"""
+    return b'{"id":%s,"titulo":%s,"tipo":%s,"preguntas":%s}' % (
+        orjson.dumps(e.id),
+        orjson.dumps(e.titulo),
+        orjson.dumps(e.tipo),
+        e.contenido.encode(),
+    )
+
+
+def tema_detail_json(tema: Tema) -> bytes:
+    """Cuerpo de TemaDetailResponse"""
+    return b'{"id":%s,"slug":%s,"titulo":%s,"descripcion":%s,"videos":%s,"ejercicios":[%s]}' % (
+        orjson.dumps(tema.id),
+        orjson.dumps(tema.slug),
+        orjson.dumps(tema.titulo),
+        orjson.dumps(tema.descripcion),
+        orjson.dumps([video_dict(v) for v in tema.videos]),
+        b",".join(ejercicio_json(e) for e in tema.ejercicios),
+    )
+
+
+def temas_list_json(temas: list[tuple[Tema, int, int]]) -> bytes:
+    """Cuerpo de list[TemaListResponse] a partir de get_all_temas_con_totales"""
+    return orjson.dumps([
+        {
+            "id": t.id,
+            "slug": t.slug,
+            "titulo": t.titulo,
+            "descripcion": t.descripcion,
+            "orden": t.orden,
+            "total_videos": total_videos,
+            "total_ejercicios": total_ejercicios
+        }
+        for t, total_videos, total_ejercicios in temas
+    ])
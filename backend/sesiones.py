@@ -0,0 +1,295 @@
+"""
+Sesiones de chat guardadas en el servidor (/chat/sesiones).
+
+El cliente crea una conversación y después manda solo el mensaje nuevo; el
+historial completo (incluidas las tool calls y sus resultados) vive aquí:
+
+- memoria: LRU acotado a CHAT_SESSION_MAX_MEMORY sesiones, con caducidad
+  CHAT_SESSION_TTL segundos desde el último uso
+- base de datos (opcional, CHAT_SESSION_PERSIST=1): tabla `chat_sessions`,
+  escrita en diferido (ver diferido.py), para que las sesiones sobrevivan a
+  reinicios, a la expulsión del LRU y se compartan entre workers
+
+Cada sesión lleva una `version` que sube en cada turno guardado. Con la BD
+activada:
+- al obtener una sesión de memoria se compara su versión con la de la BD; si
+  otro worker la ha avanzado, se recarga (salvo que aquí haya un turno sin
+  volcar, que es lo más reciente)
+- una sesión expulsada del LRU con la escritura aún pendiente se recupera de
+  esa escritura, no de la fila desfasada de la BD
+- el volcado solo sobrescribe la fila si sigue en la versión de la que partió
+  el turno. Si dos workers atienden a la vez turnos de la misma sesión (antes
+  de que se vuelque el primero), el segundo volcado se descarta como conflicto
+  y ese worker recarga la sesión de la BD: el historial no se mezcla, pero ese
+  turno no queda guardado
+
+Como el historial guardado no cambia entre turnos, el resumen de los mensajes
+antiguos (contexto.py) se reutiliza turno tras turno.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from database import run_db, run_db_lectura
+from diferido import VolcadoDiferido
+from models import ChatSession
+
+logger = logging.getLogger(__name__)
+
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", str(6 * 3600)))
+CHAT_SESSION_MAX_MEMORY = int(os.getenv("CHAT_SESSION_MAX_MEMORY", "2000"))
+CHAT_SESSION_MAX_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "200"))
+CHAT_SESSION_PERSIST = os.getenv("CHAT_SESSION_PERSIST", "0") == "1"
+CHAT_SESSION_FLUSH_INTERVAL = float(os.getenv("CHAT_SESSION_FLUSH_INTERVAL", "2"))
+
+# Cada cuánto se borran de la BD las sesiones caducadas
+_PURGAR_CADA = 600
+
+
+@dataclass
+class Sesion:
+    id: str
+    messages: list[dict]
+    ultimo_uso: float = field(default_factory=time.time)
+    version: int = 0
+    # Un turno a la vez por sesión: dos mensajes simultáneos mezclarían el historial
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def caducada(self) -> bool:
+        return time.time() - self.ultimo_uso > CHAT_SESSION_TTL
+
+    def recortar(self):
+        """Limita el historial guardado (el sistema se conserva siempre)"""
+        sobran = len(self.messages) - CHAT_SESSION_MAX_MESSAGES
+        if sobran <= 0:
+            return
+        inicio = 1 + sobran
+        # Sin resultados de tools huérfanos al principio
+        while inicio < len(self.messages) - 1 and self.messages[inicio]["role"] == "tool":
+            inicio += 1
+        del self.messages[1:inicio]
+
+
+def persistir(filas: list[dict], db: Session) -> list[dict]:
+    """Upsert de cada fila solo si la BD sigue en su versión `base`; devuelve las que no se escribieron"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    conflictos = []
+    for fila in filas:
+        stmt = insert(ChatSession).values(
+            id=fila["id"], messages=fila["messages"], version=fila["version"], updated_at=fila["updated_at"],
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={
+                "messages": stmt.excluded.messages,
+                "version": stmt.excluded.version,
+                "updated_at": stmt.excluded.updated_at,
+            },
+            where=ChatSession.version == fila["base"],
+        )
+        if db.execute(stmt).rowcount == 0:
+            conflictos.append(fila)
+    db.commit()
+    return conflictos
+
+
+def _mas_reciente(nueva: dict, actual: dict) -> bool:
+    return nueva["version"] >= actual["version"]
+
+
+def _marca(updated_at: datetime) -> float:
+    # updated_at está en UTC sin zona
+    return updated_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _cargar(session_id: str, db: Session) -> tuple[list[dict], int, datetime] | None:
+    fila = db.get(ChatSession, session_id)
+    if fila is None:
+        return None
+    return json.loads(fila.messages), fila.version, fila.updated_at
+
+
+def _version(session_id: str, db: Session) -> int | None:
+    return db.query(ChatSession.version).filter(ChatSession.id == session_id).scalar()
+
+
+def _borrar(session_id: str, db: Session):
+    db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+    db.commit()
+
+
+def _purgar(db: Session):
+    limite = datetime.utcnow() - timedelta(seconds=CHAT_SESSION_TTL)
+    db.execute(delete(ChatSession).where(ChatSession.updated_at < limite))
+    db.commit()
+
+
+class AlmacenSesiones:
+    def __init__(self, persistente: bool = CHAT_SESSION_PERSIST, max_memoria: int = CHAT_SESSION_MAX_MEMORY):
+        self.persistente = persistente
+        self.max_memoria = max_memoria
+        self._memoria: OrderedDict[str, Sesion] = OrderedDict()
+        self._lock = threading.Lock()
+        self._escrituras = VolcadoDiferido(
+            "chat_sessions", self._persistir, _mas_reciente, CHAT_SESSION_FLUSH_INTERVAL, 500,
+            tras_volcar=self._purgar_si_toca,
+        )
+        self._ultima_purga = 0.0
+        self.creadas = 0
+        self.recuperadas_bd = 0
+        self.recuperadas_pendientes = 0
+        self.conflictos = 0
+
+    def _en_memoria(self, sesion: Sesion):
+        with self._lock:
+            self._memoria[sesion.id] = sesion
+            self._memoria.move_to_end(sesion.id)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def crear(self, messages: list[dict]) -> Sesion:
+        sesion = Sesion(id=secrets.token_urlsafe(16), messages=messages)
+        sesion.recortar()
+        self._en_memoria(sesion)
+        self.creadas += 1
+        self.guardar(sesion)
+        return sesion
+
+    def _sustituir(self, sesion: Sesion) -> Sesion:
+        """Guarda en memoria la sesión cargada, salvo que ya haya una copia igual o más nueva"""
+        with self._lock:
+            existente = self._memoria.get(sesion.id)
+            if existente is not None and existente.version >= sesion.version:
+                return existente
+        self._en_memoria(sesion)
+        return sesion
+
+    def _quitar(self, session_id: str, version: int | None = None):
+        """Quita la copia en memoria (solo si sigue en `version`, si se indica)"""
+        with self._lock:
+            sesion = self._memoria.get(session_id)
+            if sesion is not None and (version is None or sesion.version == version):
+                del self._memoria[session_id]
+
+    async def obtener(self, session_id: str) -> Sesion | None:
+        with self._lock:
+            sesion = self._memoria.get(session_id)
+            if sesion is not None:
+                if sesion.caducada():
+                    del self._memoria[session_id]
+                    return None
+                self._memoria.move_to_end(session_id)
+        if not self.persistente:
+            return sesion
+
+        pendiente = self._escrituras.pendiente(session_id)
+        if pendiente is not None:
+            # Turno aún sin volcar: esta copia es más reciente que la BD
+            if sesion is not None:
+                return sesion
+            self.recuperadas_pendientes += 1
+            return self._sustituir(Sesion(
+                id=session_id,
+                messages=json.loads(pendiente["messages"]),
+                ultimo_uso=_marca(pendiente["updated_at"]),
+                version=pendiente["version"],
+            ))
+
+        if sesion is not None:
+            version_bd = await run_db_lectura(_version, session_id)
+            if version_bd == sesion.version:
+                return sesion
+            if version_bd is None:
+                # Borrada (o purgada) desde otro worker
+                self._quitar(session_id, sesion.version)
+                return None
+
+        # No está en memoria u otro worker la ha avanzado: se carga de la BD
+        cargada = await run_db_lectura(_cargar, session_id)
+        if cargada is None:
+            return None
+        messages, version, updated_at = cargada
+        sesion = Sesion(id=session_id, messages=messages, ultimo_uso=_marca(updated_at), version=version)
+        if sesion.caducada():
+            return None
+        self.recuperadas_bd += 1
+        return self._sustituir(sesion)
+
+    def guardar(self, sesion: Sesion):
+        """Marca el uso, sube la versión y programa la escritura en la BD (si está activada)"""
+        sesion.ultimo_uso = time.time()
+        sesion.recortar()
+        # Si hay un turno anterior sin volcar, este lo sustituye y parte de la misma base
+        pendiente = self._escrituras.pendiente(sesion.id) if self.persistente else None
+        base = pendiente["base"] if pendiente is not None else sesion.version
+        sesion.version += 1
+        if self.persistente:
+            self._escrituras.apuntar(sesion.id, {
+                "id": sesion.id,
+                "messages": json.dumps(sesion.messages, ensure_ascii=False),
+                "version": sesion.version,
+                "base": base,
+                "updated_at": datetime.utcnow(),
+            })
+
+    def _persistir(self, filas: list[dict], db: Session):
+        for fila in persistir(filas, db):
+            # Otro worker escribió antes un turno de la misma sesión: gana el suyo
+            logger.warning("Conflicto de versión en la sesión de chat %s; se recargará de la BD", fila["id"])
+            self.conflictos += 1
+            self._quitar(fila["id"], fila["version"])
+
+    async def borrar(self, session_id: str) -> bool:
+        with self._lock:
+            estaba = self._memoria.pop(session_id, None) is not None
+        if self.persistente:
+            self._escrituras.descartar(session_id)
+            await run_db(_borrar, session_id)
+        return estaba
+
+    def resumen(self) -> dict:
+        return {
+            "en_memoria": len(self._memoria),
+            "max_memoria": self.max_memoria,
+            "ttl_segundos": CHAT_SESSION_TTL,
+            "persistente": self.persistente,
+            "creadas": self.creadas,
+            "recuperadas_bd": self.recuperadas_bd,
+            "recuperadas_pendientes": self.recuperadas_pendientes,
+            "conflictos": self.conflictos,
+            "escrituras_pendientes": len(self._escrituras),
+        }
+
+    async def _purgar_si_toca(self):
+        if time.monotonic() - self._ultima_purga < _PURGAR_CADA:
+            return
+        self._ultima_purga = time.monotonic()
+        try:
+            await run_db(_purgar)
+        except Exception:
+            logger.exception("No se pudieron purgar las sesiones de chat caducadas")
+
+    async def iniciar(self):
+        if self.persistente:
+            await self._escrituras.iniciar()
+
+    async def detener(self):
+        if self.persistente:
+            await self._escrituras.detener()
+
+
+sesiones = AlmacenSesiones()
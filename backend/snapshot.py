@@ -0,0 +1,115 @@
+"""
+Snapshot del catálogo completo para los builds estáticos del frontend.
+
+En lugar de pedir /temas y luego /temas/{slug} por cada tema (N+1 peticiones,
+cada una con sus consultas), el build lee un único fichero NDJSON: una línea
+por tema, con el mismo JSON que devuelve /temas/{slug}, en orden. Se genera
+con tres consultas en total (temas, videos y ejercicios).
+
+El fichero se nombra por su contenido (`catalogo-<sha256>.ndjson`) y lo
+acompaña `manifest.json` con el hash de cada tema, para que un build
+incremental pueda saltarse los que no han cambiado:
+
+    python snapshot.py --salida ../frontend/snapshot
+
+También se sirve en GET /catalogo/snapshot y GET /catalogo/manifest,
+cacheado por versión del contenido como el resto del catálogo.
+"""
+import argparse
+import hashlib
+from pathlib import Path
+
+import orjson
+from sqlalchemy.orm import Session
+
+from crud import get_catalogo_completo
+from database import SessionLocal, init_db
+from serializers import tema_detail_json
+
+FORMATO = "ndjson"
+
+
+def _sha256(datos: bytes) -> str:
+    return hashlib.sha256(datos).hexdigest()
+
+
+def exportar(db: Session) -> bytes:
+    """Catálogo entero en NDJSON (un tema por línea)"""
+    return b"".join(tema_detail_json(tema) + b"\n" for tema in get_catalogo_completo(db))
+
+
+def manifest(ndjson: bytes) -> dict:
+    """Índice del snapshot: fichero, hash global y hash de cada tema"""
+    temas = []
+    for linea, fila in enumerate(ndjson.splitlines()):
+        tema = orjson.loads(fila)
+        temas.append({
+            "slug": tema["slug"],
+            "id": tema["id"],
+            "titulo": tema["titulo"],
+            "descripcion": tema["descripcion"],
+            "total_videos": len(tema["videos"]),
+            "total_ejercicios": len(tema["ejercicios"]),
+            "linea": linea,
+            "sha256": _sha256(fila),
+        })
+    sha = _sha256(ndjson)
+    return {
+        "formato": FORMATO,
+        "archivo": f"catalogo-{sha[:16]}.{FORMATO}",
+        "sha256": sha,
+        "bytes": len(ndjson),
+        "temas": temas,
+    }
+
+
+def cambios(anterior: dict | None, actual: dict) -> dict:
+    """Slugs nuevos, modificados y eliminados respecto a un manifest anterior"""
+    antes = {t["slug"]: t["sha256"] for t in (anterior or {}).get("temas", [])}
+    ahora = {t["slug"]: t["sha256"] for t in actual["temas"]}
+    return {
+        "nuevos": sorted(ahora.keys() - antes.keys()),
+        "modificados": sorted(s for s in ahora.keys() & antes.keys() if ahora[s] != antes[s]),
+        "eliminados": sorted(antes.keys() - ahora.keys()),
+    }
+
+
+def escribir(salida: Path, ndjson: bytes) -> tuple[dict, dict]:
+    """Escribe el snapshot y su manifest en `salida`; devuelve (manifest, cambios)"""
+    salida.mkdir(parents=True, exist_ok=True)
+    ruta_manifest = salida / "manifest.json"
+    anterior = orjson.loads(ruta_manifest.read_bytes()) if ruta_manifest.exists() else None
+
+    actual = manifest(ndjson)
+    archivo = salida / actual["archivo"]
+    if not archivo.exists():
+        archivo.write_bytes(ndjson)
+    ruta_manifest.write_bytes(orjson.dumps(actual, option=orjson.OPT_INDENT_2))
+
+    # El snapshot anterior ya no lo referencia nadie
+    if anterior and anterior.get("archivo") != actual["archivo"]:
+        (salida / anterior["archivo"]).unlink(missing_ok=True)
+    return actual, cambios(anterior, actual)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--salida", type=Path, default=Path("snapshot"), help="directorio de destino")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        ndjson = exportar(db)
+    finally:
+        db.close()
+
+    actual, diff = escribir(args.salida, ndjson)
+    print(f"{len(actual['temas'])} temas -> {args.salida / actual['archivo']} ({actual['bytes']} bytes)")
+    for tipo, slugs in diff.items():
+        if slugs:
+            print(f"  {tipo}: {', '.join(slugs)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Configuración común de los tests.
+
+Cada ejecución usa una base de datos SQLite y un índice de videos en un
+directorio temporal, con un catálogo sintético pequeño (bench/seed.py), y
+nunca llama al LLM real: los tests que corrigen sustituyen `completar`.
+
+    cd backend
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Antes de importar nada del backend: database.py crea los engines al importarse
+_TMP = Path(tempfile.mkdtemp(prefix="rincon-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP / 'test.db'}"
+os.environ["VIDEO_INDEX_DIR"] = str(_TMP / "indice_videos")
+os.environ["OPENROUTER_API_KEY"] = ""
+os.environ["CACHE_VERSION_TTL"] = "0"  # los cambios del catálogo se ven al momento
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bench.seed import sembrar, slug_tema
+from database import SessionLocal
+
+TEMAS = 2
+VIDEOS_POR_TEMA = 5
+EJERCICIOS_POR_TEMA = 3
+
+sembrar(TEMAS, VIDEOS_POR_TEMA, EJERCICIOS_POR_TEMA)
+
+import main  # noqa: E402  (después de sembrar: el arranque indexa los videos)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def db():
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+@pytest.fixture
+def slug() -> str:
+    return slug_tema(1)
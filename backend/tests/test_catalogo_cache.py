@@ -0,0 +1,84 @@
+"""CatalogCache: invalidación por versión del contenido, ETag/304 y locks por clave"""
+import pytest
+from fastapi import HTTPException
+
+from cache import CatalogCache, catalogo
+from database import marcar_catalogo_modificado
+from models import Video
+
+
+def _modificar_catalogo(db):
+    marcar_catalogo_modificado(db)
+    db.commit()
+
+
+def test_obtener_construye_una_vez_por_version(db):
+    cache = CatalogCache(version_ttl=0)
+    llamadas = []
+
+    def construir() -> bytes:
+        llamadas.append(1)
+        return b'{"n": %d}' % len(llamadas)
+
+    primera = cache.obtener(("prueba",), db, construir)
+    assert cache.obtener(("prueba",), db, construir) is primera
+    assert len(llamadas) == 1
+
+    _modificar_catalogo(db)
+    segunda = cache.obtener(("prueba",), db, construir)
+    assert len(llamadas) == 2
+    assert segunda.body != primera.body
+    assert segunda.etag != primera.etag
+
+
+def test_no_quedan_locks_tras_construir(db):
+    cache = CatalogCache(version_ttl=0)
+    cache.obtener(("existe",), db, lambda: b"{}")
+
+    def no_existe() -> bytes:
+        raise HTTPException(404, "Tema no encontrado")
+
+    for i in range(20):
+        with pytest.raises(HTTPException):
+            cache.obtener(("no_existe", i), db, no_existe)
+    assert cache._locks == {}
+    assert len(cache._entradas) == 1
+
+
+def test_parciales_en_lru_acotado(db):
+    cache = CatalogCache(version_ttl=0, max_parciales=2)
+    for i in range(3):
+        entrada = cache.obtener_parcial(("parcial", i), db, lambda: b"[]")
+        assert entrada.rapida
+    assert len(cache._parciales) == 2
+    assert ("parcial", 0) not in {clave[1:] for clave in cache._parciales}
+
+
+def test_etag_y_304(client, slug):
+    respuesta = client.get(f"/temas/{slug}")
+    assert respuesta.status_code == 200
+    etag = respuesta.headers["etag"]
+
+    respuesta = client.get(f"/temas/{slug}", headers={"If-None-Match": etag})
+    assert respuesta.status_code == 304
+    assert respuesta.content == b""
+
+
+def test_cambio_en_el_catalogo_invalida_la_respuesta(client, db, slug):
+    antes = client.get(f"/temas/{slug}")
+    tema_id = antes.json()["id"]
+
+    # El flush de un Video sube la versión del contenido (listener after_flush)
+    db.add(Video(tema_id=tema_id, youtube_id="nuevo", titulo="Video añadido en el test", orden=99))
+    db.commit()
+
+    despues = client.get(f"/temas/{slug}", headers={"If-None-Match": antes.headers["etag"]})
+    assert despues.status_code == 200
+    assert despues.headers["etag"] != antes.headers["etag"]
+    assert "Video añadido en el test" in [v["titulo"] for v in despues.json()["videos"]]
+
+
+def test_temas_inexistentes_no_dejan_locks(client):
+    for i in range(10):
+        assert client.get(f"/temas/no-existe-{i}").status_code == 404
+    assert catalogo._locks == {}
@@ -0,0 +1,78 @@
+"""Campos y paginación de /temas/{slug}: validación de `fields` y de los cursores"""
+import base64
+
+import orjson
+import pytest
+
+from cache import catalogo
+from seleccion import SeleccionInvalida, codificar_cursor, decodificar_cursor, parsear_campos
+
+
+def _cursor_crudo(valor) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(valor)).decode().rstrip("=")
+
+
+def test_cursor_ida_y_vuelta():
+    assert decodificar_cursor(codificar_cursor(3, 42)) == (3, 42)
+    assert decodificar_cursor(codificar_cursor(0, "bench-0001-02")) == (0, "bench-0001-02")
+    assert decodificar_cursor(None) is None
+
+
+@pytest.mark.parametrize("cursor", ["@@@", "bm8", _cursor_crudo(5), _cursor_crudo([1, 2, 3]), _cursor_crudo({})])
+def test_cursor_mal_formado(cursor):
+    with pytest.raises(SeleccionInvalida):
+        decodificar_cursor(cursor)
+
+
+def test_campos_normalizados():
+    seleccion = parsear_campos("titulo, videos.titulo,videos.titulo")
+    assert seleccion.tema == ("id", "titulo")
+    assert seleccion.videos == ("id", "titulo")
+    assert seleccion.ejercicios is None
+    assert parsear_campos("videos.titulo,titulo") == seleccion
+
+
+@pytest.mark.parametrize("fields", ["zzz", "videos.zzz", "ejercicios.respuestas"])
+def test_campo_desconocido(fields):
+    with pytest.raises(SeleccionInvalida):
+        parsear_campos(fields)
+
+
+@pytest.mark.parametrize("query", [
+    "fields=zzz",
+    "videos_cursor=@@@",
+    f"videos_cursor={_cursor_crudo(['a', 1])}",  # orden no entero
+    f"videos_cursor={_cursor_crudo([0, 'texto'])}",  # id de video no entero
+    f"ejercicios_cursor={_cursor_crudo([0, 7])}",  # id de ejercicio no texto
+])
+def test_query_invalida_da_400(client, slug, query):
+    respuesta = client.get(f"/temas/{slug}?{query}")
+    assert respuesta.status_code == 400
+
+
+def test_paginacion_recorre_todo_sin_repetir(client, slug):
+    completo = [v["id"] for v in client.get(f"/temas/{slug}").json()["videos"]]
+
+    vistos, cursor = [], None
+    while True:
+        query = "fields=videos.titulo&videos_limite=2" + (f"&videos_cursor={cursor}" if cursor else "")
+        pagina = client.get(f"/temas/{slug}?{query}").json()
+        assert len(pagina["videos"]) <= 2
+        vistos += [v["id"] for v in pagina["videos"]]
+        cursor = pagina["videos_siguiente"]
+        if cursor is None:
+            break
+    assert vistos == completo
+
+
+def test_respuesta_parcial_cacheada_con_query_normalizada(client, slug):
+    catalogo._parciales.clear()
+    a = client.get(f"/temas/{slug}?fields=titulo,videos.titulo&videos_limite=2")
+    b = client.get(f"/temas/{slug}?videos_limite=2&fields=videos.titulo,titulo")
+    assert a.status_code == b.status_code == 200
+    assert a.headers["etag"] == b.headers["etag"]
+    assert len(catalogo._parciales) == 1
+
+    # Un 404 no se guarda
+    assert client.get("/temas/no-existe?fields=titulo").status_code == 404
+    assert len(catalogo._parciales) == 1
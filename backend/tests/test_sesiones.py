@@ -0,0 +1,87 @@
+"""Sesiones de chat persistentes: versión por turno y conflictos entre workers"""
+import asyncio
+
+from sesiones import AlmacenSesiones
+
+SISTEMA = {"role": "system", "content": "Eres un asistente"}
+
+
+def _worker() -> AlmacenSesiones:
+    # Cada instancia hace de un worker distinto con su propia memoria
+    return AlmacenSesiones(persistente=True)
+
+
+def _turno(almacen: AlmacenSesiones, sesion, texto: str):
+    sesion.messages.append({"role": "user", "content": texto})
+    almacen.guardar(sesion)
+
+
+def test_conflicto_de_version_gana_la_primera_escritura():
+    async def escenario():
+        a, b = _worker(), _worker()
+        sesion_a = a.crear([SISTEMA])
+        await a._escrituras.volcar()
+        sesion_b = await b.obtener(sesion_a.id)
+        assert sesion_b.version == sesion_a.version == 1
+
+        # Los dos workers escriben un turno partiendo de la misma versión
+        _turno(a, sesion_a, "desde A")
+        _turno(b, sesion_b, "desde B")
+        await b._escrituras.volcar()
+        await a._escrituras.volcar()
+
+        assert (a.conflictos, b.conflictos) == (1, 0)
+        # A descarta su copia y recarga la de B en vez de sobrescribirla
+        recargada = await a.obtener(sesion_a.id)
+        assert recargada.version == 2
+        assert recargada.messages[-1]["content"] == "desde B"
+
+    asyncio.run(escenario())
+
+
+def test_copia_en_memoria_atrasada_se_recarga():
+    async def escenario():
+        a, b = _worker(), _worker()
+        sesion_a = a.crear([SISTEMA])
+        await a._escrituras.volcar()
+        sesion_b = await b.obtener(sesion_a.id)
+
+        for i in range(2):
+            _turno(b, sesion_b, f"turno {i}")
+            await b._escrituras.volcar()
+
+        actual = await a.obtener(sesion_a.id)
+        assert actual is not sesion_a
+        assert actual.version == 3
+        assert [m["content"] for m in actual.messages[1:]] == ["turno 0", "turno 1"]
+
+    asyncio.run(escenario())
+
+
+def test_turnos_sin_volcar_parten_de_la_misma_base():
+    async def escenario():
+        a = _worker()
+        sesion = a.crear([SISTEMA])
+        await a._escrituras.volcar()
+
+        _turno(a, sesion, "uno")
+        _turno(a, sesion, "dos")
+        pendiente = a._escrituras.pendiente(sesion.id)
+        assert (pendiente["base"], pendiente["version"]) == (1, 3)
+
+        await a._escrituras.volcar()
+        assert a.conflictos == 0
+        assert (await _worker().obtener(sesion.id)).version == 3
+
+    asyncio.run(escenario())
+
+
+def test_sesion_borrada_en_otro_worker():
+    async def escenario():
+        a, b = _worker(), _worker()
+        sesion = a.crear([SISTEMA])
+        await a._escrituras.volcar()
+        assert await b.borrar(sesion.id) is False  # no estaba en la memoria de B
+        assert await a.obtener(sesion.id) is None
+
+    asyncio.run(escenario())
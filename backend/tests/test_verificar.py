@@ -0,0 +1,73 @@
+"""/verificar: solo se aceptan (y cachean) notas numéricas finitas de 0 a 100"""
+import json
+import uuid
+
+import pytest
+
+import grading
+import main
+from ranking import normalizar_puntuacion
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Sustituye al LLM: devuelve `llm.contenido` y cuenta las llamadas"""
+    class FalsoLLM:
+        contenido = ""
+        llamadas = 0
+
+    async def completar(payload, **kwargs):
+        FalsoLLM.llamadas += 1
+        return {"choices": [{"message": {"content": FalsoLLM.contenido}}]}
+
+    monkeypatch.setattr(main, "OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(grading, "completar", completar)
+    return FalsoLLM
+
+
+def _envio(nickname: str | None = None) -> dict:
+    # Respuesta única por test: la caché de correcciones es compartida
+    return {
+        "tipo": "escrito",
+        "ejercicio_id": "bench-0001-01",
+        "respuestas": [{"pregunta": "¿Qué es un agente?", "respuesta": f"Un bucle con tools {uuid.uuid4()}"}],
+        "nickname": nickname,
+    }
+
+
+@pytest.mark.parametrize("puntuacion", ["NaN", "Infinity", "-Infinity", "150", "-1", "true", '"70"', "null"])
+def test_puntuacion_invalida_no_se_cachea(client, llm, puntuacion):
+    llm.contenido = f'{{"puntuacion": {puntuacion}, "feedback": {{}}}}'
+    envio = _envio(nickname="tester")
+
+    for llamadas in (1, 2):
+        respuesta = client.post("/verificar", json=envio)
+        assert respuesta.status_code == 500
+        assert respuesta.json()["detail"] == "Error parseando respuesta del LLM"
+        # Nada cacheado: el reenvío vuelve a preguntar al LLM
+        assert llm.llamadas == llamadas
+
+    assert client.get("/ranking/usuarios/tester").status_code == 404
+
+
+def test_puntuacion_valida_se_cachea_y_entra_en_el_ranking(client, llm):
+    llm.contenido = "```json\n" + json.dumps({"puntuacion": 70, "feedback": {"0": "Bien"}}) + "\n```"
+    envio = _envio(nickname="valida")
+
+    primera = client.post("/verificar", json=envio)
+    assert primera.status_code == 200
+    assert primera.json()["puntuacion"] == 70
+    assert primera.json()["ranking"]["mejor_puntuacion"] == 70
+
+    segunda = client.post("/verificar", json=envio)
+    assert segunda.status_code == 200
+    assert segunda.json()["puntuacion"] == 70
+    assert llm.llamadas == 1
+
+
+@pytest.mark.parametrize("valor,esperado", [
+    (70, 70), (70.4, 70), ("85", 85), (150, 100), (-3, 0),
+    (float("nan"), None), (float("inf"), None), ("abc", None), (None, None),
+])
+def test_normalizar_puntuacion(valor, esperado):
+    assert normalizar_puntuacion(valor) == esperado
@@ -0,0 +1,362 @@
+"""
+Índice vectorial local de los videos (titulo, descripcion y tags), sin red.
+
+La búsqueda full-text (search.py) solo encuentra términos literales; aquí cada
+video es un vector TF-IDF de n-gramas de caracteres, así que "conversaciones"
+se parece a "conversación" y "historial" a "historial de chat" aunque no
+coincida la palabra exacta.
+
+- Vectores: n-gramas de VIDEO_VECTOR_NGRAMAS caracteres por palabra (sin
+  acentos), proyectados con hashing a VIDEO_VECTOR_DIM dimensiones (con signo,
+  para que las colisiones se compensen). TF sublineal, IDF por dimensión y
+  normalización L2; el título pesa más que los tags y estos más que la
+  descripción.
+- Almacenamiento: una matriz float32 contigua (videos x dimensiones) en
+  VIDEO_INDEX_DIR, que se abre con memory-map al arrancar. Cada escritura
+  crea ficheros nuevos (una "generación") y meta.json, que se sustituye con
+  un único rename, apunta a la generación vigente: nunca se sobrescribe un
+  fichero abierto con memory-map (en Windows fallaría) y un lector no puede
+  mezclar la matriz de una escritura con los ids de otra.
+- Búsqueda: el coseno con todos los videos es un único producto
+  matriz-vector; el top-k sale de argpartition.
+- Actualización: cuando cambia la versión del contenido del catálogo se
+  comparan las huellas de cada video y solo se recalculan los nuevos o
+  modificados. El IDF de los demás se corrige al reconstruir entero, cuando
+  los cambios acumulados superan VIDEO_INDEX_REBUILD_RATIO. Fuera del
+  arranque se hace en un hilo aparte: las búsquedas no esperan y usan el
+  índice anterior hasta que termina.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import secrets
+import threading
+import unicodedata
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from cache import catalogo
+from database import SessionLectura
+from models import Video
+
+logger = logging.getLogger(__name__)
+
+VIDEO_INDEX_DIR = Path(os.getenv("VIDEO_INDEX_DIR", str(Path(__file__).parent / "indice_videos")))
+VIDEO_VECTOR_DIM = int(os.getenv("VIDEO_VECTOR_DIM", "4096"))
+VIDEO_VECTOR_NGRAMAS = tuple(int(n) for n in os.getenv("VIDEO_VECTOR_NGRAMAS", "3,4,5").split(","))
+VIDEO_VECTOR_MIN_SCORE = float(os.getenv("VIDEO_VECTOR_MIN_SCORE", "0.05"))
+VIDEO_INDEX_REBUILD_RATIO = float(os.getenv("VIDEO_INDEX_REBUILD_RATIO", "0.2"))
+
+# Veces que cuenta cada n-grama según el campo
+PESO_TITULO = 3
+PESO_TAGS = 2
+PESO_DESCRIPCION = 1
+
+FORMATO = 2
+
+
+def normalizar(texto: str | None) -> str:
+    """Minúsculas, sin acentos y solo letras/números separados por espacios"""
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", texto))
+
+
+def ngramas(texto: str) -> Counter:
+    """N-gramas de caracteres de cada palabra, con bordes para distinguir inicio y final"""
+    cuenta = Counter()
+    for palabra in normalizar(texto).split():
+        palabra = f" {palabra} "
+        for n in VIDEO_VECTOR_NGRAMAS:
+            cuenta.update(palabra[i:i + n] for i in range(len(palabra) - n + 1))
+    return cuenta
+
+
+def vector_tf(campos: list[tuple[str | None, int]], dim: int = VIDEO_VECTOR_DIM) -> np.ndarray:
+    """TF sublineal con hashing con signo (crc32: estable entre procesos, a diferencia de hash())"""
+    cuenta = Counter()
+    for texto, peso in campos:
+        for grama, veces in ngramas(texto).items():
+            cuenta[grama] += veces * peso
+
+    acumulado = np.zeros(dim, dtype=np.float32)
+    for grama, veces in cuenta.items():
+        h = zlib.crc32(grama.encode())
+        acumulado[h % dim] += (1 + math.log(veces)) * (1 if h & 0x80000000 else -1)
+    return acumulado
+
+
+def _campos(titulo, descripcion, tags) -> list[tuple[str | None, int]]:
+    return [(titulo, PESO_TITULO), (tags, PESO_TAGS), (descripcion, PESO_DESCRIPCION)]
+
+
+def _huella(titulo, descripcion, tags) -> str:
+    return hashlib.sha1("\0".join(x or "" for x in (titulo, descripcion, tags)).encode()).hexdigest()
+
+
+def _idf(n_videos: int, df: np.ndarray) -> np.ndarray:
+    return (np.log((1 + n_videos) / (1 + df)) + 1).astype(np.float32)
+
+
+def _hash_ids(ids: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(ids, dtype=np.int64).tobytes()).hexdigest()
+
+
+def _normalizar_filas(matriz: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1
+    return (matriz / normas).astype(np.float32, copy=False)
+
+
+@dataclass(frozen=True)
+class Estado:
+    """Contenido del índice; se sustituye entero en cada actualización"""
+    matriz: np.ndarray  # (videos, dim) float32, filas con norma 1
+    ids: np.ndarray  # (videos,) int64
+    df: np.ndarray  # (dim,) en cuántos videos aparece cada dimensión
+    huellas: dict[int, str]
+    cambios: int  # videos recalculados desde la última reconstrucción completa
+
+    @property
+    def idf(self) -> np.ndarray:
+        return _idf(len(self.ids), self.df)
+
+
+class IndiceVideos:
+    def __init__(self, directorio: Path = VIDEO_INDEX_DIR, dim: int = VIDEO_VECTOR_DIM):
+        self.directorio = directorio
+        self.dim = dim
+        self._estado: Estado | None = None
+        self._version: int | None = None
+        self._lock = threading.Lock()
+        self._lock_fondo = threading.Lock()
+        self._en_fondo = False  # hay un hilo sincronizando
+        self._generacion: str | None = None  # ficheros que usa este proceso
+        self.reconstrucciones = 0
+        self.actualizaciones = 0
+
+    @property
+    def disponible(self) -> bool:
+        return self._estado is not None
+
+    # ============== Disco ==============
+
+    @property
+    def _ruta_meta(self) -> Path:
+        return self.directorio / "meta.json"
+
+    def _rutas(self, generacion: str) -> dict[str, Path]:
+        return {n: self.directorio / f"{n}-{generacion}.npy" for n in ("matriz", "ids", "df")}
+
+    def cargar(self) -> bool:
+        """Abre el índice guardado (la matriz con memory-map); False si no existe o no es compatible"""
+        try:
+            meta = json.loads(self._ruta_meta.read_text(encoding="utf-8"))
+            if (meta["formato"], meta["dim"], tuple(meta["ngramas"])) != (FORMATO, self.dim, VIDEO_VECTOR_NGRAMAS):
+                return False
+            rutas = self._rutas(meta["generacion"])
+            estado = Estado(
+                matriz=np.load(rutas["matriz"], mmap_mode="r"),
+                ids=np.load(rutas["ids"]),
+                df=np.load(rutas["df"]),
+                huellas={int(k): v for k, v in meta["huellas"].items()},
+                cambios=meta["cambios"],
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        # Comprobación de integridad: cada fila de la matriz corresponde a su id
+        if not (
+            estado.matriz.shape == (len(estado.ids), self.dim)
+            and meta.get("ids_sha256") == _hash_ids(estado.ids)
+            and estado.huellas.keys() == set(estado.ids.tolist())
+        ):
+            return False
+        self._estado = estado
+        self._generacion = meta["generacion"]
+        return True
+
+    def _guardar(self, estado: Estado):
+        """Escritura atómica (fichero temporal + rename) y reapertura con memory-map"""
+        try:
+            self._escribir(estado)
+        except OSError:
+            # Sin disco escribible el índice sigue funcionando, solo que en memoria
+            logger.exception("No se pudo guardar el índice de videos en %s", self.directorio)
+            self._estado = estado
+
+    def _escribir(self, estado: Estado):
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        # Nombres nuevos en cada escritura: nada de lo que otro lector tenga abierto se toca
+        generacion = f"{os.getpid()}-{secrets.token_hex(6)}"
+        rutas = self._rutas(generacion)
+        for nombre in ("matriz", "ids", "df"):
+            with open(rutas[nombre], "wb") as f:
+                np.save(f, np.ascontiguousarray(getattr(estado, nombre)))
+        meta = {
+            "formato": FORMATO,
+            "dim": self.dim,
+            "ngramas": VIDEO_VECTOR_NGRAMAS,
+            "generacion": generacion,
+            "ids_sha256": _hash_ids(estado.ids),
+            "huellas": estado.huellas,
+            "cambios": estado.cambios,
+        }
+        # Publicar la generación es un único rename de meta.json
+        tmp = self._ruta_meta.with_name(f"meta.json.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self._ruta_meta)
+
+        anterior, self._generacion = self._generacion, generacion
+        self._estado = Estado(
+            np.load(rutas["matriz"], mmap_mode="r"), estado.ids, estado.df, estado.huellas, estado.cambios,
+        )
+        if anterior and anterior != generacion:
+            self._borrar_generacion(anterior)
+
+    def _borrar_generacion(self, generacion: str):
+        """Borra los ficheros de una generación que ya no se usa (si se puede)"""
+        for ruta in self._rutas(generacion).values():
+            try:
+                ruta.unlink(missing_ok=True)
+            except OSError:
+                # En Windows no se puede borrar mientras otro lector la tenga mapeada
+                logger.debug("No se pudo borrar %s", ruta)
+
+    # ============== Construcción ==============
+
+    def _reconstruir(self, filas) -> Estado:
+        ids = np.array([f.id for f in filas], dtype=np.int64)
+        tf = np.zeros((len(filas), self.dim), dtype=np.float32)
+        for i, f in enumerate(filas):
+            tf[i] = vector_tf(_campos(f.titulo, f.descripcion, f.tags), self.dim)
+        df = np.count_nonzero(tf, axis=0).astype(np.int64)
+        matriz = _normalizar_filas(tf * _idf(len(ids), df)) if len(filas) else tf
+        huellas = {f.id: _huella(f.titulo, f.descripcion, f.tags) for f in filas}
+        self.reconstrucciones += 1
+        return Estado(matriz, ids, df, huellas, 0)
+
+    def _actualizar(self, estado: Estado, cambiados: list, borrados: set[int]) -> Estado:
+        """Recalcula solo las filas de los videos nuevos o modificados y quita los borrados"""
+        df = estado.df.copy()
+        # Las filas viejas dejan de contar en df (mismas dimensiones no nulas que su TF)
+        quitar = borrados | {f.id for f in cambiados if f.id in estado.huellas}
+        conservar = ~np.isin(estado.ids, list(quitar))
+        for fila in np.asarray(estado.matriz)[~conservar]:
+            df -= fila != 0
+
+        tf = np.zeros((len(cambiados), self.dim), dtype=np.float32)
+        for i, f in enumerate(cambiados):
+            tf[i] = vector_tf(_campos(f.titulo, f.descripcion, f.tags), self.dim)
+        df += np.count_nonzero(tf, axis=0)
+
+        ids = np.concatenate([estado.ids[conservar], np.array([f.id for f in cambiados], dtype=np.int64)])
+        huellas = {i: h for i, h in estado.huellas.items() if i not in borrados}
+        huellas.update({f.id: _huella(f.titulo, f.descripcion, f.tags) for f in cambiados})
+        nuevas = _normalizar_filas(tf * _idf(len(ids), df)) if len(cambiados) else tf
+        matriz = np.concatenate([np.asarray(estado.matriz)[conservar], nuevas])
+        self.actualizaciones += 1
+        return Estado(matriz, ids, df, huellas, estado.cambios + len(cambiados) + len(borrados))
+
+    def sincronizar(self, db: Session):
+        """Pone el índice al día con la tabla videos (incremental si se puede)"""
+        with self._lock:
+            version = catalogo.version(db)
+            if self._estado is None:
+                self.cargar()
+
+            filas = db.execute(select(Video.id, Video.titulo, Video.descripcion, Video.tags)).all()
+            estado = self._estado
+            if estado is None:
+                self._guardar(self._reconstruir(filas))
+            else:
+                actuales = {f.id for f in filas}
+                cambiados = [f for f in filas if estado.huellas.get(f.id) != _huella(f.titulo, f.descripcion, f.tags)]
+                borrados = estado.huellas.keys() - actuales
+                pendientes = estado.cambios + len(cambiados) + len(borrados)
+                if pendientes > max(10, VIDEO_INDEX_REBUILD_RATIO * len(filas)):
+                    self._guardar(self._reconstruir(filas))
+                elif cambiados or borrados:
+                    self._guardar(self._actualizar(estado, cambiados, borrados))
+            self._version = version
+
+    def asegurar_al_dia(self, db: Session):
+        """Si el catálogo ha cambiado, sincroniza en segundo plano (no bloquea la búsqueda)"""
+        if catalogo.version(db) == self._version:
+            return
+        with self._lock_fondo:
+            if self._en_fondo:
+                return
+            self._en_fondo = True
+        threading.Thread(target=self._sincronizar_en_hilo, name="indice-videos", daemon=True).start()
+
+    def _sincronizar_en_hilo(self):
+        db = SessionLectura()
+        try:
+            self.sincronizar(db)
+        except Exception:
+            logger.exception("No se pudo sincronizar el índice de videos")
+        finally:
+            db.close()
+            with self._lock_fondo:
+                self._en_fondo = False
+
+    # ============== Búsqueda ==============
+
+    def _consulta(self, estado: Estado, texto: str) -> np.ndarray | None:
+        q = vector_tf([(texto, 1)], self.dim) * estado.idf
+        norma = np.linalg.norm(q)
+        return q / norma if norma else None
+
+    def buscar(self, texto: str, k: int = 5) -> list[tuple[int, float]]:
+        """Los k videos más parecidos a `texto` (id, coseno), de mayor a menor"""
+        estado = self._estado
+        if estado is None or not len(estado.ids):
+            return []
+        q = self._consulta(estado, texto)
+        if q is None:
+            return []
+        puntuaciones = estado.matriz @ q
+        k = min(k, len(puntuaciones))
+        mejores = np.argpartition(-puntuaciones, k - 1)[:k]
+        mejores = mejores[np.argsort(-puntuaciones[mejores])]
+        return [
+            (int(estado.ids[i]), float(puntuaciones[i]))
+            for i in mejores if puntuaciones[i] >= VIDEO_VECTOR_MIN_SCORE
+        ]
+
+    def similitudes(self, texto: str, ids: list[int]) -> dict[int, float]:
+        """Coseno entre `texto` y cada uno de los videos indicados"""
+        estado = self._estado
+        if estado is None:
+            return {}
+        q = self._consulta(estado, texto)
+        posiciones = np.flatnonzero(np.isin(estado.ids, ids))
+        if q is None or not len(posiciones):
+            return {}
+        puntuaciones = estado.matriz[posiciones] @ q
+        return {int(estado.ids[p]): float(s) for p, s in zip(posiciones, puntuaciones)}
+
+    def resumen(self) -> dict:
+        estado = self._estado
+        return {
+            "disponible": estado is not None,
+            "videos": len(estado.ids) if estado else 0,
+            "dimensiones": self.dim,
+            "ngramas": list(VIDEO_VECTOR_NGRAMAS),
+            "bytes_matriz": int(estado.matriz.nbytes) if estado else 0,
+            "cambios_desde_reconstruccion": estado.cambios if estado else 0,
+            "reconstrucciones": self.reconstrucciones,
+            "actualizaciones": self.actualizaciones,
+        }
+
+
+indice_videos = IndiceVideos()